@@ -1,4 +1,4 @@
-import argparse, shutil, sys, tempfile
+import argparse, os, shutil, sys, tempfile
 from pathlib import Path
 from jupyter_client.kernelspec import install_kernel_spec
 
@@ -29,13 +29,35 @@ def _install_kernelspec(argv):
     print("Mojo kernel installed. Run `jupyter kernelspec list` to verify.")
 
 
+def _run_zygote(argv):
+    from .engines.server_engine import _find_modular_root, _find_server_binary, _server_env, _zygote_socket
+    parser = argparse.ArgumentParser(prog="mojokernel zygote", description="Serve pre-initialized mojo-repl-server children to kernels on this host")
+    parser.add_argument("--socket", default=_zygote_socket(), help="Unix socket path (kernels use $MOJO_REPL_ZYGOTE or this default)")
+    args = parser.parse_args(argv)
+    server_bin = _find_server_binary()
+    if not server_bin: sys.exit("mojo-repl-server not found. Run tools/build_server.sh first.")
+    root = _find_modular_root()
+    Path(args.socket).parent.mkdir(parents=True, exist_ok=True)
+    os.execve(server_bin, [server_bin, "--zygote", args.socket, root], _server_env(root))
+
+
+def _run_batch(argv):
+    from .batch import main
+    main(argv)
+
+
+def _run_bench(argv):
+    from .bench import main
+    main(argv)
+
+
 def main():
     argv = sys.argv[1:]
     if argv and argv[0] in ('--version', '-V'):
         from . import __version__
         print(f'mojokernel {__version__}')
         return
-    commands = {"install": _install_kernelspec, "run": _run_kernel}
+    commands = {"install": _install_kernelspec, "run": _run_kernel, "zygote": _run_zygote, "batch": _run_batch, "bench": _run_bench}
     if argv and argv[0] in commands: commands[argv[0]](argv[1:])
     else: _run_kernel(argv)
 
@@ -0,0 +1,44 @@
+"""Headless "run all": execute a notebook's code cells in one `execute_many` batch, without a Jupyter kernel."""
+import argparse, json, sys
+from pathlib import Path
+from .engines import make_engine
+from .spill import spill_notice
+
+
+def code_cells(nb):
+    "Sources of the code cells of notebook dict `nb`, in order."
+    return [''.join(c['source']) if isinstance(c['source'], list) else c['source'] for c in nb.get('cells', []) if c.get('cell_type') == 'code']
+
+
+def run_notebook(nb, engine, stop_on_error=True, echo=True):
+    "Run `nb`'s code cells on `engine`, filling in their outputs. Returns the `ExecutionResult`s."
+    cells = [c for c in nb.get('cells', []) if c.get('cell_type') == 'code']
+    outputs = [[] for _ in cells]
+    def on_output(i, name, text):
+        out = outputs[i]
+        if out and out[-1]['name'] == name: out[-1]['text'] += text
+        else: out.append(dict(output_type='stream', name=name, text=text))
+        if echo: (sys.stdout if name == 'stdout' else sys.stderr).write(text)
+    results = engine.execute_many(code_cells(nb), stop_on_error=stop_on_error, on_output=on_output)
+    for n,(cell,out,r) in enumerate(zip(cells, outputs, results), 1):
+        if r.spill: on_output(n-1, 'stdout', spill_notice(r.spill))
+        if not r.success:
+            out.append(dict(output_type='error', ename=r.ename, evalue=r.evalue, traceback=r.traceback))
+            if echo: print(f'Cell {n} failed: {r.ename}: {r.evalue}', file=sys.stderr)
+        cell['outputs'],cell['execution_count'] = out,n
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="mojokernel batch", description="Run all code cells of a notebook headlessly")
+    parser.add_argument("notebook", help="Notebook (.ipynb) to run")
+    parser.add_argument("-o", "--output", help="Write the notebook with outputs here")
+    parser.add_argument("--keep-going", action="store_true", help="Run the remaining cells after an error")
+    args = parser.parse_args(argv)
+    nb = json.loads(Path(args.notebook).read_text())
+    engine = make_engine()
+    engine.start()
+    try: results = run_notebook(nb, engine, stop_on_error=not args.keep_going)
+    finally: engine.shutdown()
+    if args.output: Path(args.output).write_text(json.dumps(nb, indent=1, ensure_ascii=False) + '\n')
+    sys.exit(0 if all(r.success for r in results) else 1)
@@ -0,0 +1,128 @@
+"""`mojokernel bench startup`: per-phase kernel startup timings over fresh processes, as diffable JSON.
+Each run is a new Python process, so import and version detection are measured cold."""
+import argparse, json, math, os, platform, subprocess, sys, time
+from pathlib import Path
+
+_ENGINES = ('server', 'pexpect', 'pty')
+# Runs in the child, so `import mojokernel` (which detects the Mojo version) is timed before anything is cached.
+_CHILD = '''
+import json, sys, time
+t0 = time.perf_counter()
+import mojokernel.kernel
+import_ms = round(1000 * (time.perf_counter() - t0), 1)
+from mojokernel.bench import measure
+try: print(json.dumps(dict(measure(sys.argv[1], lsp=sys.argv[2] == '1'), import_ms=import_ms)))
+except Exception as e: print(json.dumps(dict(error=f"{type(e).__name__}: {e}")))
+'''
+
+
+def _ms(t0): return round(1000 * (time.perf_counter() - t0), 1)
+
+
+def _find_pty_binary():
+    from .engines.server_engine import _find_server_binary
+    cands = [Path(__file__).resolve().parents[1] / 'build' / 'mojo-repl-server-pty']
+    if p := _find_server_binary(): cands.insert(0, Path(p).with_name('mojo-repl-server-pty'))
+    return next((str(p) for p in cands if p.exists()), None)
+
+
+def _server_phases(e, start_ms):
+    "Server-reported phases, plus the rest of `start()` (exec, dynamic linking, handshake) as handshake_ms."
+    res = {f'server_{k}': v for k,v in e.startup.items()}
+    res['handshake_ms'] = round(start_ms - sum(e.startup.values()), 1)
+    return res
+
+
+def measure(engine, lsp=True):
+    "Time one cold start of `engine` ('server', 'pexpect' or 'pty') and optionally the LSP client, in ms per phase."
+    from . import _version
+    from .engines.server_engine import ServerEngine, _find_modular_root, _find_server_binary, _server_env
+    res = {}
+    t = time.perf_counter()
+    _version._get()
+    res['version_ms'] = _ms(t)
+    t = time.perf_counter()
+    server_bin,root = _find_server_binary(),None if engine == 'pexpect' else _find_modular_root()
+    res['discovery_ms'] = _ms(t)
+
+    if engine == 'pexpect':
+        from .engines.pexpect_engine import PexpectEngine
+        e = PexpectEngine()
+        t = time.perf_counter()
+        e.start()
+        res['start_ms'] = _ms(t)
+    else:
+        cmd = [server_bin] if engine == 'server' else [_find_pty_binary()]
+        if not cmd[0]: raise FileNotFoundError(f'{engine} server binary not found. Run tools/build_server.sh first.')
+        e = ServerEngine()
+        t = time.perf_counter()
+        e._launch(cmd + [root], _server_env(root))
+        res['start_ms'] = _ms(t)
+        res.update(_server_phases(e, res['start_ms']))
+    try:
+        t = time.perf_counter()
+        e.execute('print(1)')
+        res['first_execute_ms'] = _ms(t)
+    finally: e.shutdown()
+
+    if lsp:
+        from .lsp_client import MojoLSPClient
+        c = MojoLSPClient(request_timeout=60)
+        t = time.perf_counter()
+        c.start()
+        res['lsp_start_ms'] = _ms(t)
+        res.update({f'lsp_{k}': v for k,v in c.startup.items()})
+        try:
+            t = time.perf_counter()
+            c.complete('pri', 3, timeout=60)
+            res['lsp_first_completion_ms'] = _ms(t)
+        finally: c.shutdown()
+    return res
+
+
+def percentiles(xs):
+    "min/p50/p90/p99/max/mean of `xs` (nearest rank)."
+    xs = sorted(xs)
+    pick = lambda q: xs[max(0, math.ceil(q * len(xs)) - 1)]
+    return dict(n=len(xs), min=xs[0], p50=pick(0.5), p90=pick(0.9), p99=pick(0.99), max=xs[-1], mean=round(sum(xs) / len(xs), 1))
+
+
+def summarize(runs):
+    "Per-phase percentiles over the successful runs, plus the errors of failed runs."
+    ok = [r for r in runs if 'error' not in r]
+    phases = sorted({k for r in ok for k in r})
+    res = dict(runs=len(runs), phases={k: percentiles([r[k] for r in ok if k in r]) for k in phases})
+    if errors := [r['error'] for r in runs if 'error' in r]: res['errors'] = errors
+    return res
+
+
+def _run_child(engine, lsp):
+    # Cold starts only: a zygote or warm pool would hide the phases being measured.
+    env = dict(os.environ, MOJO_REPL_ZYGOTE='off', MOJO_KERNEL_POOL_SIZE='0')
+    out = subprocess.run([sys.executable, '-c', _CHILD, engine, '1' if lsp else '0'], capture_output=True, text=True, env=env)
+    lines = out.stdout.strip().splitlines()
+    try: return json.loads(lines[-1])
+    except (IndexError, ValueError): return dict(error=f'exit {out.returncode}: {out.stderr.strip()[-500:]}')
+
+
+def bench_startup(engines=_ENGINES, runs=5, lsp=True):
+    from . import __version__
+    res = dict(mojokernel=__version__, python=platform.python_version(), platform=platform.platform(), engines={})
+    for i,engine in enumerate(engines):
+        # The LSP client doesn't depend on the engine, so it is measured with the first one only.
+        res['engines'][engine] = summarize([_run_child(engine, lsp and i == 0) for _ in range(runs)])
+    return res
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="mojokernel bench", description="Kernel benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p = sub.add_parser("startup", help="Per-phase startup timings with percentiles over N cold starts")
+    p.add_argument("-n", "--runs", type=int, default=5, help="Cold starts per engine")
+    p.add_argument("--engines", nargs="+", choices=_ENGINES, default=list(_ENGINES))
+    p.add_argument("--no-lsp", action="store_true", help="Skip the LSP initialize and first completion phases")
+    p.add_argument("-o", "--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    out = json.dumps(bench_startup(args.engines, args.runs, lsp=not args.no_lsp), indent=2)
+    if args.output: Path(args.output).write_text(out + '\n')
+    else: print(out)
@@ -0,0 +1,93 @@
+"""Moving arrays between the kernel process and the session: the server copies inferior memory to and from shared
+memory that the kernel maps, so nothing goes through print, stdout, JSON or generated literals."""
+import re
+from multiprocessing import shared_memory
+
+_NAME_RE = re.compile(r'^[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*$')
+# Element type spellings as LLDB reports them for Mojo (Float64, SIMD[float32, 1], DType.int8) or MLIR (f32, si64, ui8).
+_DTYPE_RE = re.compile(r'\b(?:DType\.)?(b?float|u?int|f|si|ui|i)(8|16|32|64)\b|\b(UInt|Int|Bool|bool)\b', re.I)
+_KINDS = dict(float='f', bfloat=None, f='f', int='i', si='i', i='i', uint='u', ui='u')
+
+
+def numpy_dtype(type_name):
+    "NumPy dtype string for the element type in a Mojo type name, or None if there isn't a supported one."
+    m = _DTYPE_RE.search(type_name or '')
+    if not m: return None
+    if m.group(3): return dict(uint='<u8', int='<i8', bool='|b1')[m.group(3).lower()]
+    kind,bits = _KINDS[m.group(1).lower()],int(m.group(2))
+    if not kind or (kind == 'f' and bits == 8): return None
+    return f'{"|" if bits == 8 else "<"}{kind}{bits // 8}'
+
+
+_MOJO_TYPES = {'f8': 'Float64', 'f4': 'Float32', 'f2': 'Float16', 'b1': 'Bool',
+               **{f'i{n}': f'Int{n*8}' for n in (1, 2, 4, 8)}, **{f'u{n}': f'UInt{n*8}' for n in (1, 2, 4, 8)}}
+# Mojo code binding a pushed buffer. Kept here since the pointer and Span constructors move between Mojo releases.
+SPAN_BINDING = 'var {name} = Span[{type}, MutAnyOrigin](ptr=UnsafePointer[{type}, MutAnyOrigin](unsafe_from_address={address}), length={length})'
+POINTER_BINDING = 'var {name} = UnsafePointer[{type}, MutAnyOrigin](unsafe_from_address={address})\nvar {name}_len = {length}'
+
+
+def mojo_type(dtype):
+    "Mojo scalar type for a NumPy dtype, or None."
+    return _MOJO_TYPES.get(f'{dtype.kind}{dtype.itemsize}')
+
+
+def buffer_exprs(name, length=None):
+    """Pointer and length expressions for session variable `name`: a collection with `unsafe_ptr()` and `len()`,
+    or, when `length` is given, a pointer to that many elements."""
+    if not _NAME_RE.match(name): raise ValueError(f'not a variable name: {name!r}')
+    if length is None: return f'{name}.unsafe_ptr()',f'len({name})'
+    return name,str(length)
+
+
+class PulledArray:
+    "A NumPy view of shared memory filled from the session; `close()` releases the mapping."
+    def __init__(self, info, dtype, shm=None):
+        import numpy as np
+        self.info,self.shm = info,shm
+        n = info['length']
+        self.array = np.ndarray(n, dtype=dtype, buffer=shm.buf) if shm else np.empty(0, dtype=dtype)
+
+    def close(self):
+        self.array = None
+        if self.shm:
+            try: self.shm.close()
+            except BufferError: pass  # a view is still referenced; the mapping goes when it does
+            self.shm = None
+
+
+def pull(engine, name, length=None, dtype=None):
+    "Map session buffer `name` into this process as a `PulledArray`."
+    import numpy as np
+    info = engine.buffer_info(*buffer_exprs(name, length))
+    dtype = dtype or numpy_dtype(info.get('pointee')) or numpy_dtype(info.get('type'))
+    if not dtype: raise ValueError(f"cannot map element type of {name} ({info.get('type')}); pass --dtype")
+    size = info['length'] * np.dtype(dtype).itemsize
+    if not size: return PulledArray(info, dtype)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    try: engine.read_memory(info['address'], size, '/' + shm.name)
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    # The mapping stays valid after unlinking, and nothing is left behind if the kernel dies.
+    shm.unlink()
+    return PulledArray(info, dtype, shm)
+
+
+def push(engine, name, array, pointer=False):
+    """Copy `array` (flattened) into a fresh allocation in the session and return the Mojo code binding it to `name`:
+    a `Span`, or with `pointer` an `UnsafePointer` plus `name_len`. The allocation lives until the session restarts."""
+    import numpy as np
+    if not _NAME_RE.match(name) or '.' in name: raise ValueError(f'not a variable name: {name!r}')
+    array = np.asarray(array)
+    type = mojo_type(array.dtype)
+    if not type: raise ValueError(f'no Mojo type for dtype {array.dtype}')
+    size = array.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        address = engine.write_memory(size, '/' + shm.name)['address']
+    finally:
+        shm.close()
+        shm.unlink()
+    return (POINTER_BINDING if pointer else SPAN_BINDING).format(name=name, type=type, address=address, length=array.size)
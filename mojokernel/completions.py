@@ -0,0 +1,101 @@
+"""Ranked matching of completion candidates, and caching of LSP completion results between keystrokes."""
+import re
+from collections import OrderedDict
+
+_WORD_RE = re.compile(r'[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])')
+
+
+def initials(name):
+    "First letters of the snake_case/camelCase words of `name`, lowercased: 'gv' for get_value and getValue."
+    return ''.join(w[0] for w in _WORD_RE.findall(name)).lower()
+
+
+def _is_subsequence(p, s):
+    it = iter(s)
+    return all(c in it for c in p)
+
+
+def _tier(name, low, ini, prefix, lp):
+    "Rank of `name` (lowercased `low`, initials `ini`) for `prefix` (lowercased `lp`): 0-3 as in `MatchIndex`, None if no match."
+    if name.startswith(prefix): return 0
+    if low.startswith(lp): return 1
+    if len(prefix) > 1:
+        if ini.startswith(lp): return 2
+        if low[:1] == lp[0] and _is_subsequence(lp, low): return 3
+    return None
+
+
+def rank(names, prefix, limit=None):
+    "The `names` matching `prefix`, best tier first and sorted within a tier: for small sets not worth an index."
+    if not prefix: return sorted(names)[:limit]
+    lp = prefix.lower()
+    ranked = sorted((t,n) for n in names if (t := _tier(n, n.lower(), initials(n), prefix, lp)) is not None)
+    return [n for _,n in ranked][:limit]
+
+
+class MatchIndex:
+    """`names` prepared once for ranked matching against what has been typed. Tiers, best first: prefix, prefix
+    ignoring case, snake_case/camelCase initials, and subsequence starting at the same letter; the last two need two
+    or more characters. Names keep their order within a tier, and duplicates after the first are dropped."""
+    def __init__(self, names):
+        self.names = list(dict.fromkeys(names))
+        self.lower = [o.lower() for o in self.names]
+        self.initials = [initials(o) for o in self.names]
+
+    def match(self, prefix='', limit=None):
+        "Indices into `names` of the matches for `prefix`, best first, at most `limit`."
+        if not prefix: return list(range(len(self.names)))[:limit]
+        lp = prefix.lower()
+        tiers = [], [], [], []
+        for i,(name,low,ini) in enumerate(zip(self.names, self.lower, self.initials)):
+            t = _tier(name, low, ini, prefix, lp)
+            if t is None: continue
+            tiers[t].append(i)
+            if t == 0 and len(tiers[0]) == limit: break
+        return [i for t in tiers for i in t][:limit]
+
+    def ranked(self, prefix='', limit=None): return [self.names[i] for i in self.match(prefix, limit)]
+
+
+def _is_incomplete(payload):
+    if isinstance(payload, dict): return bool(payload.get('isIncomplete'))
+    return bool(getattr(payload, 'incomplete', False))
+
+
+class CompletionCache:
+    """LRU of LSP completion payloads keyed by (cell text before the identifier, member context), for one preamble
+    `version` at a time. A payload fetched for prefix `p` also answers any longer prefix that starts with `p`: the
+    caller filters it locally. Lists the server marked `isIncomplete` aren't kept. `stats()` gives hit rate and
+    mean latency of hits and misses, as recorded by `note`."""
+    def __init__(self, size=64):
+        self.size,self.version,self.entries = size,None,OrderedDict()
+        self.hits,self.misses,self.hit_s,self.miss_s = 0,0,0.0,0.0
+
+    def _check(self, version):
+        if version != self.version: self.entries,self.version = OrderedDict(),version
+
+    def get(self, version, key, prefix):
+        self._check(version)
+        o = self.entries.get(key)
+        if o is None or not prefix.startswith(o[0]): return None
+        self.entries.move_to_end(key)
+        return o[1]
+
+    def put(self, version, key, prefix, payload):
+        self._check(version)
+        if _is_incomplete(payload): return
+        self.entries[key] = (prefix, payload)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size: self.entries.popitem(last=False)
+
+    def clear(self): self.entries = OrderedDict()
+
+    def note(self, hit, seconds):
+        if hit: self.hits,self.hit_s = self.hits+1,self.hit_s+seconds
+        else: self.misses,self.miss_s = self.misses+1,self.miss_s+seconds
+
+    def stats(self):
+        n = self.hits + self.misses
+        ms = lambda s, k: round(1000 * s / k, 2) if k else None
+        return dict(hits=self.hits, misses=self.misses, hit_rate=round(self.hits / n, 3) if n else None,
+                    hit_ms=ms(self.hit_s, self.hits), miss_ms=ms(self.miss_s, self.misses), entries=len(self.entries))
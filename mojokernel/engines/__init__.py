@@ -0,0 +1,11 @@
+import os
+
+
+def make_engine(logger=None):
+    "The engine selected by `MOJO_KERNEL_ENGINE`: the C++ server when its binary exists, else pexpect. Not started."
+    if os.environ.get('MOJO_KERNEL_ENGINE') != 'pexpect':
+        from .server_engine import ServerEngine, _find_server_binary
+        from .pool import pool_from_env
+        if _find_server_binary(): return ServerEngine(pool=pool_from_env(ServerEngine, logger=logger))
+    from .pexpect_engine import PexpectEngine
+    return PexpectEngine()
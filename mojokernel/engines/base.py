@@ -1,3 +1,4 @@
+import asyncio, threading
 from dataclasses import dataclass, field
 
 @dataclass
@@ -8,3 +9,36 @@ class ExecutionResult:
     ename: str = ''
     evalue: str = ''
     traceback: list[str] = field(default_factory=list)
+    timing: dict = field(default_factory=dict)
+    spill: dict = field(default_factory=dict)  # path/bytes/shown/tail when output went past the budget
+
+
+class Engine:
+    "Subclasses implement blocking `execute(code, on_output=None)`; `execute_async` runs it off the event loop."
+    def execute_many(self, cells, stop_on_error=True, on_output=None):
+        "Run `cells` in order; `on_output(index, name, text)` gets each cell's output. Engines may batch this."
+        results = []
+        for i,code in enumerate(cells):
+            r = self.execute(code, on_output=(lambda name, text, i=i: on_output(i, name, text)) if on_output else None)
+            results.append(r)
+            if stop_on_error and not r.success: break
+        return results
+
+    async def execute_async(self, code, on_output=None):
+        # Engine I/O stays blocking on a worker thread. Output chunks are queued and handed to `on_output` on the
+        # loop, with one wakeup per backlog rather than per chunk (a tight print loop makes millions). The last
+        # wakeup is queued before the result, since both go through the loop's FIFO callback queue.
+        if not on_output: return await asyncio.to_thread(self.execute, code)
+        loop = asyncio.get_running_loop()
+        pending,lock = [],threading.Lock()
+        def deliver():
+            with lock:
+                items = pending[:]
+                pending.clear()
+            for name,text in items: on_output(name, text)
+        def cb(name, text):
+            with lock:
+                pending.append((name, text))
+                if len(pending) > 1: return
+            loop.call_soon_threadsafe(deliver)
+        return await asyncio.to_thread(self.execute, code, on_output=cb)
@@ -1,6 +1,6 @@
-import re,os
+import re,os,time,uuid
 import pexpect
-from .base import ExecutionResult
+from .base import Engine, ExecutionResult
 
 _ANSI_RE = re.compile(r'\x1b\[[0-9;]*[A-Za-z]|\x1b\[\?[0-9;]*[A-Za-z]')
 _PROMPT_PAT = re.compile(r'\n\s*\d+>\s')
@@ -16,8 +16,17 @@ _REPL_SETTINGS = [
     '-O', 'settings set auto-indent false',
 ]
 
+# Sent as its own REPL entry after each cell. The split literal keeps the REPL's echo of this line from
+# matching the marker, so the marker only shows up once the line has run, i.e. after the cell finished.
+_SENTINEL = 'print("__MK_" + "DONE_{}__")'
+
 def _strip_ansi(s): return _ANSI_RE.sub('', s)
 
+def _env_seconds(name):
+    "Seconds from env var `name`; unset, empty, 0 or 'off' mean no limit (None)."
+    v = os.environ.get(name, '').strip().lower()
+    return None if v in ('', '0', 'off', 'none') else float(v)
+
 def _find_mojo():
     import shutil
     return shutil.which('mojo')
@@ -27,34 +36,100 @@ def _is_prompt_line(line):
     if _ECHO_RE.search(line): return True
     return False
 
-def _parse_output(raw):
-    raw = raw.replace('\r', '')
-    lines = raw.split('\n')
-    output, errors = [], []
-    in_error = False
-    for line in lines:
-        if not line.strip(): continue
-        stripped = re.sub(r'^\s*\d+[>.]\s*', '', line) if _PROMPT_LINE_RE.match(line) else line
-        if _ERROR_RE.search(stripped): in_error = True
-        if in_error:
+_PROMPT_START_RE = re.compile(r'\s*\d+>\s')
+_PROMPT_PREFIX_RE = re.compile(r'^\s*\d+[>.]\s*')
+_ESC_PARTIAL_RE = re.compile(r'\x1b(\[\??[0-9;]*)?')
+_SENTINEL_ECHO = '"__MK_" + "DONE_'
+
+
+class _OutputScanner:
+    """Incremental REPL output scanner. Strips ANSI escapes (holding back one split across chunks), splits
+    complete lines and applies the `_parse_output` rules to each as it arrives, and watches for the prompt and
+    an optional end `marker`. Each character is examined a bounded number of times, however the output is chunked."""
+    def __init__(self, marker=None):
+        self.marker = marker
+        self.output,self.errors = [],[]
+        self.in_error = False
+        self.prompt_seen = False  # a prompt started a line after the first newline (what `_PROMPT_PAT` finds)
+        self.marker_seen = False
+        self.done = False         # marker printed and the prompt after it shown
+        self._esc = ''
+        self._parts = []          # the incomplete last line
+        self._head = ''           # its first 32 characters
+        self._lines = 0
+        self._taken = 0
+
+    def feed(self, chunk):
+        data = self._esc + chunk
+        self._esc = ''
+        i = data.rfind('\x1b', max(0, len(data) - 32))
+        if i >= 0 and _ESC_PARTIAL_RE.fullmatch(data, i):
+            data,self._esc = data[:i],data[i:]
+        lines = _strip_ansi(data).replace('\r', '').split('\n')
+        if len(lines) > 1:
+            lines[0] = ''.join(self._parts) + lines[0]
+            self._parts,self._head = [],''
+            for line in lines[:-1]: self._line(line)
+        if lines[-1]:
+            self._parts.append(lines[-1])
+            if len(self._head) < 32: self._head = (self._head + lines[-1])[:32]
+        # A prompt waiting for input has no newline yet, so check the start of the partial line too.
+        if self._lines and _PROMPT_START_RE.match(self._head): self._prompt()
+        return self
+
+    def _prompt(self):
+        self.prompt_seen = True
+        if self.marker_seen: self.done = True
+
+    def _line(self, line):
+        if self._lines and _PROMPT_START_RE.match(line): self._prompt()
+        self._lines += 1
+        if _SENTINEL_ECHO in line: return
+        if self.marker and self.marker in line:
+            self.marker_seen = True
+            line = line[:line.index(self.marker)]
+        if not line.strip(): return
+        stripped = _PROMPT_PREFIX_RE.sub('', line) if _PROMPT_LINE_RE.match(line) else line
+        if _ERROR_RE.search(stripped): self.in_error = True
+        if self.in_error:
             s = stripped.strip()
-            if s and s != '(null)': errors.append(s)
-            continue
-        if _is_prompt_line(line): continue
-        output.append(line)
-    stdout = '\n'.join(output) + '\n' if output else ''
-    if errors:
-        evalue = errors[0]
-        if evalue.startswith('[User] '): evalue = evalue[7:]
-        return ExecutionResult(stdout=stdout, success=False,
-            ename='MojoError', evalue=evalue, traceback=errors)
-    return ExecutionResult(stdout=stdout)
-
-
-class PexpectEngine:
-    def __init__(self):
+            if s and s != '(null)': self.errors.append(s)
+            return
+        if _is_prompt_line(line): return
+        self.output.append(line)
+
+    def take_stdout(self):
+        "Output lines parsed since the last call (for streaming)."
+        new = self.output[self._taken:]
+        self._taken = len(self.output)
+        return '\n'.join(new) + '\n' if new else ''
+
+    def result(self):
+        "Finish the partial last line and return the `ExecutionResult`; stdout excludes what `take_stdout` returned."
+        if self._parts:
+            self._line(''.join(self._parts))
+            self._parts = []
+        stdout = self.take_stdout()
+        if self.errors:
+            evalue = self.errors[0]
+            if evalue.startswith('[User] '): evalue = evalue[7:]
+            return ExecutionResult(stdout=stdout, success=False,
+                ename='MojoError', evalue=evalue, traceback=self.errors)
+        return ExecutionResult(stdout=stdout)
+
+
+def _parse_output(raw): return _OutputScanner().feed(raw).result()
+
+
+class PexpectEngine(Engine):
+    def __init__(self, sentinel=None, timeout=None, idle_timeout=None):
         self.child = None
         self._warmed = False
+        if sentinel is None: sentinel = os.environ.get('MOJO_PEXPECT_SENTINEL', '1').lower() not in ('0', 'false', 'no', 'off')
+        self.sentinel = sentinel
+        # Per-cell limits in seconds (None = unlimited): total run time, and time without any REPL output.
+        self.timeout = _env_seconds('MOJO_PEXPECT_TIMEOUT') if timeout is None else timeout
+        self.idle_timeout = _env_seconds('MOJO_PEXPECT_IDLE_TIMEOUT') if idle_timeout is None else idle_timeout
 
     def start(self):
         mojo = _find_mojo()
@@ -72,44 +147,75 @@ class PexpectEngine:
             while True: self.child.read_nonblocking(100000, timeout=timeout)
         except (pexpect.TIMEOUT, pexpect.EOF): pass
 
-    def _read_until_prompt(self, timeout):
-        import time
-        buf = ''
-        deadline = time.time() + timeout
+    def _read(self, sc, on_output=None, timeout=None, idle_timeout=None):
+        """Feed REPL output to `sc`, forwarding parsed stdout lines to `on_output` as they complete, until the
+        sentinel marker and prompt arrive (or, without the sentinel, 0.3s after a prompt).
+        Returns None when done, else which limit ('timeout' or 'idle') ran out first."""
+        start = last = time.time()
         prompt_time = 0
-        while time.time() < deadline:
-            try:
-                chunk = self.child.read_nonblocking(100000, timeout=1)
-                buf += chunk
-                if not prompt_time and _PROMPT_PAT.search(_strip_ansi(buf)):
-                    prompt_time = time.time()
+        while True:
+            now = time.time()
+            if timeout and now - start > timeout: return 'timeout'
+            if idle_timeout and now - last > idle_timeout: return 'idle'
+            try: chunk = self.child.read_nonblocking(100000, timeout=0.05)
             except pexpect.TIMEOUT:
-                if prompt_time and time.time() - prompt_time > 0.3:
-                    return _strip_ansi(buf)
-            except pexpect.EOF: raise
-        if prompt_time: return _strip_ansi(buf)
-        return None
-
-    def execute(self, code):
+                if not self.sentinel and prompt_time and time.time() - prompt_time > 0.3: return None
+                continue
+            last = time.time()
+            sc.feed(chunk)
+            if on_output and (out := sc.take_stdout()): on_output('stdout', out)
+            if sc.done: return None
+            if not prompt_time and sc.prompt_seen: prompt_time = last
+
+    def _resync(self, sc, grace=10):
+        "After an interrupt, read up to the sentinel so the next cell starts in step; restarts the REPL if it never comes."
+        self.child.sendintr()
+        if self.sentinel and self._read(sc, timeout=grace) is None: return True
+        self.restart()
+        return False
+
+    def execute(self, code, on_output=None):
         if not self.child or not self.child.isalive():
             raise RuntimeError("REPL process not running")
         code = code.strip()
         if not code: return ExecutionResult()
-        self._drain(timeout=0.1)
+        # With the sentinel, reads end right after the trailing prompt, so there's nothing left to wait for.
+        self._drain(timeout=0 if self.sentinel else 0.1)
         for line in code.split('\n'):
             self.child.sendline(line)
         self.child.sendline('')
-        try: raw = self._read_until_prompt(timeout=30)
+        marker = None
+        if self.sentinel:
+            tag = uuid.uuid4().hex[:12]
+            marker = f'__MK_DONE_{tag}__'
+            self.child.sendline(_SENTINEL.format(tag))
+            self.child.sendline('')
+        sc = _OutputScanner(marker)
+        try:
+            limit = self._read(sc, on_output, self.timeout, self.idle_timeout)
+            if limit:
+                secs = self.timeout if limit == 'timeout' else self.idle_timeout
+                what = f'ran longer than {secs:g}s' if limit == 'timeout' else f'produced no output for {secs:g}s'
+                after = 'was interrupted' if self._resync(sc) else 'could not be interrupted, so the REPL was restarted'
+                res = ExecutionResult(stdout=sc.result().stdout, stderr='Expression timed out', success=False,
+                    ename='TimeoutError', evalue=f'Cell {what} and {after}',
+                    traceback=[f'Cell {what} and {after} (see %timeout)'])
+                # The kernel shows only what arrives through `on_output`, so the rest goes there, as on success.
+                if on_output:
+                    if res.stdout: on_output('stdout', res.stdout)
+                    on_output('stderr', res.stderr + '\n')
+                    res.stdout = res.stderr = ''
+                return res
         except pexpect.EOF:
             return ExecutionResult(stderr='REPL process died', success=False,
                 ename='REPLError', evalue='REPL process died',
                 traceback=['The Mojo REPL process terminated unexpectedly'])
-        if raw is None:
-            return ExecutionResult(stderr='Expression timed out', success=False,
-                ename='TimeoutError', evalue='Expression timed out',
-                traceback=['Expression evaluation timed out'])
         self._warmed = True
-        return _parse_output(raw)
+        res = sc.result()
+        if on_output and res.stdout:
+            on_output('stdout', res.stdout)
+            res.stdout = ''
+        return res
 
     def interrupt(self):
         if self.child and self.child.isalive(): self.child.sendintr()
@@ -0,0 +1,95 @@
+import os,threading,time
+
+
+class EnginePool:
+    "Keeps up to `size` started engines parked so a crashed engine's restart can adopt one instead of paying startup cost."
+    def __init__(self, factory, size=1, ttl=None, logger=None):
+        self.factory,self.size,self.ttl,self.logger = factory,size,ttl,logger
+        self._spares = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+
+    def _log(self, msg):
+        if not self.logger: return
+        try: self.logger(msg)
+        except Exception: pass
+
+    @property
+    def ready(self):
+        with self._lock: return len(self._spares)
+
+    def start(self):
+        if self._thread and self._thread.is_alive(): return
+        self._closed = False
+        self._thread = threading.Thread(target=self._fill_loop, name='mojo-engine-pool', daemon=True)
+        self._thread.start()
+
+    def take(self):
+        "Pop the oldest live spare (or None if there isn't one) and schedule a replacement."
+        while True:
+            with self._lock:
+                if not self._spares: break
+                engine,_ = self._spares.pop(0)
+            if engine.alive:
+                self._wake.set()
+                return engine
+            engine.shutdown()
+        self._wake.set()
+        return None
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._thread and self._thread is not threading.current_thread(): self._thread.join(timeout=1)
+        self._thread = None
+        with self._lock: spares,self._spares = self._spares,[]
+        for engine,_ in spares: engine.shutdown()
+
+    def _reap(self):
+        now = time.monotonic()
+        with self._lock:
+            stale = [o for o in self._spares if not o[0].alive or (self.ttl and now - o[1] > self.ttl)]
+            self._spares = [o for o in self._spares if o not in stale]
+        for engine,_ in stale: engine.shutdown()
+
+    def _next_wait(self):
+        if not self.ttl: return None
+        with self._lock:
+            if not self._spares: return self.ttl
+            oldest = min(t for _,t in self._spares)
+        return max(0.05, self.ttl - (time.monotonic() - oldest))
+
+    def _fill_loop(self):
+        failures = 0
+        while not self._closed:
+            self._reap()
+            with self._lock: missing = self.size - len(self._spares)
+            if missing <= 0:
+                self._wake.wait(self._next_wait())
+                self._wake.clear()
+                continue
+            try:
+                engine = self.factory()
+                engine.start()
+            except Exception as e:
+                failures += 1
+                self._log(f"Spare engine failed to start: {e}")
+                self._wake.wait(min(60, 2 ** failures))
+                self._wake.clear()
+                continue
+            failures = 0
+            with self._lock:
+                if not self._closed:
+                    self._spares.append((engine, time.monotonic()))
+                    engine = None
+            if engine: engine.shutdown()
+
+
+def pool_from_env(factory, logger=None):
+    "Build a pool from MOJO_KERNEL_POOL_SIZE (0 disables) and MOJO_KERNEL_POOL_TTL (seconds, unset for no expiry)."
+    size = int(os.environ.get('MOJO_KERNEL_POOL_SIZE', '0') or 0)
+    if size <= 0: return None
+    ttl = float(os.environ.get('MOJO_KERNEL_POOL_TTL', '0') or 0) or None
+    return EnginePool(factory, size=size, ttl=ttl, logger=logger)
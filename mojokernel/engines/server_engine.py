@@ -1,6 +1,7 @@
-import json,os,signal,subprocess
+import json,os,signal,socket,struct,subprocess,threading
 from pathlib import Path
-from .base import ExecutionResult
+from ..paths import user_dir
+from .base import Engine, ExecutionResult
 
 
 def _find_modular_root():
@@ -18,30 +19,181 @@ def _find_server_binary():
     return shutil.which("mojo-repl-server")
 
 
-class ServerEngine:
-    def __init__(self):
+# Framed wire format (see server/repl_server.cpp): <meta_len:u32><blob_count:u32><meta json>, then each
+# blob as <len:u64><bytes>. meta['blobs'] names the blobs, so code and output skip JSON escaping.
+_BLOB_KEYS = ('code', 'stdout', 'stderr', 'text')
+_FRAME_HEAD = struct.Struct('<II')
+_BLOB_LEN = struct.Struct('<Q')
+
+
+def _encode_frame(msg):
+    msg = dict(msg)
+    names = [k for k in _BLOB_KEYS if isinstance(msg.get(k), str)]
+    blobs = [msg.pop(k).encode('utf-8') for k in names]
+    msg['blobs'] = names
+    meta = json.dumps(msg, separators=(',', ':')).encode('utf-8')
+    parts = [_FRAME_HEAD.pack(len(meta), len(blobs)), meta]
+    for b in blobs: parts += [_BLOB_LEN.pack(len(b)), b]
+    return b''.join(parts)
+
+
+def _read_exact(stream, n):
+    b = stream.read(n) if n else b''
+    if len(b) < n: raise EOFError
+    return b
+
+
+def _read_frame(stream):
+    n,count = _FRAME_HEAD.unpack(_read_exact(stream, _FRAME_HEAD.size))
+    msg = json.loads(_read_exact(stream, n))
+    names = msg.pop('blobs', [])
+    for i in range(count):
+        b = _read_exact(stream, _BLOB_LEN.unpack(_read_exact(stream, _BLOB_LEN.size))[0])
+        if i < len(names): msg[names[i]] = b.decode('utf-8', errors='replace')
+    return msg
+
+
+def _wanted_protocol():
+    return 'json' if os.environ.get('MOJO_SERVER_PROTOCOL', 'framed').lower() == 'json' else 'framed'
+
+
+def _server_env(root):
+    lib_dir = os.path.join(root, 'lib')
+    env = dict(os.environ)
+    env.update({
+        'MODULAR_MAX_PACKAGE_ROOT': root,
+        'MODULAR_MOJO_MAX_PACKAGE_ROOT': root,
+        'MODULAR_MOJO_MAX_DRIVER_PATH': os.path.join(root, 'bin', 'mojo'),
+        'MODULAR_MOJO_MAX_IMPORT_PATH': os.path.join(root, 'lib', 'mojo'),
+        'DYLD_LIBRARY_PATH': lib_dir,
+        'LD_LIBRARY_PATH': lib_dir,
+    })
+    return env
+
+
+def _env_bytes(name, default):
+    v = os.environ.get(name, '').strip().lower()
+    if not v: return default
+    return 0 if v in ('0', 'off', 'none') else int(v)
+
+
+def _output_limit():
+    "Per-cell output budget in bytes from MOJO_KERNEL_OUTPUT_LIMIT (default 1MB; 0 or 'off' = no limit)."
+    return _env_bytes('MOJO_KERNEL_OUTPUT_LIMIT', 1 << 20)
+
+
+def _spill_limit():
+    "Bytes kept in a cell's spill file from MOJO_KERNEL_SPILL_LIMIT (default 256MB; 0 or 'off' = no cap)."
+    return _env_bytes('MOJO_KERNEL_SPILL_LIMIT', 256 << 20)
+
+
+def _spill_dir():
+    try: return str(user_dir())
+    except OSError: return ''  # the server then spills only into a directory of our own, or not at all
+
+
+def _zygote_socket():
+    p = os.environ.get('MOJO_REPL_ZYGOTE')
+    if p is None: return str(user_dir() / 'zygote.sock')
+    return None if p.lower() in ('', '0', 'false', 'no', 'off') else p
+
+
+class ServerRequestError(Exception):
+    "A non-execute server request (buffer_info, read_memory, ...) was answered with an error."
+    def __init__(self, resp):
+        super().__init__(resp.get('evalue', 'server request failed'))
+        self.ename = resp.get('ename', 'ServerError')
+
+
+def _peer_uid(sock):
+    "Uid of the process at the other end of Unix socket `sock`, or None where Python can't tell (not Linux)."
+    if not hasattr(socket, 'SO_PEERCRED'): return None
+    return struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))[1]
+
+
+class _ZygoteProc:
+    """Popen-like handle for a server child forked by `mojo-repl-server --zygote`, talking over its Unix socket.
+    The zygote must belong to this user, and the child takes on `cwd` and `env`; OSError if it serves another `root`."""
+    def __init__(self, path, root, cwd, env):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.pid = None
+        try:
+            self.sock.connect(path)
+            uid = _peer_uid(self.sock)
+            if uid is not None and uid != os.getuid(): raise OSError(f"zygote at {path} belongs to uid {uid}")
+            # The child writes its stderr to a pipe of ours, like a server we had spawned, so startup failures show.
+            r,w = os.pipe()
+            self.stderr = os.fdopen(r, 'rb')
+            try: socket.send_fds(self.sock, [b'\0'], [w])
+            finally: os.close(w)
+            self.stdin,self.stdout = self.sock.makefile('wb'),self.sock.makefile('rb')
+            self.stdin.write((json.dumps(dict(root=root, cwd=cwd, env=env)) + '\n').encode())
+            self.stdin.flush()
+            hello = json.loads(self.stdout.readline() or b'{}')
+            if hello.get('status') != 'forked': raise OSError(f"Unexpected zygote response: {hello}")
+            self.pid,self.returncode = hello['pid'],None
+            # Zygotes without the handshake don't report their root: treat them as serving another one.
+            if os.path.realpath(hello.get('root', '')) != os.path.realpath(root): raise OSError(f"zygote serves Mojo root {hello.get('root')}")
+        except Exception:
+            self.kill()
+            raise
+
+    def poll(self):
+        if self.returncode is None:
+            try: os.kill(self.pid, 0)
+            except ProcessLookupError: self.returncode = -signal.SIGKILL
+            except PermissionError: pass
+        return self.returncode
+
+    def kill(self):
+        if self.pid is not None:
+            try: os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError: pass
+        for f in (getattr(self, 'stdin', None), getattr(self, 'stdout', None), getattr(self, 'stderr', None), self.sock):
+            try: f.close()
+            except Exception: pass
+
+
+class ServerEngine(Engine):
+    def __init__(self, pool=None):
         self.proc = None
         self._next_id = 0
+        self.pool = pool
+        self.protocol = 'json'
+        self.startup = {}
+        # One request at a time on the pipe: comm handlers (the variable explorer) may ask while a cell runs.
+        self._lock = threading.Lock()
+        # Output past `output_limit` bytes per cell is spilled to a file under `spill_dir`, which keeps at most
+        # `spill_limit` bytes; `output_tail` bytes are kept for a preview.
+        self.output_limit,self.output_tail,self.spill_limit = _output_limit(),4096,_spill_limit()
+        self.spill_dir = _spill_dir()
+
+    def _output_opts(self):
+        return dict(output_limit=self.output_limit, output_tail=self.output_tail, spill_dir=self.spill_dir, spill_limit=self.spill_limit)
 
     def start(self):
-        server_bin = _find_server_binary()
-        if not server_bin:
-            raise FileNotFoundError("mojo-repl-server not found. Run tools/build_server.sh first.")
         root = _find_modular_root()
-        lib_dir = os.path.join(root, 'lib')
-        env = dict(os.environ)
-        env.update({
-            'MODULAR_MAX_PACKAGE_ROOT': root,
-            'MODULAR_MOJO_MAX_PACKAGE_ROOT': root,
-            'MODULAR_MOJO_MAX_DRIVER_PATH': os.path.join(root, 'bin', 'mojo'),
-            'MODULAR_MOJO_MAX_IMPORT_PATH': os.path.join(root, 'lib', 'mojo'),
-            'DYLD_LIBRARY_PATH': lib_dir,
-            'LD_LIBRARY_PATH': lib_dir,
-        })
-        self.proc = subprocess.Popen(
-            [server_bin, root],
+        sock = _zygote_socket()
+        if sock and os.path.exists(sock):
+            # Any mismatch (stale socket, other user, other Mojo root) falls back to a cold start.
+            try: self._attach(_ZygoteProc(sock, root, os.getcwd(), _server_env(root)))
+            except OSError: self.proc = None
+        if not self.proc:
+            server_bin = _find_server_binary()
+            if not server_bin:
+                raise FileNotFoundError("mojo-repl-server not found. Run tools/build_server.sh first.")
+            self._launch([server_bin, root], _server_env(root))
+        if self.pool: self.pool.start()
+
+    def _launch(self, cmd, env):
+        self._attach(subprocess.Popen(
+            cmd,
             stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            env=env)
+            env=env))
+
+    def _attach(self, proc):
+        self.proc = proc
+        self.protocol = 'json'
 
         # Wait for ready message
         ready = self._read_response()
@@ -49,54 +201,126 @@ class ServerEngine:
             raise RuntimeError(f"Server failed to start: {ready.get('message', 'unknown error')}")
         if ready.get('status') != 'ready':
             raise RuntimeError(f"Unexpected server response: {ready}")
+        self.startup = ready.get('startup', {})
+        proto = _wanted_protocol()
+        if proto != 'json' and proto in ready.get('protocols', []):
+            if self._send({'type': 'protocol', 'protocol': proto}).get('status') == 'ok': self.protocol = proto
+
+    def _send(self, req, on_stream=None):
+        with self._lock: return self._exchange(req, on_stream)
 
-    def _send(self, req):
+    def _exchange(self, req, on_stream):
         self._next_id += 1
         req['id'] = self._next_id
-        line = json.dumps(req, separators=(',', ':')) + '\n'
-        self.proc.stdin.write(line.encode())
-        self.proc.stdin.flush()
-        return self._read_response()
+        try:
+            if self.protocol == 'framed': self.proc.stdin.write(_encode_frame(req))
+            else: self.proc.stdin.write((json.dumps(req, separators=(',', ':')) + '\n').encode())
+            self.proc.stdin.flush()
+        # A server that died between requests shows up as a broken pipe here.
+        except OSError: self._died()
+        while True:
+            resp = self._read_response()
+            if resp.get('type') != 'stream': return resp
+            if on_stream and resp.get('text'): on_stream(resp)
 
     def _read_response(self):
-        line = self.proc.stdout.readline()
-        if not line:
-            stderr = self.proc.stderr.read().decode() if self.proc.stderr else ''
-            raise RuntimeError(f"Server process died. stderr: {stderr}")
-        return json.loads(line)
+        try:
+            if self.protocol == 'framed': return _read_frame(self.proc.stdout)
+            line = self.proc.stdout.readline()
+            if line: return json.loads(line)
+        except (EOFError, OSError): pass
+        self._died()
+
+    def _died(self):
+        try: stderr = self.proc.stderr.read().decode() if self.proc.stderr else ''
+        except OSError: stderr = ''
+        raise RuntimeError(f"Server process died. stderr: {stderr}")
 
-    def execute(self, code):
+    def execute(self, code, on_output=None):
+        # With `on_output`, chunks are forwarded as they arrive instead of being collected into the result.
         code = code.strip()
         if not code: return ExecutionResult()
 
-        resp = self._send({'type': 'execute', 'code': code})
+        chunks = dict(stdout=[], stderr=[])
+        emit = on_output or (lambda name, text: chunks.setdefault(name, []).append(text))
+        resp = self._send({'type': 'execute', 'code': code, **self._output_opts()}, on_stream=lambda m: emit(m.get('name', 'stdout'), m['text']))
+        return self._result(resp, emit, chunks)
+
+    def execute_many(self, cells, stop_on_error=True, on_output=None):
+        "Run `cells` in one `execute_batch` round trip; `on_output(index, name, text)` gets streamed output."
+        cells = [c.strip() for c in cells]
+        chunks = [dict(stdout=[], stderr=[]) for _ in cells]
+        emit = on_output or (lambda i, name, text: chunks[i].setdefault(name, []).append(text))
+        resp = self._send({'type': 'execute_batch', 'cells': cells, 'stop_on_error': stop_on_error, **self._output_opts()},
+                          on_stream=lambda m: emit(m.get('cell', 0), m.get('name', 'stdout'), m['text']))
+        # Servers that predate execute_batch reject it; run the cells one request at a time instead.
+        if 'results' not in resp: return super().execute_many(cells, stop_on_error=stop_on_error, on_output=on_output)
+        return [self._result(r, lambda name, text, i=i: emit(i, name, text), chunks[i]) for i,r in enumerate(resp['results'])]
+
+    def _request(self, type, **fields):
+        resp = self._send(dict(type=type, **fields))
+        if resp.get('status') != 'ok': raise ServerRequestError(resp)
+        return resp
+
+    def buffer_info(self, pointer, length):
+        "Evaluate `pointer` and `length` expressions in the session: {'address','length','type','pointee'}."
+        return self._request('buffer_info', pointer=pointer, length=length)
+
+    def read_memory(self, address, size, shm):
+        "Copy `size` bytes of session memory at `address` into the POSIX shared memory segment named `shm`."
+        return self._request('read_memory', address=address, size=size, shm=shm)
+
+    def write_memory(self, size, shm, address=0):
+        "Copy `size` bytes from shared memory segment `shm` into the session at `address` (0 = a new allocation)."
+        return self._request('write_memory', address=address, size=size, shm=shm)
+
+    def variables(self, names=()):
+        "Session variables (the REPL context's, plus `names`) as dicts of name/type/value/summary/expandable."
+        return self._request('variables', names=list(names))['variables']
+
+    def variable_children(self, name, path=(), offset=0, count=100):
+        "A page of children of variable `name`, reached through child indices `path`: (children, more)."
+        resp = self._request('variable_children', name=name, path=list(path), offset=offset, count=count)
+        return resp['children'],resp['more']
+
+    def _result(self, resp, emit, chunks):
+        for name in ('stdout', 'stderr'):
+            if resp.get(name): emit(name, resp[name])
+        stdout,stderr = ''.join(chunks['stdout']),''.join(chunks['stderr'])
 
         if resp.get('status') == 'error':
             return ExecutionResult(
-                stdout=resp.get('stdout', ''),
-                stderr=resp.get('stderr', ''),
+                stdout=stdout,
+                stderr=stderr,
                 success=False,
                 ename=resp.get('ename', 'MojoError'),
                 evalue=resp.get('evalue', ''),
-                traceback=resp.get('traceback', []))
+                traceback=resp.get('traceback', []),
+                timing=resp.get('timing', {}),
+                spill=resp.get('spill', {}))
 
-        return ExecutionResult(
-            stdout=resp.get('stdout', ''),
-            stderr=resp.get('stderr', ''))
+        return ExecutionResult(stdout=stdout, stderr=stderr, timing=resp.get('timing', {}), spill=resp.get('spill', {}))
 
     def interrupt(self):
         if self.proc and self.proc.poll() is None:
             os.kill(self.proc.pid, signal.SIGINT)
 
     def restart(self):
-        self.shutdown()
-        self.start()
+        self._kill()
+        spare = self.pool.take() if self.pool else None
+        if not spare: return self.start()
+        self.proc,spare.proc = spare.proc,None
+        self.protocol,self.startup,self._next_id = spare.protocol,spare.startup,0
 
-    def shutdown(self):
+    def _kill(self):
         if self.proc and self.proc.poll() is None:
             try: self.proc.kill()
             except Exception: pass
         self.proc = None
 
+    def shutdown(self):
+        self._kill()
+        if self.pool: self.pool.close()
+
     @property
     def alive(self): return self.proc is not None and self.proc.poll() is None
@@ -1,9 +1,24 @@
+import asyncio
+import contextlib
+import contextvars
+import inspect
 import os
 import re
+import signal
+import threading
 import time
 from pathlib import Path
+from ipykernel.comm import CommManager
 from ipykernel.kernelbase import Kernel
-from .lsp_client import LSPError, MojoLSPClient, completion_matches, completion_metadata, hover_text, identifier_span, signature_text
+from .engines import make_engine
+from .preamble import Preamble
+from .buffers import pull, push
+from .completions import CompletionCache, rank
+from .restore import SessionLog, replay, session_log_path
+from .spill import page_count, read_page, spill_notice
+from .streams import StreamBatcher
+from .symbols import SymbolIndex, cell_symbols
+from .lsp_client import LSPError, MojoLSPClient, completion_items, completion_matches, completion_metadata, hover_text, identifier_span, signature_text
 
 
 class MojoKernel(Kernel):
@@ -14,49 +29,109 @@ class MojoKernel(Kernel):
     language_info = dict(mimetype='text/x-mojo', name='mojo', file_extension='.mojo', pygments_lexer='python', codemirror_mode='python')
     banner = 'Mojo Jupyter Kernel'
     _builtin_signatures = {'print': 'print(value: Any)'}
+    # Shell requests that don't touch the engine, so they can be served while a cell is running.
+    _concurrent_requests = {'complete_request', 'inspect_request', 'is_complete_request', 'kernel_info_request', 'interrupt_request'}
+    # The concurrent path uses ipykernel 7 internals; elsewhere (6.x) these requests wait behind the cell as usual.
+    _can_dispatch_concurrently = ('concurrent' in inspect.signature(Kernel.dispatch_shell).parameters
+                                  and hasattr(Kernel, '_get_shell_context_var'))
+    # Requests answered only for the newest of their type: older ones still queued when a newer arrives are skipped.
+    _debounced = {'complete_request', 'inspect_request'}
+    _newest = {}
+    _debounce = float(os.environ.get('MOJO_KERNEL_LSP_DEBOUNCE', '0.02'))  # seconds to wait for a newer request
+    _completion_limit = int(os.environ.get('MOJO_KERNEL_COMPLETION_LIMIT', '100')) or None  # ranked matches returned
+    _last_timing = {}
+    _session_log = None
+    _restorable = []
+    _engine_ready = None
+    _engine_error = None
+    _closing = False
+    _spills = []
+    _max_spills = 5  # spill files kept for %page; older ones are deleted
+    pulled = {}  # name -> PulledArray from %pull, for extensions to plot or save
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        if os.environ.get('MOJO_KERNEL_ENGINE') == 'pexpect':
-            from .engines.pexpect_engine import PexpectEngine
-            self.engine = PexpectEngine()
-        else:
-            from .engines.server_engine import ServerEngine, _find_server_binary
-            if _find_server_binary(): self.engine = ServerEngine()
-            else:
-                from .engines.pexpect_engine import PexpectEngine
-                self.engine = PexpectEngine()
-        self.engine.start()
-        self._lsp_preamble = ''
+        self.preamble = Preamble()
+        self.symbols = SymbolIndex(self._builtin_signatures)
+        self._completions = CompletionCache()
+        self._newest = {}  # msg_type -> msg_id of the last one received
         self.lsp = None
-        v = os.environ.get('MOJO_KERNEL_LSP', '1').lower()
-        if v not in ('0', 'false', 'no', 'off'):
+        self.comm_manager = CommManager(parent=self, kernel=self)
+        for t in ('comm_open', 'comm_msg', 'comm_close'): self.shell_handlers[t] = getattr(self.comm_manager, t)
+        self.comm_manager.register_target('mojokernel.variables', self._open_variables_comm)
+        if os.environ.get('MOJO_KERNEL_SESSION_LOG', '1').lower() not in ('0', 'false', 'no', 'off'):
+            # The connection key survives kernel restarts, so a restarted kernel finds the previous process's log.
             try:
-                include_dirs = [o for o in os.environ.get('MOJO_LSP_INCLUDE_DIRS', '').split(os.pathsep) if o]
-                lsp_timeout = float(os.environ.get('MOJO_LSP_REQUEST_TIMEOUT', '2'))
-                lsp_shutdown = float(os.environ.get('MOJO_LSP_SHUTDOWN_TIMEOUT', '1'))
-                root_uri = Path.cwd().resolve().as_uri()
-                self.lsp = MojoLSPClient(include_dirs=include_dirs, root_uri=root_uri, request_timeout=lsp_timeout, shutdown_timeout=lsp_shutdown, logger=self.log.debug)
-                self.lsp.start()
-            except Exception as e:
-                self.log.warning(f"Mojo LSP unavailable, completions disabled: {e}")
-                self.lsp = None
-
-    def _known_symbols(self, extra=''):
-        text = self._lsp_preamble + '\n' + extra
-        syms = {k: dict(type='function', signature=v) for k,v in self._builtin_signatures.items()}
-        for m in re.finditer(r'(?m)^\s*fn\s+([A-Za-z_]\w*)\s*\(([^)]*)\)', text):
-            name,args = m.group(1),m.group(2).strip()
-            syms[name] = dict(type='function', signature=f'{name}({args})')
-        for m in re.finditer(r'(?m)^\s*struct\s+([A-Za-z_]\w*)', text): syms[m.group(1)] = dict(type='class')
-        for m in re.finditer(r'(?m)\b(?:var|let)\s+([A-Za-z_]\w*)', text): syms.setdefault(m.group(1), dict(type='instance'))
-        return syms
+                self._session_log = SessionLog(session_log_path(self.session.key))
+                self._restorable = self._session_log.take()
+            except OSError as e: self.log.warning(f'session log disabled: {e}')
+        # Start the engine and the LSP in the background, so the kernel reports ready right away. Execute
+        # requests wait for the engine; completions use the fallback until the LSP has answered `initialize`.
+        self.engine = make_engine(logger=self.log.warning)
+        self._engine_ready = threading.Event()
+        threading.Thread(target=self._start_engine, name='mojo-engine-start', daemon=True).start()
+        v = os.environ.get('MOJO_KERNEL_LSP', '1').lower()
+        if v not in ('0', 'false', 'no', 'off'): threading.Thread(target=self._start_lsp, name='mojo-lsp-start', daemon=True).start()
+
+    def _start_engine(self):
+        try:
+            self.engine.start()
+            if self._restorable and self._auto_restore(): self.log.warning(self._restore())
+        except Exception as e:
+            self.log.error(f"Mojo engine failed to start: {e}")
+            self._engine_error = e
+        finally: self._engine_ready.set()
+
+    def _start_lsp(self):
+        try:
+            include_dirs = [o for o in os.environ.get('MOJO_LSP_INCLUDE_DIRS', '').split(os.pathsep) if o]
+            lsp_timeout = float(os.environ.get('MOJO_LSP_REQUEST_TIMEOUT', '2'))
+            lsp_shutdown = float(os.environ.get('MOJO_LSP_SHUTDOWN_TIMEOUT', '1'))
+            root_uri = Path.cwd().resolve().as_uri()
+            lsp = MojoLSPClient(include_dirs=include_dirs, root_uri=root_uri, request_timeout=lsp_timeout, shutdown_timeout=lsp_shutdown, logger=self.log.debug)
+            lsp.start()
+        except Exception as e:
+            self.log.warning(f"Mojo LSP unavailable, completions disabled: {e}")
+            return
+        if self._closing: lsp.shutdown()
+        else: self.lsp = lsp
+
+    async def _wait_for_engine(self):
+        "Wait for the background engine start; raises its error if it failed."
+        if self._engine_ready and not self._engine_ready.is_set(): await asyncio.to_thread(self._engine_ready.wait)
+        if self._engine_error: raise RuntimeError(f"Mojo engine failed to start: {self._engine_error}")
+
+    def _session_var_names(self): return list(dict.fromkeys(re.findall(r'(?m)^(?:var|let)\s+([A-Za-z_]\w*)', self.preamble.text)))
+
+    def _open_variables_comm(self, comm, msg):
+        "Variable explorer comm: {request: 'variables'} or {request: 'children', name, path, offset, count}, replies echo `id`."
+        comm.on_msg(lambda msg: asyncio.ensure_future(self._variables_request(comm, msg['content']['data'])))
+
+    async def _variables_request(self, comm, data):
+        # Engine calls wait for a running cell to finish, on a worker thread so the kernel stays responsive.
+        reply = dict(id=data.get('id'))
+        try:
+            if not hasattr(self.engine, 'variables'): raise ValueError('the variable explorer needs the C++ server engine')
+            if data.get('request') == 'children':
+                args = data.get('path', []),data.get('offset', 0),data.get('count', 100)
+                reply['children'],reply['more'] = await asyncio.to_thread(self.engine.variable_children, data['name'], *args)
+            else: reply['variables'] = await asyncio.to_thread(self.engine.variables, self._session_var_names())
+        except Exception as e: reply['error'] = f'{type(e).__name__}: {e}'
+        comm.send(reply)
 
     def _fallback_complete(self, code, cursor_pos, start, end):
+        # The session's symbols come from the index; only the current cell is scanned here.
         prefix = code[start:cursor_pos]
-        if not prefix: return [], {}
-        syms = self._known_symbols(code)
-        matches = [o for o in syms.keys() if o.startswith(prefix)]
+        cell = cell_symbols(code)
+        if start > 0 and code[start-1] == '.':
+            m = re.search(r'([A-Za-z_]\w*)\s*$', code[:start-1])
+            syms = self.symbols.members(m.group(1), cell) if m else {}
+            matches = rank(syms, prefix, self._completion_limit)
+        elif prefix:
+            found = set(self.symbols.match(prefix, self._completion_limit)) | set(cell.match(prefix, self._completion_limit))
+            matches = rank(found, prefix, self._completion_limit)
+            syms = {o: self.symbols.get(o, cell) for o in matches}
+        else: return [], {}
         typed = []
         for o in matches:
             entry = dict(start=start, end=end, text=o, type=syms[o].get('type', 'text'))
@@ -79,10 +154,9 @@ class MojoKernel(Kernel):
     def _fallback_inspect_text(self, code, cursor_pos):
         target = self._inspect_target(code, cursor_pos)
         if not target: return ''
-        syms = self._known_symbols(code)
-        if target in syms and syms[target].get('signature'): return syms[target]['signature']
-        if target in syms: return target
-        return ''
+        entry = self.symbols.get(target, cell_symbols(code))
+        if entry and entry.get('signature'): return entry['signature']
+        return target if entry else ''
 
     def _wrap_for_lsp(self, text, cursor_pos, fn_name='__mojokernel_cell__'):
         marker = '__MOJOKERNEL_CURSOR__'
@@ -108,24 +182,44 @@ class MojoKernel(Kernel):
         if cursor_pos > 0 and code[cursor_pos-1] == '.': return True
         return start > 0 and code[start-1] == '.'
 
-    def _lsp_complete(self, text, pos, start, end, prefix=''):
-        try: payload = self.lsp.complete(text, pos)
-        except Exception as e:
-            if not self._is_outdated_lsp_error(e): raise
-            payload = self.lsp.complete(text, pos)
-        matches = completion_matches(payload, prefix=prefix)
-        typed = completion_metadata(payload, start, end, prefix=prefix)
-        return matches,dict(_jupyter_types_experimental=typed) if typed else {}
+    async def _lsp_race(self, variants, useful, failed):
+        """Send all `variants` [(stage, method, text, pos, doc)] at once, under one deadline of the LSP request timeout.
+        Answers are taken in variant order: `useful(stage, result, ms)` sees a later one only once the earlier ones have
+        failed (`failed(stage, error, ms)`) or weren't useful. Requests still running after that are cancelled.
+        The LSP is waited on from worker threads, so the event loop keeps streaming cell output meanwhile."""
+        t0 = time.time()
+        deadline = time.monotonic() + (getattr(self.lsp, 'request_timeout', None) or 2.0)
+        left = lambda: max(0, deadline - time.monotonic())
+        def submit_all():
+            calls = []
+            for _,method,text,pos,doc in variants:
+                try: calls.append(self.lsp.submit(f'textDocument/{method}', text, pos, doc=doc))
+                except Exception as e: calls.append(e)
+            return calls
+        calls = await asyncio.to_thread(submit_all)
+        try:
+            for (stage,method,text,pos,doc),call in zip(variants, calls):
+                try:
+                    if isinstance(call, Exception): raise call
+                    try: res = await asyncio.to_thread(call.result, left())
+                    except Exception as e:
+                        # Outdated because the document has moved on: a newer request is coming, so don't redo this one.
+                        if not self._is_outdated_lsp_error(e) or getattr(call, 'stale', False): raise
+                        res = await asyncio.to_thread(lambda: self.lsp.submit(f'textDocument/{method}', text, pos, doc=doc).result(left()))
+                except Exception as e:
+                    failed(stage, e, round(1000 * (time.time() - t0), 1))
+                    continue
+                if useful(stage, res, round(1000 * (time.time() - t0), 1)): return True
+            return False
+        finally:
+            for c in calls:
+                if not isinstance(c, Exception): c.cancel()
 
-    def _lsp_inspect(self, text, pos):
-        txt = ''
-        try: txt = signature_text(self.lsp.signature_help(text, pos))
-        except Exception as e: self.log.debug(f"Signature help failed: {e}")
-        if txt: return txt
-        try: return hover_text(self.lsp.hover(text, pos))
-        except Exception as e:
-            self.log.debug(f"Inspect failed: {e}")
-            return ''
+    def _completion_reply(self, payload, start, end, prefix=''):
+        payload = completion_items(payload)
+        matches = completion_matches(payload, prefix=prefix, limit=self._completion_limit)
+        typed = completion_metadata(payload, start, end, prefix=prefix, limit=self._completion_limit)
+        return matches,dict(_jupyter_types_experimental=typed) if typed else {}
 
     def _diag_on(self):
         v = os.environ.get('MOJO_KERNEL_LSP_DIAG', '').lower()
@@ -142,86 +236,355 @@ class MojoKernel(Kernel):
         s = repr(e)
         return s if len(s) <= n else s[:n-3] + '...'
 
-    def do_execute(self, code, silent, store_history=True, user_expressions=None, allow_stdin=False):
+    def _send_stream(self, name, text):
+        if text: self.send_response(self.iopub_socket, 'stream', dict(name=name, text=text))
+
+    def _shell_header(self, msg):
+        try:
+            _,frames = self.session.feed_identities(msg, copy=False)
+            return self.session.deserialize(frames, content=False, copy=False)['header']
+        except Exception: return {}
+
+    def _superseded(self, msg_type):
+        "Whether a newer `msg_type` request than the one being handled has already arrived."
+        newest = self._newest.get(msg_type)
+        return newest is not None and newest != self.get_parent('shell').get('header', {}).get('msg_id')
+
+    async def shell_main(self, subshell_id, msg):
+        # Called as each message arrives, before it waits for the shell lock: note the newest completion/inspect
+        # request, so that a burst typed while one is being answered costs one more LSP round trip, not one each.
+        header = self._shell_header(msg)
+        if header.get('msg_type') in self._debounced: self._newest[header['msg_type']] = header.get('msg_id')
+        # ipykernel>=7 queues shell messages behind a lock while a cell runs. Let LSP-only requests through
+        # concurrently, the same way ipykernel dispatches comm messages during async cells.
+        lock = getattr(self, '_main_asyncio_lock', None)
+        if (self._can_dispatch_concurrently and subshell_id is None and lock is not None and lock.locked()
+                and header.get('msg_type') in self._concurrent_requests):
+            parent,ident = self.get_parent('shell'),self._get_shell_context_var(self._shell_parent_ident)
+            try: await asyncio.create_task(self.dispatch_shell(msg, subshell_id=subshell_id, concurrent=True), context=contextvars.copy_context())
+            finally: self.set_parent(ident, parent, channel='shell')
+            return
+        await super().shell_main(subshell_id, msg)
+
+    async def complete_request(self, stream, ident, parent):
+        # Give requests typed meanwhile a moment to arrive, so that do_complete can tell this one is stale.
+        if self._debounce: await asyncio.sleep(self._debounce)
+        await super().complete_request(stream, ident, parent)
+
+    async def inspect_request(self, stream, ident, parent):
+        if self._debounce: await asyncio.sleep(self._debounce)
+        await super().inspect_request(stream, ident, parent)
+
+    async def interrupt_request(self, stream, ident, parent):
+        # Interrupt the engine rather than SIGINT-ing our own process group.
+        content = dict(status='ok')
+        try: self.do_interrupt()
+        except Exception as e: content = dict(status='error', ename=type(e).__name__, evalue=str(e), traceback=[])
+        self.session.send(stream, 'interrupt_reply', content, parent, ident=ident)
+
+    async def do_execute(self, code, silent, store_history=True, user_expressions=None, allow_stdin=False):
         code = code.strip()
+        self._last_timing = {}
         if not code: return dict(status='ok', execution_count=self.execution_count, payload=[], user_expressions={})
-        result = self.engine.execute(code)
+        try: await self._wait_for_engine()
+        except RuntimeError as e: return self._error_reply('MojoEngineError', str(e), [], silent)
+        with self._interrupt_on_sigint():
+            if code.startswith('%%'): return await self._run_cellmagic(code, silent)
+            if code.startswith('%'): return await self._run_magic(code, silent)
+            return await self._execute(code, silent)
+
+    @contextlib.contextmanager
+    def _interrupt_on_sigint(self):
+        # ipykernel installs `default_int_handler` around each request, so a signal-mode interrupt would raise
+        # KeyboardInterrupt in the event loop while the cell is awaited, and take the kernel down. Pass it on instead.
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+        def on_sigint(*args):
+            try: self.do_interrupt()
+            except Exception as e: self.log.warning(f'interrupt failed: {e}')
+        saved = signal.signal(signal.SIGINT, on_sigint)
+        try: yield
+        finally: signal.signal(signal.SIGINT, saved)
 
-        if not silent and result.stdout: self.send_response(self.iopub_socket, 'stream', dict(name='stdout', text=result.stdout))
-        if not silent and result.stderr: self.send_response(self.iopub_socket, 'stream', dict(name='stderr', text=result.stderr))
+    async def _execute(self, code, silent):
+        # Chunks are merged into fewer iopub messages; everything buffered goes out before the reply.
+        batcher = None if silent else StreamBatcher(self._send_stream)
+        try: result = await self.engine.execute_async(code, on_output=batcher.write if batcher else None)
+        except RuntimeError as e:
+            if self.engine.alive: raise
+            return self._error_reply('MojoServerDied', await asyncio.to_thread(self._recover, e), [], silent)
+        finally:
+            if batcher: batcher.flush()
+        self._last_timing = result.timing
+        if result.spill: self._note_spill(result.spill, silent)
 
         if result.success:
-            if self.lsp: self._lsp_preamble += code + '\n'
+            self._record(code)
             return dict(status='ok', execution_count=self.execution_count, payload=[], user_expressions={})
+        return self._error_reply(result.ename, result.evalue, result.traceback, silent)
+
+    def _note_spill(self, spill, silent):
+        if not silent: self._send_stream('stdout', spill_notice(spill))
+        if not spill.get('path'): return
+        self._spills = self._spills + [spill['path']]
+        for p in self._spills[:-self._max_spills]: Path(p).unlink(missing_ok=True)
+        self._spills = self._spills[-self._max_spills:]
 
-        if not silent: self.send_response(self.iopub_socket, 'error', dict(ename=result.ename, evalue=result.evalue, traceback=result.traceback))
-        return dict(status='error', execution_count=self.execution_count, ename=result.ename, evalue=result.evalue, traceback=result.traceback)
+    def _error_reply(self, ename, evalue, traceback, silent):
+        if not silent: self.send_response(self.iopub_socket, 'error', dict(ename=ename, evalue=evalue, traceback=traceback))
+        return dict(status='error', execution_count=self.execution_count, ename=ename, evalue=evalue, traceback=traceback)
 
-    def do_complete(self, code, cursor_pos):
+    def _record(self, code):
+        "Note a successfully executed cell for the LSP preamble and the session log."
+        # Kept even before the LSP is up (or without one): the fallback completer reads it too.
+        self.preamble.add(code)
+        self.symbols.add(code)
+        if not self._session_log: return
+        # A log that can't be written must not cost the cell its reply.
+        try: self._session_log.append(code)
+        except OSError as e: self.log.warning(f'session log not written: {e}')
+
+    async def _run_magic(self, code, silent):
+        name,_,args = code[1:].partition('\n')[0].partition(' ')
+        fn = getattr(self, f'_magic_{name}', None)
+        if not fn: return self._error_reply('UsageError', f'Unknown magic: %{name}', [], silent)
+        try: out = await fn(args.strip())
+        except Exception as e: return self._error_reply(type(e).__name__, str(e), [], silent)
+        if out and not silent: self._send_stream('stdout', out + '\n')
+        return dict(status='ok', execution_count=self.execution_count, payload=[], user_expressions={})
+
+    async def _run_cellmagic(self, code, silent):
+        head,_,body = code[2:].partition('\n')
+        name,_,args = head.partition(' ')
+        fn = getattr(self, f'_cellmagic_{name}', None)
+        if not fn: return self._error_reply('UsageError', f'Unknown cell magic: %%{name}', [], silent)
+        return await fn(args.strip(), body.strip(), silent)
+
+    def _parse_limits(self, args):
+        "Parse `[N|off] [--idle N|off]` into engine limit overrides (None = unlimited)."
+        if not hasattr(self.engine, 'idle_timeout'): raise ValueError('This engine has no time limits; interrupt the kernel to stop a cell.')
+        secs = lambda v: None if v.lower() in ('off', 'none', '0') else float(v)
+        res,words = {},args.split()
+        while words:
+            w = words.pop(0)
+            if w == '--idle':
+                if not words: raise ValueError('--idle needs a value')
+                res['idle_timeout'] = secs(words.pop(0))
+            else: res['timeout'] = secs(w)
+        return res
+
+    def _limits_text(self):
+        fmt = lambda v: f'{v:g}s' if v else 'off'
+        return f'timeout: {fmt(self.engine.timeout)}, idle timeout: {fmt(self.engine.idle_timeout)}'
+
+    async def _magic_timeout(self, args):
+        "%timeout [N|off] [--idle N|off]: show or set the per-cell run time and output inactivity limits."
+        for k,v in self._parse_limits(args).items(): setattr(self.engine, k, v)
+        return self._limits_text()
+
+    async def _cellmagic_timeout(self, args, body, silent):
+        "%%timeout [N|off] [--idle N|off]: run the rest of the cell with these limits."
+        try: limits = self._parse_limits(args)
+        except ValueError as e: return self._error_reply('UsageError', str(e), [], silent)
+        old = {k: getattr(self.engine, k) for k in limits}
+        for k,v in limits.items(): setattr(self.engine, k, v)
+        try: return await self._execute(body, silent)
+        finally:
+            for k,v in old.items(): setattr(self.engine, k, v)
+
+    async def _magic_page(self, args):
+        "%page [N]: page N (default 1, negative from the end) of the last cell output that went past the output budget."
+        if not self._spills: return 'No truncated output to page through.'
+        path = self._spills[-1]
+        n = int(args or 1)
+        text = read_page(path, n - 1 if n > 0 else n)
+        pages = page_count(path)
+        return f'{text}\n[page {n if n > 0 else pages + n + 1}/{pages} of {path}]'
+
+    def _magic_opts(self, args, *names):
+        "Split `args` into positional words and the values of the `--name value` options in `names`."
+        words,opts = args.split(),{}
+        while any(w.startswith('--') for w in words):
+            i = next(i for i,w in enumerate(words) if w.startswith('--'))
+            key = words[i][2:]
+            if key not in names or i + 1 >= len(words): raise ValueError(f'unknown or incomplete option: {words[i]}')
+            opts[key] = words.pop(i + 1)
+            words.pop(i)
+        return words,opts
+
+    async def _magic_pull(self, args):
+        "%pull name [--len N] [--dtype T] [--save file.npy]: view a session buffer as a NumPy array in the kernel process."
+        if not hasattr(self.engine, 'read_memory'): raise ValueError('%pull needs the C++ server engine')
+        words,opts = self._magic_opts(args, 'len', 'dtype', 'save')
+        if len(words) != 1: raise ValueError('usage: %pull name [--len N] [--dtype T] [--save file.npy]')
+        name = words[0]
+        arr = await asyncio.to_thread(pull, self.engine, name, opts.get('len'), opts.get('dtype'))
+        if old := self.pulled.get(name): old.close()
+        self.pulled = {**self.pulled, name: arr}
+        a = arr.array
+        msg = f"{name}: {a.size} x {a.dtype} ({a.nbytes} bytes) from {hex(arr.info['address'])}"
+        if path := opts.get('save'):
+            import numpy as np
+            await asyncio.to_thread(np.save, path, a)
+            msg += f', saved to {path}'
+        return f'{msg}\n{a!r}'
+
+    async def _magic_push(self, args):
+        "%push name source [--pointer]: bind `name` in the session to the data of a .npy file or a %pull-ed array."
+        if not hasattr(self.engine, 'write_memory'): raise ValueError('%push needs the C++ server engine')
+        pointer = '--pointer' in args.split()
+        words = [w for w in args.split() if w != '--pointer']
+        if len(words) != 2: raise ValueError('usage: %push name file.npy|pulled_name [--pointer]')
+        name,src = words
+        if src in self.pulled: array = self.pulled[src].array
+        else:
+            import numpy as np
+            array = await asyncio.to_thread(np.load, src, mmap_mode='r')
+        code = await asyncio.to_thread(push, self.engine, name, array, pointer)
+        result = await self.engine.execute_async(code)
+        if not result.success: raise ValueError(f'binding {name} failed: {result.evalue}')
+        # The address is only good for this session, so the binding goes to the LSP preamble but not the session log.
+        self.preamble.add(code)
+        self.symbols.add(code)
+        return f'{name}: {array.size} x {array.dtype} (shape {array.shape}, {array.nbytes} bytes)'
+
+    async def _magic_vars(self, args):
+        "%vars [name [offset]]: list session variables, or a page of the children of one."
+        if not hasattr(self.engine, 'variables'): raise ValueError('%vars needs the C++ server engine')
+        fmt = lambda v: f"{v['name']}: {v['type']} = {v['summary'] or v['value']}".rstrip(' =')
+        words = args.split()
+        if not words:
+            vs = await asyncio.to_thread(self.engine.variables, self._session_var_names())
+            return '\n'.join(map(fmt, vs)) or 'No variables.'
+        offset = int(words[1]) if len(words) > 1 else 0
+        children,more = await asyncio.to_thread(self.engine.variable_children, words[0], (), offset, 20)
+        lines = [fmt(c) if c['name'] == f"[{c['index']}]" else f"[{c['index']}] {fmt(c)}" for c in children]
+        if more: lines.append(f'... (%vars {words[0]} {offset + 20} for more)')
+        return '\n'.join(lines) or 'No children.'
+
+    async def _magic_restore(self, args):
+        "%restore [--all]: replay the cells that had run before the last restart or server crash."
+        if not self._restorable: return 'Nothing to restore.'
+        return await asyncio.to_thread(self._restore, include_io='--all' in args.split())
+
+    def _auto_restore(self): return os.environ.get('MOJO_KERNEL_AUTO_RESTORE', '').lower() not in ('', '0', 'false', 'no', 'off')
+
+    def _restore(self, include_io=False):
+        cells = self._restorable
+        done,flagged,failed = replay(self.engine, cells, include_io=include_io)
+        for i in done: self._record(cells[i])
+        self._restorable = cells[failed[0]:] if failed else []
+        msg = f'Restored {len(done)} of {len(cells)} cells.'
+        if flagged: msg += f" Dropped top-level I/O statements from cell(s) {', '.join(str(i+1) for i in flagged)} (use %restore --all to keep them)."
+        if failed: msg += f' Cell {failed[0]+1} failed: {failed[1].ename}: {failed[1].evalue}'
+        return msg
+
+    def _recover(self, err):
+        "Restart a dead engine; the cells that had run become restorable."
+        self.log.warning(f"Mojo engine died, restarting: {err}")
+        self.engine.restart()
+        self.preamble.clear()
+        self.symbols.clear()
+        # Cells not restored after an earlier crash come first; they ran before anything logged since.
+        if self._session_log: self._restorable = self._restorable + self._session_log.take()
+        msg = 'The Mojo server died and was restarted.'
+        if not self._restorable: return msg
+        if self._auto_restore(): return f'{msg} {self._restore()}'
+        return f'{msg} Run %restore to replay the {len(self._restorable)} cells that had run.'
+
+    def finish_metadata(self, parent, metadata, reply_content):
+        # Server-reported timings (wall/eval/cpu/drain ms) for the cell, for monitoring to aggregate.
+        metadata = super().finish_metadata(parent, metadata, reply_content)
+        if self._last_timing: metadata['timing'] = self._last_timing
+        return metadata
+
+    async def do_complete(self, code, cursor_pos):
         cursor_pos = len(code) if cursor_pos is None else cursor_pos
         start,end = identifier_span(code, cursor_pos)
+        if self._superseded('complete_request'): return dict(status='ok', matches=[], cursor_start=start, cursor_end=end, metadata={})
         metadata = {}
         matches = []
         diag = []
         if self.lsp:
-            text = self._lsp_preamble + code
-            pos = len(self._lsp_preamble) + cursor_pos
+            t_start = time.time()
             is_member = self._is_member_completion(code, cursor_pos, start)
-            wtext,wpos = self._wrap_for_lsp(text, pos)
             prefix = code[start:cursor_pos]
+            # Same preamble and text before the identifier: a longer prefix narrows the cached list locally.
+            version,key = self.preamble.version,(code[:start], is_member)
+            payload = self._completions.get(version, key, prefix)
+            if payload is not None:
+                matches,metadata = self._completion_reply(payload, start, end, prefix=prefix)
+                self._completions.note(True, time.time() - t_start)
+                diag.append(dict(stage='cache', ok=True, matches=len(matches)))
+            else:
+                text = self.preamble.text + code
+                pos = len(self.preamble) + cursor_pos
+                wtext,wpos = self._wrap_for_lsp(text, pos)
 
-            def try_complete(stage, t, p):
-                nonlocal matches,metadata
-                t0 = time.time()
-                try:
-                    matches,metadata = self._lsp_complete(t, p, start, end, prefix=prefix)
-                    diag.append(dict(stage=stage, ok=True, matches=len(matches), elapsed_ms=round(1000 * (time.time() - t0), 1)))
-                    return True
-                except Exception as e:
+                def useful(stage, res, ms):
+                    nonlocal matches,metadata,payload
+                    payload = completion_items(res)  # indexed once, then narrowed from the cache
+                    matches,metadata = self._completion_reply(payload, start, end, prefix=prefix)
+                    diag.append(dict(stage=stage, ok=True, matches=len(matches), elapsed_ms=ms))
+                    return bool(matches)
+
+                def failed(stage, e, ms):
                     es = self._diag_err(e)
                     st = self._lsp_state()
-                    entry = dict(stage=stage, ok=False, error=es, elapsed_ms=round(1000 * (time.time() - t0), 1), lsp=st)
+                    entry = dict(stage=stage, ok=False, error=es, elapsed_ms=ms, lsp=st)
                     if self._is_outdated_lsp_error(e):
                         entry['stale'] = True
                         self.log.debug(f"{stage} stale request: {es}")
                     else: self.log.warning(f"{stage} failed: {es}; lsp={st}")
                     diag.append(entry)
-                    return False
 
-            if is_member:
-                try_complete('lsp_wrapped', wtext, wpos)
-                if not matches: try_complete('lsp_raw', text, pos)
-            else:
-                try_complete('lsp_raw', text, pos)
-                if not matches: try_complete('lsp_wrapped', wtext, wpos)
+                # The wrapped variant is its own document, so both can be in flight; members resolve best in fn scope.
+                variants = [('lsp_raw', 'completion', text, pos, None), ('lsp_wrapped', 'completion', wtext, wpos, 'cell')]
+                await self._lsp_race(variants[::-1] if is_member else variants, useful, failed)
+                if matches: self._completions.put(version, key, prefix, payload)
+                self._completions.note(False, time.time() - t_start)
         force_diag = bool(self.lsp and not matches and self._is_member_completion(code, cursor_pos, start))
         if not matches: matches,metadata = self._fallback_complete(code, cursor_pos, start, end)
-        if matches and diag and diag[-1].get('stage') != 'fallback': diag.append(dict(stage='final', ok=True, matches=len(matches)))
+        if matches and diag and diag[-1].get('stage') != 'fallback': diag.append(dict(stage='final', ok=True, matches=len(matches), cache=self._completions.stats()))
         elif not matches: diag.append(dict(stage='final', ok=False, matches=0))
         metadata = self._diag_meta(metadata, diag, force=force_diag)
         return dict(status='ok', matches=matches, cursor_start=start, cursor_end=end, metadata=metadata)
 
-    def do_inspect(self, code, cursor_pos, detail_level=0, omit_sections=()):
+    async def do_inspect(self, code, cursor_pos, detail_level=0, omit_sections=()):
         cursor_pos = len(code) if cursor_pos is None else cursor_pos
+        if self._superseded('inspect_request'): return dict(status='ok', found=False, data={}, metadata={})
         txt = ''
         if self.lsp:
-            text = self._lsp_preamble + code
-            pos = len(self._lsp_preamble) + cursor_pos
-            txt = self._lsp_inspect(text, pos)
-            if not txt:
-                try:
-                    wtext,wpos = self._wrap_for_lsp(text, pos)
-                    txt = self._lsp_inspect(wtext, wpos)
-                except Exception as e: self.log.debug(f"Wrapped inspect failed: {e}")
+            text = self.preamble.text + code
+            pos = len(self.preamble) + cursor_pos
+            wtext,wpos = self._wrap_for_lsp(text, pos)
+
+            def useful(stage, res, ms):
+                nonlocal txt
+                txt = signature_text(res) if stage.startswith('signature') else hover_text(res)
+                return bool(txt)
+
+            variants = [('signature', 'signatureHelp', text, pos, None), ('hover', 'hover', text, pos, None),
+                        ('signature_wrapped', 'signatureHelp', wtext, wpos, 'cell'), ('hover_wrapped', 'hover', wtext, wpos, 'cell')]
+            await self._lsp_race(variants, useful, lambda stage, e, ms: self.log.debug(f"Inspect {stage} failed: {e}"))
         if not txt: txt = self._fallback_inspect_text(code, cursor_pos)
         if not txt: return dict(status='ok', found=False, data={}, metadata={})
         return dict(status='ok', found=True, data={'text/plain': txt}, metadata={})
 
     def do_shutdown(self, restart):
+        self._closing = not restart
+        if self._engine_ready: self._engine_ready.wait()
         if self.lsp:
             try: self.lsp.restart() if restart else self.lsp.shutdown()
             except Exception as e: self.log.debug(f"LSP shutdown failed: {e}")
-        self.engine.restart() if restart else self.engine.shutdown()
+        # ipykernel exits the process even on restart, so the engine and its warm pool go with it either way.
+        self.engine.shutdown()
+        if self._session_log and not restart: self._session_log.clear()
+        for o in self.pulled.values(): o.close()
+        self.pulled = {}
+        if not restart:
+            for p in self._spills: Path(p).unlink(missing_ok=True)
         return dict(status='ok', restart=restart)
 
     def do_interrupt(self): self.engine.interrupt()
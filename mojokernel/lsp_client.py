@@ -1,29 +1,70 @@
-import json, os, shutil, subprocess, sys, tempfile, threading
+import json, os, shutil, subprocess, sys, threading, time
+from bisect import bisect_right
 from collections import deque
+from itertools import accumulate
 from pathlib import Path
+from .completions import MatchIndex
+from .paths import user_dir
 
 
 class LSPError(RuntimeError): pass
 
 
-def offset_to_lsp_position(text, offset):
-    offset = max(0, min(len(text), offset))
-    line = text.count('\n', 0, offset)
-    prev = text.rfind('\n', 0, offset)
-    char = offset if prev < 0 else offset - prev - 1
-    return line, char
+def _utf16_len(s): return len(s) if s.isascii() else len(s) + sum(ord(c) > 0xFFFF for c in s)
 
 
-def lsp_position_to_offset(text, line, char):
-    line = max(0, line)
-    char = max(0, char)
-    starts = [0]
-    for i,c in enumerate(text):
-        if c == '\n': starts.append(i+1)
-    if line >= len(starts): return len(text)
-    start = starts[line]
-    end = starts[line+1]-1 if line+1 < len(starts) else len(text)
-    return min(start + char, end)
+class LineIndex:
+    """Start offsets of the lines of `text`, for bisecting offsets to LSP (line, character) positions and back.
+    Offsets count code points; LSP characters are UTF-16 code units, so a non-BMP character such as 🔥 counts twice."""
+    def __init__(self, text=''):
+        self.text,self.starts = '',[0]
+        self.update(text, 0)
+
+    def update(self, text, start):
+        "Re-index `text`, whose first `start` characters are the same as the current text's."
+        self.starts[bisect_right(self.starts, min(start, len(self.text))):] = []
+        i = self.starts[-1]
+        self.starts += list(accumulate(map(len, text[i:].split('\n')[:-1]), lambda a,n: a + n + 1, initial=i))[1:]
+        self.text = text
+
+    def position(self, offset):
+        offset = max(0, min(len(self.text), offset))
+        line = bisect_right(self.starts, offset) - 1
+        return line, _utf16_len(self.text[self.starts[line]:offset])
+
+    def offset(self, line, char):
+        line,char = max(0, line),max(0, char)
+        if line >= len(self.starts): return len(self.text)
+        start = self.starts[line]
+        end = self.starts[line+1]-1 if line+1 < len(self.starts) else len(self.text)
+        if self.text[start:end].isascii(): return min(start + char, end)
+        units = 0
+        for i in range(start, end):
+            if units >= char: return i
+            units += 2 if ord(self.text[i]) > 0xFFFF else 1
+        return end
+
+
+def offset_to_lsp_position(text, offset): return LineIndex(text).position(offset)
+
+def lsp_position_to_offset(text, line, char): return LineIndex(text).offset(line, char)
+
+
+def _common_len(a, b, suffix=False):
+    "Length of the common prefix (or suffix) of `a` and `b`, bisecting with `startswith` on the undecided chunk only."
+    lo,hi = 0,min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if (b.endswith(a[len(a)-mid:len(a)-lo], 0, len(b)-lo) if suffix else b.startswith(a[lo:mid], lo)): lo = mid
+        else: hi = mid - 1
+    return lo
+
+
+def text_edit(old, new):
+    "The single replacement (start, old_end, text) turning `old` into `new`."
+    start = _common_len(old, new)
+    tail = _common_len(old[start:], new[start:], suffix=True)
+    return start,len(old)-tail,new[start:len(new)-tail]
 
 
 def identifier_span(text, cursor_pos):
@@ -57,30 +98,33 @@ _kind_to_jupyter_type = {2: 'function', 3: 'function', 4: 'function', 5: 'proper
 def _completion_type(kind): return _kind_to_jupyter_type.get(kind, 'text') if isinstance(kind, int) else 'text'
 
 
-def completion_matches(payload, prefix=''):
-    items = _completion_items(payload)
-    prefix = prefix or ''
-    res, seen = [], set()
-    for item in items:
-        text = _completion_text(item)
-        if not text: continue
-        if prefix and not text.startswith(prefix): continue
-        if text in seen: continue
-        seen.add(text)
-        res.append(text)
-    return res
+class CompletionItems(MatchIndex):
+    "The items of a completion payload, one per text, indexed once for ranked matching by `completion_matches`/`completion_metadata`."
+    def __init__(self, payload):
+        items = {}
+        for item in _completion_items(payload):
+            text = _completion_text(item)
+            if text and text not in items: items[text] = item
+        super().__init__(items)
+        self.items = list(items.values())
+        self.incomplete = isinstance(payload, dict) and bool(payload.get('isIncomplete'))
+
+
+def completion_items(payload): return payload if isinstance(payload, CompletionItems) else CompletionItems(payload)
+
+
+def completion_matches(payload, prefix='', limit=None):
+    "Texts of the items matching `prefix`, ranked (see `MatchIndex`), at most `limit`. `payload` may be `CompletionItems`."
+    ix = completion_items(payload)
+    return ix.ranked(prefix or '', limit)
 
 
-def completion_metadata(payload, start, end, prefix=''):
-    items = _completion_items(payload)
-    prefix = prefix or ''
-    res, seen = [], set()
-    for item in items:
-        text = _completion_text(item)
-        if not text or text in seen: continue
-        if prefix and not text.startswith(prefix): continue
-        seen.add(text)
-        entry = dict(start=start, end=end, text=text, type=_completion_type(item.get('kind')))
+def completion_metadata(payload, start, end, prefix='', limit=None):
+    ix = completion_items(payload)
+    res = []
+    for i in ix.match(prefix or '', limit):
+        item = ix.items[i]
+        entry = dict(start=start, end=end, text=ix.names[i], type=_completion_type(item.get('kind')))
         detail = item.get('detail')
         if isinstance(detail, str) and detail.strip(): entry['signature'] = detail.strip()
         res.append(entry)
@@ -146,6 +190,52 @@ class _Pending:
         self.err = None
 
 
+class _Document:
+    "The client's copy of an open LSP text document."
+    def __init__(self, uri):
+        self.uri,self.text,self.lines,self.version,self.open = uri,'',LineIndex(),0,False
+        self.inflight = set()  # LSPCalls sent against the current version
+
+
+class LSPCall:
+    """A text document request in flight, from `MojoLSPClient.submit`. `result(timeout)` waits for the answer (reopening
+    the document and resending once if the server rejects the position); `cancel()` sends `$/cancelRequest`.
+    A change to the document cancels the call, since its answer would be for the old text; `stale` is then true."""
+    def __init__(self, client, method, text, cursor_offset, doc=None):
+        self.client,self.method,self.text,self.cursor_offset,self.doc = client,method,text,cursor_offset,doc
+        self.retried,self.superseded = False,False
+        self._send()
+
+    def _send(self, reopen=False):
+        c = self.client
+        with c._doc_lock:
+            d = c._document(self.doc)
+            if reopen: c._reopen_document(self.text, d)
+            else: c.update_document(self.text, self.doc)
+            line,char = d.lines.position(self.cursor_offset)
+            params = dict(textDocument=dict(uri=d.uri), position=dict(line=line, character=char))
+            self.id,self.pending = c._send_request(self.method, params)
+            self.version,self._docref = d.version,d
+            d.inflight = {o for o in d.inflight if not o.done()} | {self}
+
+    def done(self): return self.pending.event.is_set()
+
+    @property
+    def stale(self): return self.superseded or self._docref.version != self.version
+
+    def result(self, timeout=None):
+        try: return self.client._wait(self.id, self.pending, self.method, timeout)
+        except Exception as e:
+            if self.retried or not _is_invalid_request_error(e): raise
+            # Some servers report didChange support but ignore it. Reopen+retry once.
+            self.retried = True
+            self._send(reopen=True)
+            return self.client._wait(self.id, self.pending, self.method, timeout)
+
+    def cancel(self, reason='Request cancelled'):
+        if not self.done(): self.client._cancel(self.id, reason)
+
+
 class MojoLSPClient:
     def __init__(self, cmd=None, include_dirs=None, root_uri=None, env=None, request_timeout=2.0, shutdown_timeout=1.0, logger=None):
         self.cmd = list(cmd) if cmd else None
@@ -163,12 +253,13 @@ class MojoLSPClient:
         self._pending = {}
         self._next_id = 1
         self._doc_uri = 'file:///__mojokernel__/session.mojo'
-        self._doc_text = ''
-        self._doc_version = 0
-        self._doc_open = False
+        self._doc_lock = threading.RLock()
+        self._docs = {}
         self._supports_did_change = False
+        self._incremental = False
         self._stderr_tail = deque(maxlen=20)
         self._last_reader_error = ''
+        self.startup = {}
 
     @property
     def pid(self): return None if not self._proc else self._proc.pid
@@ -198,9 +289,7 @@ class MojoLSPClient:
         return cmd
 
     def _tmp_profile_base(self):
-        d = Path(tempfile.gettempdir())/'mojokernel'
-        d.mkdir(parents=True, exist_ok=True)
-        return str(d/'kgen.trace.json')
+        return str(user_dir()/'kgen.trace.json')
 
     def _build_env(self):
         env = os.environ.copy()
@@ -212,6 +301,7 @@ class MojoLSPClient:
         if self.is_running: return
         cmd = self._build_cmd()
         env = self._build_env()
+        t0 = time.perf_counter()
         self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, env=env)
         self._reader = threading.Thread(target=self._reader_loop, name='mojo-lsp-reader', daemon=True)
         self._stderr_reader = threading.Thread(target=self._stderr_loop, name='mojo-lsp-stderr', daemon=True)
@@ -219,9 +309,12 @@ class MojoLSPClient:
         self._stderr_reader.start()
         try:
             params = dict(processId=os.getpid(), rootUri=self.root_uri, capabilities={}, clientInfo=dict(name='mojokernel', version='0'))
+            t1 = time.perf_counter()
             init = self._request('initialize', params, timeout=self.request_timeout)
+            self.startup = dict(spawn_ms=round(1000 * (t1 - t0), 1), initialize_ms=round(1000 * (time.perf_counter() - t1), 1))
             caps = init.get('capabilities') if isinstance(init, dict) else {}
             self._supports_did_change = _sync_change_kind(caps) in (1, 2)
+            self._incremental = _sync_change_kind(caps) == 2
             self._notify('initialized', {})
         except Exception:
             self.shutdown()
@@ -239,6 +332,7 @@ class MojoLSPClient:
         proc = self._proc
         with self._pending_lock: pending = len(self._pending)
         tail = list(self._stderr_tail)
+        doc = self._docs.get(self._doc_uri) or _Document(self._doc_uri)
         data = dict(
             is_running=self.is_running,
             pid=self.pid,
@@ -246,10 +340,12 @@ class MojoLSPClient:
             reader_alive=self.reader_alive,
             stderr_reader_alive=bool(self._stderr_reader and self._stderr_reader.is_alive()),
             pending=pending,
-            doc_open=self._doc_open,
-            doc_version=self._doc_version,
-            doc_len=len(self._doc_text),
+            doc_open=doc.open,
+            doc_version=doc.version,
+            doc_len=len(doc.text),
+            docs=len(self._docs),
             supports_did_change=self._supports_did_change,
+            incremental_sync=self._incremental,
             last_reader_error=self._last_reader_error,
             stderr_tail=tail[-6:],
         )
@@ -296,10 +392,9 @@ class MojoLSPClient:
         finally:
             self._close_streams(proc)
             self._proc = None
-            self._doc_open = False
-            self._doc_text = ''
-            self._doc_version = 0
+            self._docs = {}
             self._supports_did_change = False
+            self._incremental = False
             self._last_reader_error = ''
             self._fail_pending(RuntimeError("LSP client shut down"))
             self._join_thread(self._reader)
@@ -307,47 +402,67 @@ class MojoLSPClient:
             self._reader = None
             self._stderr_reader = None
 
-    def _did_open(self, text):
-        self._doc_open = True
-        self._doc_version += 1
-        self._doc_text = text
-        td = dict(uri=self._doc_uri, languageId='mojo', version=self._doc_version, text=text)
+    def _document(self, doc=None):
+        uri = self._doc_uri if doc is None else f'file:///__mojokernel__/{doc}.mojo'
+        return self._docs.setdefault(uri, _Document(uri))
+
+    def _did_open(self, text, d):
+        self._supersede(d)
+        d.open = True
+        d.version += 1
+        d.text = text
+        d.lines.update(text, 0)
+        td = dict(uri=d.uri, languageId='mojo', version=d.version, text=text)
         self._notify('textDocument/didOpen', dict(textDocument=td))
 
-    def _did_close(self):
-        if not self._doc_open: return
-        self._notify('textDocument/didClose', dict(textDocument=dict(uri=self._doc_uri)))
-        self._doc_open = False
-
-    def _did_change(self, text):
-        self._doc_version += 1
-        self._doc_text = text
-        self._notify('textDocument/didChange', dict(textDocument=dict(uri=self._doc_uri, version=self._doc_version), contentChanges=[dict(text=text)]))
-
-    def _reopen_document(self, text):
-        self._did_close()
-        self._did_open(text)
-
-    def update_document(self, text):
+    def _did_close(self, d):
+        if not d.open: return
+        self._notify('textDocument/didClose', dict(textDocument=dict(uri=d.uri)))
+        d.open = False
+
+    def _supersede(self, d):
+        "Cancel the requests still running against the current text of `d`, before it changes."
+        for o in d.inflight:
+            if o.done(): continue
+            o.superseded = True
+            o.cancel('Request superseded by a document change')
+        d.inflight = set()
+
+    def _did_change(self, text, d):
+        # With incremental sync only the changed span is sent; with the preamble unchanged that is just the cell.
+        self._supersede(d)
+        d.version += 1
+        start,end,new = text_edit(d.text, text)
+        if self._incremental:
+            pos = lambda o: dict(zip(('line', 'character'), d.lines.position(o)))
+            change = dict(range=dict(start=pos(start), end=pos(end)), text=new)
+        else: change = dict(text=text)
+        d.text = text
+        d.lines.update(text, start)
+        self._notify('textDocument/didChange', dict(textDocument=dict(uri=d.uri, version=d.version), contentChanges=[change]))
+
+    def _reopen_document(self, text, d):
+        self._did_close(d)
+        self._did_open(text, d)
+
+    def update_document(self, text, doc=None):
+        "Sync document `doc` (default: the session document) to `text`. Documents are independent, so variants of the same code can live side by side."
         if not self.is_running: self.start()
         text = text or ''
-        if not self._doc_open:
-            self._did_open(text)
-            return
-        if text == self._doc_text: return
-        if self._supports_did_change: self._did_change(text)
-        else: self._reopen_document(text)
+        with self._doc_lock:
+            d = self._document(doc)
+            if not d.open: self._did_open(text, d)
+            elif text == d.text: return
+            elif self._supports_did_change: self._did_change(text, d)
+            else: self._reopen_document(text, d)
+
+    def submit(self, method, text, cursor_offset, doc=None):
+        "Send `method` (e.g. 'textDocument/hover') at `cursor_offset` of `text` without waiting; returns an `LSPCall`."
+        self.ensure_alive()
+        return LSPCall(self, method, text, cursor_offset, doc)
 
     def _text_document_request(self, method, text, cursor_offset, timeout=None):
-        self.update_document(text)
-        line, char = offset_to_lsp_position(text, cursor_offset)
-        params = dict(textDocument=dict(uri=self._doc_uri), position=dict(line=line, character=char))
-        try: return self._request(method, params, timeout=timeout)
-        except Exception as e:
-            if not _is_invalid_request_error(e): raise
-            # Some servers report didChange support but ignore it. Reopen+retry once.
-            self._reopen_document(text)
-            return self._request(method, params, timeout=timeout)
+        return LSPCall(self, method, text, cursor_offset).result(timeout)
 
     def complete(self, text, cursor_offset, timeout=None):
         return self._request_with_restart(lambda: self._text_document_request('textDocument/completion', text, cursor_offset, timeout=timeout))
@@ -369,17 +484,27 @@ class MojoLSPClient:
             except Exception: pass
 
     def _request(self, method, params, timeout=None):
-        timeout = self.request_timeout if timeout is None else timeout
+        req_id,pending = self._send_request(method, params)
+        return self._wait(req_id, pending, method, timeout)
+
+    def _send_request(self, method, params):
         if not self.is_running: raise RuntimeError("LSP process not running")
         pending = _Pending()
         with self._pending_lock:
             req_id = self._next_id
             self._next_id += 1
             self._pending[req_id] = pending
+        try: self._send(dict(jsonrpc='2.0', id=req_id, method=method, params=params))
+        except Exception:
+            with self._pending_lock: self._pending.pop(req_id, None)
+            raise
+        return req_id,pending
+
+    def _wait(self, req_id, pending, method, timeout=None):
+        timeout = self.request_timeout if timeout is None else timeout
         try:
-            self._send(dict(jsonrpc='2.0', id=req_id, method=method, params=params))
             if not pending.event.wait(timeout):
-                with self._pending_lock: self._pending.pop(req_id, None)
+                self._cancel(req_id)
                 raise TimeoutError(f"LSP request timed out: {method}")
             if pending.err: raise pending.err
             msg = pending.msg or {}
@@ -388,6 +513,15 @@ class MojoLSPClient:
         finally:
             with self._pending_lock: self._pending.pop(req_id, None)
 
+    def _cancel(self, req_id, reason='Request cancelled'):
+        "Tell the server to drop request `req_id`, and fail it locally so a waiter returns now."
+        with self._pending_lock: pending = self._pending.pop(req_id, None)
+        if not pending: return
+        pending.err = LSPError(dict(code=-32800, message=reason))
+        pending.event.set()
+        try: self._notify('$/cancelRequest', dict(id=req_id))
+        except Exception as e: self._log(f"[mojo-lsp] cancel failed: {e!r}")
+
     def _notify(self, method, params):
         if not self.is_running: raise RuntimeError("LSP process not running")
         self._send(dict(jsonrpc='2.0', method=method, params=params))
@@ -0,0 +1,14 @@
+"""The per-user scratch directory for session logs, spill files, the zygote socket and LSP traces."""
+import os, stat, tempfile
+from pathlib import Path
+
+
+def user_dir():
+    """`$TMPDIR/mojokernel-<uid>`, created mode 0700. Refuses (PermissionError) a directory someone else owns, and
+    takes group/other access away from ours, so other users can neither read its files nor plant a socket there."""
+    d = Path(tempfile.gettempdir()) / f'mojokernel-{os.getuid()}'
+    d.mkdir(mode=0o700, exist_ok=True)
+    st = os.lstat(d)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid(): raise PermissionError(f'{d} is not a directory owned by this user')
+    if st.st_mode & 0o077: os.chmod(d, 0o700)
+    return d
@@ -0,0 +1,84 @@
+"""The LSP preamble: the session's top-level declarations, keeping only the latest definition of each symbol."""
+import os, re
+from collections import Counter
+from .restore import _top_level_blocks
+
+_DECL_RE = re.compile(r'^(fn|def|struct|trait|alias|comptime|var|let)\s+([A-Za-z_]\w*)')
+_IMPORT_RE = re.compile(r'^(?:from|import)\b')
+_WORD_RE = re.compile(r'[A-Za-z_]\w*')
+
+
+def preamble_limit():
+    "Preamble size cap in characters from MOJO_KERNEL_PREAMBLE_LIMIT (default 256K; 0 or 'off' = no limit)."
+    v = os.environ.get('MOJO_KERNEL_PREAMBLE_LIMIT', '').strip().lower()
+    if not v: return 256 * 1024
+    return 0 if v in ('0', 'off', 'none') else int(v)
+
+
+def _params(s):
+    "The `[...]`/`(...)` parameter lists at the start of `s`, without whitespace: what tells fn overloads apart."
+    depth = 0
+    for i,c in enumerate(s):
+        if c in '([{': depth += 1
+        elif c in ')]}': depth -= 1
+        if depth == 0 and c == ')': return re.sub(r'\s+', '', s[:i+1])
+        if depth == 0 and c != ']' and not c.isspace(): break
+    return ''
+
+
+def decl_key(block):
+    "Identity of a top-level block as a declaration: a later block with the same key replaces it. None for statements."
+    line = next((l for l in block.split('\n') if not l.startswith('@')), '')
+    if _IMPORT_RE.match(line): return ('import', re.sub(r'\s+', ' ', line.strip()))
+    m = _DECL_RE.match(line)
+    if not m: return None
+    kind,name = m.groups()
+    if kind in ('fn', 'def'): return ('fn', name, _params(block[block.index(line) + m.end():]))
+    return ('value' if kind in ('var', 'let') else 'type', name)
+
+
+class Preamble:
+    """The declarations of the executed cells, in order, one block per `decl_key`: re-running a definition moves it
+    to the end, replacing the old copy, and top-level statements are dropped. Past `limit` characters blocks are
+    evicted by `_evict`. `version` changes whenever `text` does."""
+    def __init__(self, limit=None):
+        self.limit = preamble_limit() if limit is None else limit
+        self.blocks,self.size,self.version = {},0,0
+        self._text = ''
+
+    def add(self, code):
+        "Record the declarations of a successfully executed cell."
+        changed = False
+        for b in _top_level_blocks(code):
+            key = decl_key(b)
+            if key is None: continue
+            old = self.blocks.pop(key, None)
+            if old is not None: self.size -= len(old) + 1
+            self.blocks[key] = b
+            self.size += len(b) + 1
+            changed = True
+        if self.limit and self.size > self.limit: self._evict()
+        if changed: self._changed()
+
+    def _evict(self):
+        """Drop blocks until the text fits in `limit`, oldest first within each group: var/let values, then
+        definitions no other block mentions, then definitions still in use. Imports are never dropped, since every
+        later block may need them."""
+        uses = Counter(w for b in self.blocks.values() for w in set(_WORD_RE.findall(b)))
+        group = lambda key: 0 if key[0] == 'value' else 2 if uses[key[1]] > 1 else 1  # a block mentions its own name
+        for key in sorted((k for k in self.blocks if k[0] != 'import'), key=group):
+            if self.size <= self.limit or len(self.blocks) <= 1: break
+            self.size -= len(self.blocks.pop(key)) + 1
+
+    def clear(self):
+        self.blocks,self.size = {},0
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._text = ''.join(b + '\n' for b in self.blocks.values())
+
+    @property
+    def text(self): return self._text
+
+    def __len__(self): return len(self._text)
@@ -0,0 +1,118 @@
+"""Session log of successful cells, and replay plans that rebuild state after a restart or server crash."""
+import hashlib, json, os, re
+from dataclasses import dataclass, field
+from pathlib import Path
+from .paths import user_dir
+
+_DEF_RE = re.compile(r'^(?:@\w+|fn|def|struct|trait|alias|comptime|from|import)\b')
+_NAME_RE = re.compile(r'^(?:fn|def|struct|trait|alias|comptime)\s+([A-Za-z_]\w*)')
+# Calls that do I/O or otherwise act on the world when a top-level statement runs.
+_IO_RE = re.compile(r'\b(?:print|input|open|sleep|system|remove|unlink|mkdir|rmdir)\s*\(|\bsubprocess\b|\bPython\.import_module\b')
+
+
+def session_log_path(key):
+    "Log path for the kernel session identified by `key` (stable across restarts of the same kernel)."
+    tag = os.environ.get('MOJO_KERNEL_SESSION') or hashlib.sha1(key if isinstance(key, bytes) else str(key).encode()).hexdigest()[:16]
+    return user_dir() / f'session-{tag}.jsonl'
+
+
+class SessionLog:
+    "Append-only jsonl of the cells that executed successfully in a kernel session."
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def append(self, code):
+        with self.path.open('a') as f: f.write(json.dumps(dict(code=code)) + '\n')
+
+    def cells(self):
+        if not self.path.exists(): return []
+        res = []
+        for line in self.path.read_text().splitlines():
+            try: res.append(json.loads(line)['code'])
+            except (ValueError, KeyError): pass  # torn write from a crash
+        return res
+
+    def take(self):
+        "Return the logged cells and start a fresh log."
+        cells = self.cells()
+        self.clear()
+        return cells
+
+    def clear(self): self.path.unlink(missing_ok=True)
+
+
+def _top_level_blocks(code):
+    "Split `code` into top-level statements, each with its indented continuation lines."
+    blocks = []
+    for line in code.split('\n'):
+        if not line.strip() or line.lstrip().startswith('#'): continue
+        if line[0].isspace() and blocks: blocks[-1].append(line)
+        elif blocks and blocks[-1][-1].lstrip().startswith('@'): blocks[-1].append(line)
+        else: blocks.append([line])
+    return ['\n'.join(b) for b in blocks]
+
+
+def _is_io(block): return not _DEF_RE.match(block) and bool(_IO_RE.search(block))
+
+
+def classify_cell(code):
+    "'definition' (fn/struct/trait/alias/import only), 'io' (a top-level statement does I/O) or 'state'."
+    blocks = _top_level_blocks(code)
+    if all(_DEF_RE.match(b) for b in blocks): return 'definition'
+    return 'io' if any(map(_is_io, blocks)) else 'state'
+
+
+def strip_io(code):
+    "`code` without its top-level statements that do I/O."
+    return '\n'.join(b for b in _top_level_blocks(code) if not _is_io(b))
+
+
+def defined_names(code):
+    "Names declared by the top-level fn/struct/trait/alias statements of `code`."
+    decls = [next((l for l in b.split('\n') if not l.startswith('@')), '') for b in _top_level_blocks(code)]
+    return {m.group(1) for m in map(_NAME_RE.match, decls) if m}
+
+
+@dataclass
+class ReplayChunk:
+    code: str
+    cells: list[int] = field(default_factory=list)
+
+
+def replay_plan(cells, include_io=False):
+    """Chunks to execute to rebuild state from `cells`, and the indices of I/O cells whose top-level I/O
+    statements were dropped (the rest of the cell is still replayed, unless `include_io`).
+    Runs of definition-only cells are merged into one chunk unless that would define a name twice."""
+    chunks,flagged,names = [],[],None
+    for i,code in enumerate(cells):
+        kind = classify_cell(code)
+        if kind == 'io' and not include_io:
+            flagged.append(i)
+            code = strip_io(code)
+            if not code: continue
+        new = defined_names(code)
+        if kind == 'definition' and names is not None and not (names & new):
+            chunks[-1].code += '\n\n' + code
+            chunks[-1].cells.append(i)
+            names |= new
+            continue
+        chunks.append(ReplayChunk(code, [i]))
+        names = new if kind == 'definition' else None
+    return chunks,flagged
+
+
+def replay(engine, cells, include_io=False):
+    """Re-execute `cells` on `engine` following `replay_plan`; a merged chunk that fails is retried cell by cell.
+    Returns (restored cell indices, flagged I/O cell indices, (index, ExecutionResult) of the failed cell or None)."""
+    chunks,flagged = replay_plan(cells, include_io=include_io)
+    done = []
+    while chunks:
+        results = engine.execute_many([c.code for c in chunks])
+        ok = [c for c,r in zip(chunks, results) if r.success]
+        for c in ok: done += c.cells
+        if len(ok) == len(chunks): break
+        bad,r = chunks[len(ok)],results[len(ok)]
+        if len(bad.cells) == 1: return done,flagged,(bad.cells[0], r)
+        chunks = [ReplayChunk(cells[i], [i]) for i in bad.cells] + chunks[len(ok)+1:]
+    return done,flagged,None
@@ -0,0 +1,43 @@
+"""Cell output that went past the engine's output budget: the preview notice, and paging through the spill file."""
+import mmap, os
+
+PAGE_SIZE = 64 * 1024
+
+
+def _size(n):
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB': return f'{n:g} {unit}' if unit == 'bytes' else f'{n:.1f} {unit}'
+        n /= 1024
+
+
+def spill_notice(spill):
+    "Text shown after a truncated cell's output: how much was cut, where the rest is, and the tail of it."
+    path = spill.get('path') or '(spill file could not be written)'
+    res = f"\n[Output truncated: showed the first {_size(spill['shown'])} of {_size(spill['bytes'])}. Full output: {path}"
+    written = spill.get('written', spill['bytes'])
+    if spill.get('path') and written < spill['bytes']: res += f' (first {_size(written)} kept)'
+    if spill.get('path'): res += ' (use %page to read it)'
+    tail = spill.get('tail', '')
+    if not tail: return res + ']\n'
+    res += f'. Last {_size(len(tail.encode()))}:]\n' + tail
+    return res if res.endswith('\n') else res + '\n'
+
+
+def page_count(path, size=PAGE_SIZE): return max(1, -(-os.path.getsize(path) // size))
+
+
+def read_page(path, page, size=PAGE_SIZE):
+    """Text of 0-based `page` of the spill file at `path` (negative counts from the end), mapped rather than read
+    whole. Pages are `size` bytes, each boundary moved back to just after a newline when there is one."""
+    n = os.path.getsize(path)
+    pages = max(1, -(-n // size))
+    if page < 0: page += pages
+    if not 0 <= page < pages: raise IndexError(f'page {page+1} out of range (1-{pages})')
+    if not n: return ''
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        def boundary(k):
+            if k == 0: return 0
+            if k * size >= n: return n
+            i = mm.rfind(b'\n', (k-1) * size, k * size)
+            return k * size if i < 0 else i + 1
+        return mm[boundary(page):boundary(page+1)].decode('utf-8', errors='replace')
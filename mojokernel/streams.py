@@ -0,0 +1,56 @@
+"""Coalescing of a cell's stdout/stderr chunks into fewer iopub `stream` messages."""
+import asyncio, time
+from collections import deque
+
+
+class StreamBatcher:
+    """Buffers `write(name, text)` chunks and passes them to `send(name, text)` merged: after `window` seconds, or
+    as soon as `max_bytes` characters are waiting. At most `max_rate` messages go out per second; past that, output
+    is held, and once the buffer is full the rest is dropped and a truncation notice sent in its place.
+    Order across stdout and stderr is kept: the buffer is a list of same-stream runs, each sent as one message."""
+    def __init__(self, send, window=0.05, max_bytes=64*1024, max_rate=50, schedule=None, clock=time.monotonic):
+        self.send,self.window,self.max_bytes,self.max_rate,self.clock = send,window,max_bytes,max_rate,clock
+        self.schedule = schedule or asyncio.get_running_loop().call_later
+        self.runs,self.size,self.dropped,self.messages = [],0,0,0
+        self._sent = deque()  # send times within the last second
+        self._timer = None
+
+    def write(self, name, text):
+        if not text: return
+        if self.size >= self.max_bytes:
+            self.dropped += len(text)
+            return
+        if self.runs and self.runs[-1][0] == name: self.runs[-1][1].append(text)
+        else: self.runs.append((name, [text]))
+        self.size += len(text)
+        if self.size >= self.max_bytes and not self._wait(): self.flush()
+        elif not self._timer: self._timer = self.schedule(self.window, self._tick)
+
+    def _wait(self):
+        "Seconds until the rate limit allows another message."
+        now = self.clock()
+        while self._sent and now - self._sent[0] >= 1: self._sent.popleft()
+        return 0 if len(self._sent) < self.max_rate else 1 - (now - self._sent[0])
+
+    def _tick(self):
+        self._timer = None
+        if not self.runs: return
+        wait = self._wait()
+        if wait: self._timer = self.schedule(wait, self._tick)
+        else: self.flush()
+
+    def flush(self):
+        "Send everything buffered now, regardless of the rate limit."
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        runs,self.runs,self.size = self.runs,[],0
+        for name,parts in runs: self._send(name, ''.join(parts))
+        if self.dropped:
+            self._send('stderr', f'[Output truncated: {self.dropped} characters dropped to stay under {self.max_rate} messages/s]\n')
+            self.dropped = 0
+
+    def _send(self, name, text):
+        self.send(name, text)
+        self.messages += 1
+        self._sent.append(self.clock())
@@ -0,0 +1,133 @@
+"""Index of the session's symbols for completion and inspection without the LSP, updated once per executed cell."""
+import re
+from bisect import bisect_left, insort
+from itertools import chain
+from .completions import _is_subsequence, initials
+from .restore import _top_level_blocks
+
+_FN_RE = re.compile(r'^\s*(?:fn|def)\s+([A-Za-z_]\w*)\s*(?:\[[^\]]*\])?\s*\(([^)]*)\)')
+_TYPE_RE = re.compile(r'^\s*(?:struct|trait)\s+([A-Za-z_]\w*)')
+_VALUE_RE = re.compile(r'^\s*(?:var|let|alias|comptime)\s+([A-Za-z_]\w*)\s*(?::\s*([A-Za-z_]\w*))?(?:[^=]*=\s*([A-Za-z_]\w*)\s*[\[(])?')
+_IMPORT_RE = re.compile(r'^\s*(?:from\s+\S+\s+)?import\s+(.+)')
+_LOCAL_RE = re.compile(r'(?m)\b(?:var|let)\s+([A-Za-z_]\w*)')
+
+
+def _decl_line(block): return next((l for l in block.split('\n') if not l.lstrip().startswith('@')), '')
+
+
+def _fn_entry(m, method=False):
+    name,args = m.group(1),m.group(2).strip()
+    if method: args = re.sub(r'^(?:\w+\s+)?self\b\s*(?::[^,]*)?,?\s*', '', args)
+    return name,dict(type='function', signature=f'{name}({args})')
+
+
+def _members(block):
+    "Fields and methods declared directly in the body of a struct `block`."
+    body = [l for l in block.split('\n')[1:] if l.strip() and not l.lstrip().startswith(('@', '#'))]
+    if not body: return {}
+    indent = len(body[0]) - len(body[0].lstrip())
+    res = {}
+    for l in body:
+        if len(l) - len(l.lstrip()) != indent: continue
+        if m := _FN_RE.match(l):
+            name,entry = _fn_entry(m, method=True)
+            res[name] = entry
+        elif m := _VALUE_RE.match(l): res[m.group(1)] = dict(type='instance', signature=f'{m.group(1)}: {m.group(2)}' if m.group(2) else '')
+    return res
+
+
+def declarations(code):
+    """(name, entry, type name of the value or None) for the top-level declarations of `code`; entries are
+    dict(type=..., signature=...) as used in completion metadata, and struct entries carry `members`."""
+    res = []
+    for b in _top_level_blocks(code):
+        line = _decl_line(b)
+        if m := _FN_RE.match(line): res.append((*_fn_entry(m), None))
+        elif m := _TYPE_RE.match(line): res.append((m.group(1), dict(type='class', members=_members(b)), None))
+        elif m := _VALUE_RE.match(line): res.append((m.group(1), dict(type='instance'), m.group(2) or m.group(3)))
+        elif m := _IMPORT_RE.match(line):
+            for o in m.group(1).split(','):
+                name = o.split(' as ')[-1].strip().split('.')[0]
+                if name.isidentifier(): res.append((name, dict(type='module'), None))
+    return res
+
+
+class SymbolIndex:
+    """Symbols of the executed cells, by name, with the names also kept sorted so a prefix query is a bisect plus
+    the matches: O(log n + k) however long the session. `add` updates it with a cell's declarations; a later
+    definition replaces an earlier one. Struct entries hold their fields and methods for member completion, and
+    `var_types` maps variables to the struct they were declared as or constructed from. `match` ranks as
+    `MatchIndex` does, from (lowercased name, name) and (initials, name) lists kept sorted alongside `names`."""
+    def __init__(self, builtins=None):
+        self.builtins = dict(builtins or {})
+        self.clear()
+
+    def add(self, code):
+        for name,entry,tname in declarations(code): self.put(name, entry, tname)
+
+    def put(self, name, entry, tname=None):
+        if name not in self.symbols: self._index(name)
+        self.symbols[name] = entry
+        if tname: self.var_types[name] = tname
+        else: self.var_types.pop(name, None)
+
+    def clear(self):
+        self.symbols = {k: dict(type='function', signature=v) for k,v in self.builtins.items()}
+        self.names,self._lower,self._initials,self.var_types = [],[],[],{}
+        for name in self.symbols: self._index(name)
+
+    def _index(self, name):
+        insort(self.names, name)
+        insort(self._lower, (name.lower(), name))
+        insort(self._initials, (initials(name), name))
+
+    def prefixed(self, prefix, limit=None):
+        "The names starting with `prefix`, sorted, at most `limit`."
+        res = []
+        for i in range(bisect_left(self.names, prefix), len(self.names)):
+            if not self.names[i].startswith(prefix) or len(res) == limit: break
+            res.append(self.names[i])
+        return res
+
+    def match(self, prefix, limit=None):
+        """The names matching `prefix`, ranked as by `MatchIndex`, in sorted-list order within a tier. Each tier is
+        a bisect plus its matches, stopping at `limit`; subsequences are only looked for among the names with the
+        same first letter."""
+        res = self.prefixed(prefix, limit)
+        if not prefix: return res
+        lp,seen = prefix.lower(),set(res)
+        tiers = [(n for _,n in _starting(self._lower, lp))]
+        if len(prefix) > 1: tiers += [(n for _,n in _starting(self._initials, lp)),
+                                      (n for low,n in _starting(self._lower, lp[0]) if _is_subsequence(lp, low))]
+        for n in chain(*tiers):
+            if limit and len(res) >= limit: break
+            if n not in seen:
+                seen.add(n)
+                res.append(n)
+        return res
+
+    def get(self, name, cell=None):
+        "The entry for `name`, looked up in `cell` (a `cell_symbols` index) first."
+        return (cell.symbols.get(name) if cell else None) or self.symbols.get(name)
+
+    def members(self, name, cell=None):
+        "Fields and methods of the struct `name` is, or is an instance of."
+        tname = (cell.var_types.get(name) if cell else None) or self.var_types.get(name, name)
+        return (self.get(tname, cell) or {}).get('members', {})
+
+
+def _starting(pairs, prefix):
+    "Lazily, the (key, name) items of sorted `pairs` whose key starts with `prefix`: a bisect, then a walk."
+    i = bisect_left(pairs, (prefix,))
+    while i < len(pairs) and pairs[i][0].startswith(prefix):
+        yield pairs[i]
+        i += 1
+
+
+def cell_symbols(code):
+    "Index of a cell not yet executed, including the variables declared inside its functions."
+    res = SymbolIndex()
+    res.add(code)
+    for m in _LOCAL_RE.finditer(code):
+        if m.group(1) not in res.symbols: res.put(m.group(1), dict(type='instance'))
+    return res
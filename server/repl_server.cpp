@@ -1,12 +1,38 @@
 // Mojo REPL server using EvaluateExpression with REPL mode enabled.
 // This gives full var/let persistence without PTY or text parsing.
 // JSON protocol on stdin/stdout.
-
+//
+// With --zygote, the server instead listens on a Unix socket and forks one
+// server child per connection, after doing the fork-safe part of startup once.
+// The kernel opens by passing its stderr pipe, then {"root","cwd","env"}, so
+// the child runs as if the kernel had started it, and only with the Mojo root the zygote preloaded.
+
+#include <atomic>
+#include <algorithm>
+#include <chrono>
+#include <cerrno>
+#include <cmath>
 #include <cstdlib>
 #include <cstring>
+#include <fstream>
 #include <iostream>
+#include <map>
+#include <mutex>
 #include <sstream>
 #include <string>
+#include <thread>
+#include <vector>
+
+#include <climits>
+#include <dlfcn.h>
+#include <fcntl.h>
+#include <signal.h>
+#include <sys/stat.h>
+#include <sys/mman.h>
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <time.h>
+#include <unistd.h>
 
 #include <lldb/API/SBDebugger.h>
 #include <lldb/API/SBTarget.h>
@@ -28,9 +54,96 @@
 using namespace lldb;
 using json = nlohmann::json;
 
+// Wire format. JSON mode: one JSON object per line. Framed mode (negotiated
+// with a "protocol" request after the ready handshake): two little-endian
+// uint32s (metadata length, blob count), the JSON metadata, then each blob as
+// a little-endian uint64 length plus raw bytes. metadata["blobs"] names the
+// blobs, so code and output never go through JSON escaping.
+static bool framed = false;
+static const char *const blob_keys[] = {"code", "stdout", "stderr", "text"};
+
+static void put_le(std::string &out, uint64_t v, int n) {
+    for (int i = 0; i < n; i++) out.push_back(static_cast<char>((v >> (8 * i)) & 0xff));
+}
+
+static uint64_t get_le(const char *p, int n) {
+    uint64_t v = 0;
+    for (int i = 0; i < n; i++) v |= static_cast<uint64_t>(static_cast<unsigned char>(p[i])) << (8 * i);
+    return v;
+}
+
+// Responses and stream frames can be written from the output pump thread
+// while the main thread is evaluating, so all protocol output goes through here.
+static std::mutex out_mutex;
+
+static void emit(json msg) {
+    if (!framed) {
+        auto line = msg.dump(-1, ' ', false, json::error_handler_t::replace);
+        std::lock_guard<std::mutex> lock(out_mutex);
+        std::cout << line << "\n" << std::flush;
+        return;
+    }
+    std::vector<std::string> blobs;
+    auto names = json::array();
+    for (auto key : blob_keys) {
+        auto it = msg.find(key);
+        if (it == msg.end() || !it->is_string()) continue;
+        names.push_back(key);
+        blobs.push_back(std::move(it->get_ref<std::string&>()));
+        msg.erase(key);
+    }
+    msg["blobs"] = names;
+    auto meta = msg.dump(-1, ' ', false, json::error_handler_t::replace);
+    std::string head;
+    put_le(head, meta.size(), 4);
+    put_le(head, blobs.size(), 4);
+    std::lock_guard<std::mutex> lock(out_mutex);
+    std::cout.write(head.data(), head.size());
+    std::cout.write(meta.data(), meta.size());
+    for (auto &b : blobs) {
+        std::string len;
+        put_le(len, b.size(), 8);
+        std::cout.write(len.data(), len.size());
+        std::cout.write(b.data(), b.size());
+    }
+    std::cout << std::flush;
+}
+
+// Read the next request in the current wire format. Returns false at EOF;
+// throws json::parse_error on bad metadata (after consuming the whole frame).
+static bool read_request(json &req) {
+    if (!framed) {
+        std::string line;
+        while (std::getline(std::cin, line)) {
+            if (line.empty()) continue;
+            req = json::parse(line);
+            return true;
+        }
+        return false;
+    }
+    char head[8];
+    if (!std::cin.read(head, sizeof(head))) return false;
+    std::string meta(get_le(head, 4), '\0');
+    auto nblobs = get_le(head + 4, 4);
+    if (!std::cin.read(&meta[0], meta.size())) return false;
+    std::vector<std::string> blobs;
+    for (uint64_t i = 0; i < nblobs; i++) {
+        char len[8];
+        if (!std::cin.read(len, sizeof(len))) return false;
+        std::string blob(get_le(len, 8), '\0');
+        if (!std::cin.read(&blob[0], blob.size())) return false;
+        blobs.push_back(std::move(blob));
+    }
+    req = json::parse(meta);
+    auto names = req.value("blobs", json::array());
+    for (size_t i = 0; i < blobs.size() && i < names.size(); i++)
+        if (names[i].is_string()) req[names[i].get<std::string>()] = std::move(blobs[i]);
+    return true;
+}
+
 [[noreturn]] static void die(const std::string &msg) {
     std::cerr << msg << "\n";
-    std::cout << json{{"status", "error"}, {"message", msg}} << "\n" << std::flush;
+    emit(json{{"status", "error"}, {"message", msg}});
     std::exit(1);
 }
 
@@ -42,6 +155,191 @@ static std::string drain(SBProcess &proc, size_t (SBProcess::*fn)(char*, size_t)
     return out;
 }
 
+// How much of a cell's output reaches the client, from the request's
+// output_limit (bytes, 0 = everything), output_tail, spill_dir and
+// spill_limit (bytes kept in the spill file, 0 = no cap) fields.
+struct OutputPolicy {
+    size_t limit = 0, tail = 0, spill_limit = 0;
+    std::string dir;
+};
+
+static OutputPolicy output_policy(const json &req) {
+    OutputPolicy p;
+    p.limit = req.value("output_limit", static_cast<size_t>(0));
+    p.tail = req.value("output_tail", static_cast<size_t>(4096));
+    p.spill_limit = req.value("spill_limit", static_cast<size_t>(0));
+    p.dir = req.value("spill_dir", std::string());
+    if (p.dir.empty()) p.dir = std::string(getenv("TMPDIR") ? getenv("TMPDIR") : "/tmp") + "/mojokernel-" + std::to_string(getuid());
+    return p;
+}
+
+// Set by SIGINT (ServerEngine.interrupt); acted on by the output pump, since
+// LLDB must not be called from a signal handler.
+static std::atomic<bool> interrupt_requested{false};
+// Also set by SIGINT; stops the rest of an execute_batch after the current cell.
+static std::atomic<bool> batch_cancelled{false};
+
+// Session variables for the kernel's variable explorer. Each is read once from
+// LLDB's persistent REPL variables into an SBValue, cached until the next execute, and its children are
+// fetched lazily a page at a time, so a List of millions of elements costs
+// only the page being looked at.
+static std::map<std::string, SBValue> variable_cache;
+
+static void on_sigint(int) { interrupt_requested = true; batch_cancelled = true; }
+
+// Length of the longest prefix of s that does not end in a partial UTF-8
+// sequence, so a chunk boundary never splits a multi-byte character.
+static size_t utf8_complete_len(const std::string &s) {
+    size_t n = s.size(), i = n;
+    while (i > 0 && n - i < 4 && (static_cast<unsigned char>(s[i-1]) & 0xC0) == 0x80) i--;
+    if (i == 0) return n;
+    auto lead = static_cast<unsigned char>(s[i-1]);
+    size_t need = lead >= 0xF0 ? 4 : lead >= 0xE0 ? 3 : lead >= 0xC0 ? 2 : 1;
+    return n - (i - 1) >= need ? n : i - 1;
+}
+
+// Holds a cell to its output budget. The first `limit` bytes of stdout and
+// stderr together pass through to the client. Once the budget is spent, the
+// whole output (head included) goes to a spill file instead, and only the last
+// `tail` bytes stay in memory for the preview, so a runaway print loop costs
+// disk rather than memory in the server, the kernel and the browser. The file
+// stops growing at `spill_limit` bytes, so it can't fill the disk either.
+class CellOutput {
+public:
+    explicit CellOutput(const OutputPolicy &policy) : policy(policy) {}
+    ~CellOutput() { if (fd >= 0) close(fd); }
+    CellOutput(const CellOutput &) = delete;
+    CellOutput &operator=(const CellOutput &) = delete;
+
+    // The part of `text` (whole UTF-8 characters) that fits in the budget.
+    std::string admit(std::string text) {
+        total += text.size();
+        if (!policy.limit) return text;
+        std::string pass;
+        if (!spilled) {
+            size_t room = policy.limit - shown;
+            if (text.size() <= room) pass = std::move(text);
+            else {
+                pass = text.substr(0, utf8_complete_len(text.substr(0, room)));
+                text.erase(0, pass.size());
+                spill(head + pass);
+                head.clear();
+                head.shrink_to_fit();
+            }
+            shown += pass.size();
+            if (!spilled) { head += pass; return pass; }
+        }
+        spill(text);
+        return pass;
+    }
+
+    // {"path","bytes","shown","written","tail"} once the budget was exceeded, else null.
+    json summary() const {
+        if (!spilled) return nullptr;
+        size_t skip = 0;
+        while (skip < tail.size() && (static_cast<unsigned char>(tail[skip]) & 0xC0) == 0x80) skip++;
+        return {{"path", path}, {"bytes", total}, {"shown", shown}, {"written", written}, {"tail", tail.substr(skip)}};
+    }
+
+private:
+    void spill(const std::string &text) {
+        if (!spilled) {
+            spilled = true;
+            // Only into a directory of our own: another user's could be read, or swapped under us.
+            mkdir(policy.dir.c_str(), 0700);
+            struct stat st;
+            if (lstat(policy.dir.c_str(), &st) == 0 && S_ISDIR(st.st_mode) && st.st_uid == getuid()) {
+                std::string tmpl = policy.dir + "/output-XXXXXX";
+                fd = mkstemp(tmpl.data());
+                if (fd >= 0) path = tmpl;
+            }
+        }
+        size_t want = text.size();
+        if (policy.spill_limit) want = std::min(want, policy.spill_limit - written);
+        for (size_t off = 0; fd >= 0 && off < want;) {
+            auto n = write(fd, text.data() + off, want - off);
+            if (n < 0 && errno == EINTR) continue;
+            if (n <= 0) { close(fd); fd = -1; break; }  // disk full: keep counting, stop writing
+            off += n;
+            written += n;
+        }
+        tail += text;
+        if (tail.size() > policy.tail) tail.erase(0, tail.size() - policy.tail);
+    }
+
+    OutputPolicy policy;
+    size_t total = 0, shown = 0, written = 0;
+    bool spilled = false;
+    int fd = -1;
+    std::string head, tail, path;
+};
+
+// Polls the process stdout/stderr while an expression runs and forwards what
+// it finds as {"type":"stream"} frames tagged with the request id (and the cell
+// index inside an execute_batch), within the cell's output budget. Whatever is
+// still buffered when the pump stops is collected for the final response.
+class OutputPump {
+public:
+    OutputPump(SBProcess &process, CellOutput &sink, int id, int cell = -1)
+        : process(process), sink(sink), id(id), cell(cell), thread([this] { run(); }) {}
+    ~OutputPump() { stop(); }
+
+    void stop() {
+        if (done.exchange(true)) return;
+        thread.join();
+    }
+
+    // After stop(): the rest of a stream that fits in the budget, including any
+    // partial character held back by the pump.
+    std::string collect(const char *name) {
+        bool out = name == std::string("stdout");
+        std::string res;
+        read(out, [&](std::string text) { res += text; });
+        auto &carry = out ? out_carry : err_carry;
+        res += sink.admit(std::move(carry));
+        carry.clear();
+        return res;
+    }
+
+private:
+    void run() {
+        while (!done) {
+            if (interrupt_requested.exchange(false)) process.SendAsyncInterrupt();
+            for (bool out : {true, false}) read(out, [&](std::string text) { forward(out ? "stdout" : "stderr", text); });
+            std::this_thread::sleep_for(std::chrono::milliseconds(20));
+        }
+    }
+
+    // Reads a stream in 64KB chunks, passing the budgeted, character-complete part of each to `fn`.
+    template <class F> void read(bool out, F fn) {
+        auto get = out ? &SBProcess::GetSTDOUT : &SBProcess::GetSTDERR;
+        auto &carry = out ? out_carry : err_carry;
+        char buf[65536];
+        size_t n;
+        while ((n = (process.*get)(buf, sizeof(buf))) > 0) {
+            auto text = carry + std::string(buf, n);
+            auto k = utf8_complete_len(text);
+            carry = text.substr(k);
+            text.resize(k);
+            text = sink.admit(std::move(text));
+            if (!text.empty()) fn(std::move(text));
+        }
+    }
+
+    void forward(const char *name, const std::string &text) {
+        json frame = {{"id", id}, {"type", "stream"}, {"name", name}, {"text", text}};
+        if (cell >= 0) frame["cell"] = cell;
+        emit(std::move(frame));
+    }
+
+    SBProcess &process;
+    CellOutput &sink;
+    int id, cell;
+    std::string out_carry, err_carry;
+    std::atomic<bool> done{false};
+    std::thread thread;
+};
+
 static std::vector<std::string> split_lines(const std::string &s) {
     std::vector<std::string> lines;
     std::istringstream ss(s);
@@ -56,16 +354,48 @@ static lldb_private::EvaluateExpressionOptions& get_internal(SBExpressionOptions
     return **reinterpret_cast<std::unique_ptr<lldb_private::EvaluateExpressionOptions>*>(&opts);
 }
 
+// Timings for one cell. LLDB's sync EvaluateExpression gives no hook between compiling the expression
+// and running it, so the call is timed as a whole (eval_ms), next to the CPU time this thread spent in
+// it (cpu_ms). cpu_ms is not compile time: compile work on MLIR/LLVM threads and I/O waits aren't in it.
+static double thread_cpu_ms() {
+    timespec ts;
+    clock_gettime(CLOCK_THREAD_CPUTIME_ID, &ts);
+    return ts.tv_sec * 1e3 + ts.tv_nsec / 1e6;
+}
+
+static double ms_between(std::chrono::steady_clock::time_point a, std::chrono::steady_clock::time_point b) {
+    return std::chrono::duration<double, std::milli>(b - a).count();
+}
+
+static double round1(double ms) { return std::round(ms * 10) / 10; }
+
 static json handle_execute(const std::string &code,
+                           int id,
                            SBTarget &target,
                            SBProcess &process,
-                           SBExpressionOptions &opts) {
+                           SBExpressionOptions &opts,
+                           const OutputPolicy &policy,
+                           int cell = -1) {
     if (code.empty())
         return {{"status", "ok"}, {"stdout", ""}, {"stderr", ""}, {"value", ""}};
 
+    interrupt_requested = false;
+    variable_cache.clear();
+    CellOutput sink(policy);
+    OutputPump pump(process, sink, id, cell);
+    auto t0 = std::chrono::steady_clock::now();
+    double cpu0 = thread_cpu_ms();
     auto result = target.EvaluateExpression(code.c_str(), opts);
-    auto out = drain(process, &SBProcess::GetSTDOUT);
-    auto serr = drain(process, &SBProcess::GetSTDERR);
+    double cpu_ms = thread_cpu_ms() - cpu0;
+    auto t1 = std::chrono::steady_clock::now();
+    pump.stop();
+    auto out = pump.collect("stdout");
+    auto serr = pump.collect("stderr");
+    auto t2 = std::chrono::steady_clock::now();
+    json timing = {{"wall_ms", round1(ms_between(t0, t2))},
+                   {"eval_ms", round1(ms_between(t0, t1))},
+                   {"cpu_ms", round1(cpu_ms)},
+                   {"drain_ms", round1(ms_between(t1, t2))}};
 
     auto err = result.GetError();
     // Mojo EvaluateExpression always reports "unknown error" even on success.
@@ -76,30 +406,272 @@ static json handle_execute(const std::string &code,
     if (is_real_error) {
         std::string emsg = err.GetCString();
         auto tb = split_lines(emsg);
-        return {{"status", "error"}, {"stdout", out}, {"stderr", serr},
-                {"ename", "MojoError"},
-                {"evalue", tb.empty() ? emsg : tb[0]},
-                {"traceback", tb}};
+        json resp = {{"status", "error"}, {"stdout", out}, {"stderr", serr},
+                     {"ename", "MojoError"},
+                     {"evalue", tb.empty() ? emsg : tb[0]},
+                     {"traceback", tb}, {"timing", timing}};
+        if (auto spill = sink.summary(); !spill.is_null()) resp["spill"] = spill;
+        return resp;
     }
 
     std::string val;
     if (result.GetValue()) val = result.GetValue();
-    return {{"status", "ok"}, {"stdout", out}, {"stderr", serr}, {"value", val}};
+    json resp = {{"status", "ok"}, {"stdout", out}, {"stderr", serr}, {"value", val}, {"timing", timing}};
+    if (auto spill = sink.summary(); !spill.is_null()) resp["spill"] = spill;
+    return resp;
 }
 
-int main(int argc, char *argv[]) {
-    if (argc < 2) {
-        std::cerr << "Usage: mojo-repl-server <modular-root>\n";
-        return 1;
+// Runs cells in order under one request id, so a headless "run all" costs one
+// round trip. Each result has the same shape as an execute reply, with all
+// output sent as stream frames carrying the cell index. SIGINT stops the batch
+// after the running cell.
+static json handle_execute_batch(const json &cells,
+                                 bool stop_on_error,
+                                 int id,
+                                 SBTarget &target,
+                                 SBProcess &process,
+                                 SBExpressionOptions &opts,
+                                 const OutputPolicy &policy) {
+    json results = json::array();
+    batch_cancelled = false;
+    for (size_t i = 0; i < cells.size() && !batch_cancelled; i++) {
+        auto code = cells[i].is_string() ? cells[i].get<std::string>() : std::string();
+        auto r = handle_execute(code, id, target, process, opts, policy, static_cast<int>(i));
+        // Flush the cell's remaining output now, so streamed output stays in cell order.
+        for (const char *name : {"stdout", "stderr"}) {
+            auto text = r[name].get<std::string>();
+            if (!text.empty())
+                emit(json{{"id", id}, {"type", "stream"}, {"name", name}, {"text", text}, {"cell", i}});
+            r[name] = "";
+        }
+        bool failed = r["status"] != "ok";
+        results.push_back(std::move(r));
+        if (failed && stop_on_error) break;
     }
-    std::string root = argv[1];
-    auto entry_point = root + "/lib/mojo-repl-entry-point";
-    auto plugin_path = mojo_lldb_plugin(root);
+    return {{"status", "ok"}, {"results", std::move(results)}};
+}
+
+static json request_error(const std::string &ename, const std::string &evalue) {
+    return {{"status", "error"}, {"ename", ename}, {"evalue", evalue}, {"traceback", json::array()}};
+}
+
+// Integer held by an SBValue: the value itself or, for a struct wrapping one
+// (Mojo's Int and UnsafePointer), its first field, recursively. `vt` is set to
+// the value the number came from, so its type can be inspected.
+static bool value_number(SBValue v, uint64_t &out, SBValue *vt = nullptr) {
+    for (int depth = 0; v.IsValid() && depth < 4; depth++) {
+        SBError err;
+        out = v.GetValueAsUnsigned(err, 0);
+        if (err.Success()) {
+            if (vt) *vt = v;
+            return true;
+        }
+        if (!v.GetNumChildren()) break;
+        v = v.GetChildAtIndex(0);
+    }
+    return false;
+}
+
+static std::string eval_error(SBValue &v, const std::string &expr) {
+    auto err = v.GetError();
+    std::string msg = err.GetCString() ? err.GetCString() : "";
+    auto lines = split_lines(msg);
+    if (lines.empty() || msg == "unknown error") lines = {"no value"};
+    return "cannot evaluate `" + expr + "`: " + lines[0];
+}
 
+// Resolves a session buffer for %pull: evaluates the `pointer` and `length`
+// expressions in the REPL context and reports the address, the element count
+// and the type names NumPy's dtype is derived from.
+static json handle_buffer_info(const json &req, SBTarget &target, SBExpressionOptions &opts) {
+    auto pexpr = req.value("pointer", std::string()), lexpr = req.value("length", std::string());
+    auto ptr = target.EvaluateExpression(pexpr.c_str(), opts);
+    uint64_t addr, len;
+    SBValue raw;
+    if (!value_number(ptr, addr, &raw)) return request_error("BufferError", eval_error(ptr, pexpr));
+    auto lenv = target.EvaluateExpression(lexpr.c_str(), opts);
+    if (!value_number(lenv, len)) return request_error("BufferError", eval_error(lenv, lexpr));
+    auto pointee = raw.GetType().GetPointeeType();
+    return {{"status", "ok"}, {"address", addr}, {"length", len},
+            {"type", ptr.GetTypeName() ? ptr.GetTypeName() : ""},
+            {"pointee", pointee.IsValid() && pointee.GetName() ? pointee.GetName() : ""}};
+}
+
+// Maps the POSIX shared memory segment `name` (created by the kernel) and
+// hands the mapping to `fn(ptr)`, so inferior memory moves in one copy.
+template <class F> static json with_shm(const std::string &name, size_t size, F fn) {
+    int fd = shm_open(name.c_str(), O_RDWR, 0);
+    if (fd < 0) return request_error("BufferError", "shm_open " + name + ": " + strerror(errno));
+    void *p = size ? mmap(nullptr, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0) : nullptr;
+    close(fd);
+    if (p == MAP_FAILED) return request_error("BufferError", std::string("mmap: ") + strerror(errno));
+    auto resp = fn(static_cast<char *>(p));
+    if (p) munmap(p, size);
+    return resp;
+}
+
+static const size_t memory_chunk = 64 << 20;
+
+// Copies `size` bytes at inferior `address` into shared memory segment `shm`.
+static json handle_read_memory(const json &req, SBProcess &process) {
+    auto addr = req.value("address", static_cast<uint64_t>(0));
+    auto size = req.value("size", static_cast<size_t>(0));
+    return with_shm(req.value("shm", std::string()), size, [&](char *p) -> json {
+        SBError err;
+        for (size_t done = 0; done < size;) {
+            auto n = process.ReadMemory(addr + done, p + done, std::min(size - done, memory_chunk), err);
+            if (!n || err.Fail())
+                return request_error("BufferError", "read " + std::to_string(done) + " of " + std::to_string(size) +
+                                     " bytes at " + std::to_string(addr + done) + ": " + (err.GetCString() ? err.GetCString() : "failed"));
+            done += n;
+        }
+        return {{"status", "ok"}, {"bytes", size}};
+    });
+}
+
+// Copies `size` bytes from shared memory segment `shm` into the inferior at
+// `address`, or into a fresh read/write allocation there when address is 0.
+// The allocation lives until the process exits. Replies with the address.
+static json handle_write_memory(const json &req, SBProcess &process) {
+    auto addr = req.value("address", static_cast<uint64_t>(0));
+    auto size = req.value("size", static_cast<size_t>(0));
+    if (!addr) {
+        SBError err;
+        addr = process.AllocateMemory(std::max<size_t>(size, 1), ePermissionsReadable | ePermissionsWritable, err);
+        if (err.Fail() || addr == LLDB_INVALID_ADDRESS)
+            return request_error("BufferError", "cannot allocate " + std::to_string(size) + " bytes: " + (err.GetCString() ? err.GetCString() : "failed"));
+    }
+    return with_shm(req.value("shm", std::string()), size, [&](char *p) -> json {
+        SBError err;
+        for (size_t done = 0; done < size;) {
+            auto n = process.WriteMemory(addr + done, p + done, std::min(size - done, memory_chunk), err);
+            if (!n || err.Fail())
+                return request_error("BufferError", "wrote " + std::to_string(done) + " of " + std::to_string(size) +
+                                     " bytes at " + std::to_string(addr + done) + ": " + (err.GetCString() ? err.GetCString() : "failed"));
+            done += n;
+        }
+        return {{"status", "ok"}, {"address", addr}, {"bytes", size}};
+    });
+}
+
+// Follows the REPL's own __mojo_repl_UnsafePointer indirections (each context
+// field points at a pointer to the value) down to the value itself. A user's
+// UnsafePointer is left alone.
+static SBValue repl_pointee(SBValue v) {
+    for (int depth = 0; v.IsValid() && depth < 2; depth++) {
+        std::string type = v.GetTypeName() ? v.GetTypeName() : "";
+        if (type.rfind("__mojo_repl_UnsafePointer", 0) != 0) break;
+        auto p = v.GetType().IsPointerType() ? v : v.GetChildAtIndex(0);
+        auto d = p.Dereference();
+        if (!d.IsValid() || d.GetError().Fail()) break;
+        v = d;
+    }
+    return v;
+}
+
+// A session variable read straight out of LLDB's persistent REPL variables.
+// No code is evaluated, so a large value isn't copied and a non-copyable one
+// is still readable; the SBValue views the variable's memory in place.
+static SBValue session_variable(const std::string &name, SBTarget &target) {
+    auto it = variable_cache.find(name);
+    if (it != variable_cache.end()) return it->second;
+    auto frame = target.GetProcess().GetSelectedThread().GetSelectedFrame();
+    auto v = frame.FindValue(name.c_str(), eValueTypeConstResult);
+    if (!v.IsValid()) v = frame.FindValue(("`" + name + "`").c_str(), eValueTypeConstResult);
+    v = repl_pointee(v);
+    variable_cache[name] = v;
+    return v;
+}
+
+static bool readable(SBValue &v) { return v.IsValid() && v.GetError().Success(); }
+
+static json describe_value(SBValue v, const std::string &name) {
+    auto str = [](const char *s) { return s ? std::string(s) : std::string(); };
+    return {{"name", name}, {"type", str(v.GetTypeName())}, {"value", str(v.GetValue())},
+            {"summary", str(v.GetSummary())}, {"expandable", v.MightHaveChildren()}};
+}
+
+// Variable names: the fields of the newest (largest) REPL context struct,
+// plus any names the client already knows about. A context field whose value
+// can't be read is still listed, with its type and an "unavailable" summary.
+static json handle_variables(const json &req, SBTarget &target) {
+    std::vector<std::string> names;
+    std::map<std::string, std::string> field_types;
+    auto types = target.FindTypes("__mojo_repl_context__");
+    uint32_t best = 0;
+    for (uint32_t i = 0; i < types.GetSize(); i++)
+        if (types.GetTypeAtIndex(i).GetNumberOfFields() > types.GetTypeAtIndex(best).GetNumberOfFields()) best = i;
+    if (types.GetSize()) {
+        auto ctx = types.GetTypeAtIndex(best);
+        for (uint32_t i = 0; i < ctx.GetNumberOfFields(); i++) {
+            auto field = ctx.GetFieldAtIndex(i);
+            std::string n = field.GetName() ? field.GetName() : "";
+            n.erase(std::remove(n.begin(), n.end(), '`'), n.end());
+            if (n.empty()) continue;
+            names.push_back(n);
+            auto t = field.GetType().GetDisplayTypeName();
+            field_types[n] = t ? t : "";
+        }
+    }
+    for (auto &n : req.value("names", json::array()))
+        if (n.is_string() && std::find(names.begin(), names.end(), n.get<std::string>()) == names.end())
+            names.push_back(n.get<std::string>());
+    json vars = json::array();
+    for (auto &n : names) {
+        auto v = session_variable(n, target);
+        if (readable(v)) vars.push_back(describe_value(v, n));
+        else if (field_types.count(n))
+            vars.push_back({{"name", n}, {"type", field_types[n]}, {"value", ""},
+                            {"summary", "<unavailable>"}, {"expandable", false}});
+    }
+    return {{"status", "ok"}, {"variables", vars}};
+}
+
+// Children [offset, offset+count) of the value reached from variable `name`
+// through the child indices in `path`. "more" says whether any follow.
+static json handle_variable_children(const json &req, SBTarget &target) {
+    auto name = req.value("name", std::string());
+    auto v = session_variable(name, target);
+    if (!readable(v)) return request_error("VariableError", "no variable " + name);
+    std::string where = name;
+    for (auto &i : req.value("path", json::array())) {
+        if (!i.is_number_unsigned()) return request_error("VariableError", "bad path under " + where);
+        v = v.GetChildAtIndex(i.get<uint32_t>());
+        where += "[" + std::to_string(i.get<uint32_t>()) + "]";
+        if (!v.IsValid()) return request_error("VariableError", "no child " + where);
+    }
+    auto offset = req.value("offset", static_cast<uint32_t>(0));
+    auto count = req.value("count", static_cast<uint32_t>(100));
+    // Capped counts keep synthetic providers from materialising every element.
+    auto n = v.GetNumChildren(offset + count + 1);
+    json children = json::array();
+    for (uint32_t i = offset; i < std::min(n, offset + count); i++) {
+        auto c = v.GetChildAtIndex(i);
+        auto d = describe_value(c, c.GetName() ? c.GetName() : "[" + std::to_string(i) + "]");
+        d["index"] = i;
+        children.push_back(std::move(d));
+    }
+    return {{"status", "ok"}, {"children", children}, {"more", n > offset + count}};
+}
+
+static void set_mojo_env(const std::string &root) {
     setenv("MODULAR_MAX_PACKAGE_ROOT", root.c_str(), 1);
     setenv("MODULAR_MOJO_MAX_PACKAGE_ROOT", root.c_str(), 1);
     setenv("MODULAR_MOJO_MAX_DRIVER_PATH", (root + "/bin/mojo").c_str(), 1);
     setenv("MODULAR_MOJO_MAX_IMPORT_PATH", (root + "/lib/mojo").c_str(), 1);
+}
+
+static int serve(const std::string &root) {
+    auto entry_point = root + "/lib/mojo-repl-entry-point";
+    auto plugin_path = mojo_lldb_plugin(root);
+    // Startup phase timings, reported in the ready message.
+    auto t0 = std::chrono::steady_clock::now();
+    json startup;
+    auto phase = [&](const char *name) {
+        auto t = std::chrono::steady_clock::now();
+        startup[name] = round1(ms_between(t0, t));
+        t0 = t;
+    };
 
     SBDebugger::Initialize();
     auto debugger = SBDebugger::Create(false);
@@ -110,6 +682,7 @@ int main(int argc, char *argv[]) {
 
     auto ci = debugger.GetCommandInterpreter();
     SBCommandReturnObject cmd_result;
+    phase("init_ms");
     ci.HandleCommand(("plugin load " + plugin_path).c_str(), cmd_result);
     if (!cmd_result.Succeeded()) {
         std::string msg = "Failed to load MojoLLDB plugin";
@@ -123,6 +696,7 @@ int main(int argc, char *argv[]) {
         die("Mojo language not recognized - is libMojoLLDB loaded correctly?");
     debugger.SetREPLLanguage(mojo_lang);
     std::cerr << "Mojo language type: " << static_cast<int>(mojo_lang) << "\n";
+    phase("plugin_ms");
 
     SBError target_err;
     auto target = debugger.CreateTarget(entry_point.c_str(), "", "", true, target_err);
@@ -135,12 +709,14 @@ int main(int argc, char *argv[]) {
     auto bp = target.BreakpointCreateByName("mojo_repl_main");
     if (!bp.IsValid()) die("Failed to create breakpoint at mojo_repl_main");
     std::cerr << "Breakpoint set, " << bp.GetNumLocations() << " location(s)\n";
+    phase("target_ms");
 
     auto process = target.LaunchSimple(nullptr, nullptr, nullptr);
     if (!process.IsValid()) die("Failed to launch target process");
     if (process.GetState() != eStateStopped)
         die("Process not stopped after launch (state=" + std::to_string(process.GetState()) + ")");
     std::cerr << "Process launched and stopped at breakpoint\n";
+    phase("launch_ms");
 
     drain(process, &SBProcess::GetSTDOUT);
     drain(process, &SBProcess::GetSTDERR);
@@ -154,18 +730,16 @@ int main(int argc, char *argv[]) {
     get_internal(opts).SetREPLEnabled(true);
     std::cerr << "REPL mode enabled\n";
 
-    std::cout << json{{"status", "ready"}} << "\n" << std::flush;
-
-    std::string line;
-    while (std::getline(std::cin, line)) {
-        if (line.empty()) continue;
+    signal(SIGINT, on_sigint);
+    emit(json{{"status", "ready"}, {"protocols", {"json", "framed"}}, {"startup", startup}});
 
+    while (true) {
         json req;
-        try { req = json::parse(line); }
-        catch (const json::parse_error &e) {
-            std::cout << json{{"id", 0}, {"status", "error"},
-                {"ename", "ProtocolError"}, {"evalue", e.what()}, {"traceback", json::array()}}
-                << "\n" << std::flush;
+        try {
+            if (!read_request(req)) break;
+        } catch (const json::parse_error &e) {
+            emit(json{{"id", 0}, {"status", "error"},
+                {"ename", "ProtocolError"}, {"evalue", e.what()}, {"traceback", json::array()}});
             continue;
         }
 
@@ -174,14 +748,36 @@ int main(int argc, char *argv[]) {
 
         json resp;
         if (type == "execute") {
-            resp = handle_execute(req.value("code", ""), target, process, opts);
+            resp = handle_execute(req.value("code", ""), id, target, process, opts, output_policy(req));
+        } else if (type == "execute_batch") {
+            resp = handle_execute_batch(req.value("cells", json::array()), req.value("stop_on_error", true),
+                                        id, target, process, opts, output_policy(req));
+        } else if (type == "buffer_info") {
+            resp = handle_buffer_info(req, target, opts);
+        } else if (type == "read_memory") {
+            resp = handle_read_memory(req, process);
+        } else if (type == "write_memory") {
+            resp = handle_write_memory(req, process);
+        } else if (type == "variables") {
+            resp = handle_variables(req, target);
+        } else if (type == "variable_children") {
+            resp = handle_variable_children(req, target);
         } else if (type == "complete") {
             resp = {{"status", "ok"}, {"completions", json::array()}};
         } else if (type == "interrupt") {
             process.SendAsyncInterrupt();
             resp = {{"status", "ok"}};
+        } else if (type == "protocol") {
+            auto proto = req.value("protocol", "");
+            if (proto == "json" || proto == "framed") {
+                emit(json{{"id", id}, {"status", "ok"}, {"protocol", proto}});
+                framed = proto == "framed";
+                continue;
+            }
+            resp = {{"status", "error"}, {"ename", "ProtocolError"},
+                    {"evalue", "unknown protocol: " + proto}, {"traceback", json::array()}};
         } else if (type == "shutdown") {
-            std::cout << json{{"id", id}, {"status", "ok"}} << "\n" << std::flush;
+            emit(json{{"id", id}, {"status", "ok"}});
             break;
         } else {
             resp = {{"status", "error"}, {"ename", "ProtocolError"},
@@ -189,7 +785,7 @@ int main(int argc, char *argv[]) {
         }
 
         resp["id"] = id;
-        std::cout << resp << "\n" << std::flush;
+        emit(std::move(resp));
     }
 
     process.Destroy();
@@ -197,3 +793,141 @@ int main(int argc, char *argv[]) {
     SBDebugger::Terminate();
     return 0;
 }
+
+extern char **environ;
+
+// Uid of the process at the other end of Unix socket `fd`, or -1.
+static long peer_uid(int fd) {
+#ifdef __APPLE__
+    uid_t uid; gid_t gid;
+    return getpeereid(fd, &uid, &gid) == 0 ? static_cast<long>(uid) : -1;
+#else
+    ucred cred{};
+    socklen_t len = sizeof(cred);
+    return getsockopt(fd, SOL_SOCKET, SO_PEERCRED, &cred, &len) == 0 ? static_cast<long>(cred.uid) : -1;
+#endif
+}
+
+static std::string real_path(const std::string &p) {
+    char buf[PATH_MAX];
+    return realpath(p.c_str(), buf) ? std::string(buf) : p;
+}
+
+// In a forked child: read the kernel's {"root","cwd","env"} line and take on
+// its working directory and environment. False (after telling the kernel why)
+// when the kernel wants a different Mojo root than the one preloaded here.
+// The kernel opens its connection with one byte carrying (SCM_RIGHTS) the
+// write end of a pipe it reads as the server's stderr, as a directly spawned
+// server's stderr pipe would be. Only that byte is read, so the handshake
+// line after it is left for std::cin.
+static void adopt_kernel_stderr(int sock) {
+    char byte;
+    iovec iov{&byte, 1};
+    alignas(cmsghdr) char control[CMSG_SPACE(sizeof(int))];
+    msghdr msg{};
+    msg.msg_iov = &iov;
+    msg.msg_iovlen = 1;
+    msg.msg_control = control;
+    msg.msg_controllen = sizeof(control);
+    if (recvmsg(sock, &msg, 0) != 1) return;
+    auto *c = CMSG_FIRSTHDR(&msg);
+    if (!c || c->cmsg_level != SOL_SOCKET || c->cmsg_type != SCM_RIGHTS) return;
+    int fd;
+    std::memcpy(&fd, CMSG_DATA(c), sizeof(fd));
+    dup2(fd, STDERR_FILENO);
+    close(fd);
+}
+
+static bool adopt_kernel_context(const std::string &root) {
+    std::string line;
+    if (!std::getline(std::cin, line)) return false;
+    auto hello = json::parse(line, nullptr, false);
+    if (hello.is_discarded() || !hello.is_object()) {
+        emit(json{{"status", "error"}, {"message", "bad zygote handshake"}});
+        return false;
+    }
+    if (real_path(hello.value("root", "")) != real_path(root)) {
+        emit(json{{"status", "error"}, {"message", "zygote serves Mojo root " + root}});
+        return false;
+    }
+    auto cwd = hello.value("cwd", "");
+    if (!cwd.empty() && chdir(cwd.c_str()) != 0) std::cerr << "chdir failed: " << cwd << "\n";
+    if (hello.contains("env") && hello["env"].is_object()) {
+        std::vector<std::string> names;
+        for (char **e = environ; *e; e++) names.emplace_back(*e, std::strcspn(*e, "="));
+        for (auto &n : names) unsetenv(n.c_str());
+        for (auto &[k, v] : hello["env"].items())
+            if (v.is_string()) setenv(k.c_str(), v.get<std::string>().c_str(), 1);
+    }
+    set_mojo_env(root);
+    return true;
+}
+
+// Zygote: map and relocate libMojoLLDB and page in the entry point once, then
+// fork a server per connection. The children share those pages copy-on-write.
+// SBDebugger::Initialize and everything after it stay in the child: LLDB starts
+// threads and holds locks that do not survive fork().
+static int run_zygote(const std::string &socket_path, const std::string &root) {
+    auto plugin_path = mojo_lldb_plugin(root);
+    if (!dlopen(plugin_path.c_str(), RTLD_NOW | RTLD_GLOBAL))
+        die(std::string("Failed to preload MojoLLDB plugin: ") + dlerror());
+    std::ifstream entry(root + "/lib/mojo-repl-entry-point", std::ios::binary);
+    std::vector<char> page(1 << 20);
+    while (entry.read(page.data(), page.size()) || entry.gcount() > 0) {}
+    std::cerr << "Zygote preloaded " << plugin_path << "\n";
+
+    int fd = socket(AF_UNIX, SOCK_STREAM, 0);
+    if (fd < 0) die("socket() failed");
+    sockaddr_un addr{};
+    addr.sun_family = AF_UNIX;
+    if (socket_path.size() >= sizeof(addr.sun_path)) die("Socket path too long: " + socket_path);
+    std::strncpy(addr.sun_path, socket_path.c_str(), sizeof(addr.sun_path) - 1);
+    unlink(socket_path.c_str());
+    if (bind(fd, reinterpret_cast<sockaddr*>(&addr), sizeof(addr)) < 0) die("bind() failed: " + socket_path);
+    if (listen(fd, 16) < 0) die("listen() failed");
+    signal(SIGCHLD, SIG_IGN);  // children are never waited on by the zygote
+    std::cerr << "Zygote listening on " << socket_path << "\n";
+
+    while (true) {
+        int conn = accept(fd, nullptr, nullptr);
+        if (conn < 0) {
+            if (errno == EINTR) continue;
+            die("accept() failed");
+        }
+        // Only our own user's kernels: a child runs whatever cells it is sent, as us.
+        if (peer_uid(conn) != static_cast<long>(getuid())) {
+            std::cerr << "Zygote refused a connection from another user\n";
+            close(conn);
+            continue;
+        }
+        pid_t pid = fork();
+        if (pid == 0) {
+            close(fd);
+            signal(SIGCHLD, SIG_DFL);  // LLDB must be able to wait on its inferior
+            setsid();  // keep kernel interrupts away from the zygote
+            dup2(conn, STDIN_FILENO);
+            dup2(conn, STDOUT_FILENO);
+            close(conn);
+            adopt_kernel_stderr(STDIN_FILENO);
+            if (!adopt_kernel_context(root)) _exit(1);
+            emit(json{{"status", "forked"}, {"pid", getpid()}, {"root", root}});
+            return serve(root);
+        }
+        if (pid < 0) std::cerr << "fork() failed\n";
+        close(conn);
+    }
+}
+
+int main(int argc, char *argv[]) {
+    if (argc == 4 && std::string(argv[1]) == "--zygote") {
+        set_mojo_env(argv[3]);
+        return run_zygote(argv[2], argv[3]);
+    }
+    if (argc < 2) {
+        std::cerr << "Usage: mojo-repl-server <modular-root>\n"
+                  << "       mojo-repl-server --zygote <socket-path> <modular-root>\n";
+        return 1;
+    }
+    set_mojo_env(argv[1]);
+    return serve(argv[1]);
+}
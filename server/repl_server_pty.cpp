@@ -2,6 +2,7 @@
 // I/O redirected through a PTY pair. Provides JSON protocol on stdin/stdout.
 // This gives full var/let persistence (unlike HandleCommand approach).
 
+#include <cmath>
 #include <cstdlib>
 #include <cstring>
 #include <iostream>
@@ -9,7 +10,7 @@
 #include <string>
 #include <thread>
 #include <atomic>
-#include <regex>
+#include <cctype>
 #include <chrono>
 
 #include <unistd.h>
@@ -35,25 +36,119 @@
 using namespace lldb;
 using json = nlohmann::json;
 
-// --- ANSI/prompt patterns ---
-
-static const std::regex ANSI_RE(R"(\x1b\[[0-9;]*[A-Za-z]|\x1b\[\?[0-9;]*[A-Za-z])");
-static const std::regex PROMPT_PAT(R"(\n\s*\d+>\s)");
-static const std::regex PROMPT_LINE_RE(R"(^\s*\d+[>.]\s)");
-static const std::regex ECHO_RE(R"(\s+\d+[>]\s)");
-static const std::regex ERROR_RE(R"(error:)", std::regex::icase);
+// --- Output scanner ---
+
+static bool is_space(char c) { return c == ' ' || c == '\t' || c == '\v' || c == '\f'; }
+static bool is_digit(char c) { return c >= '0' && c <= '9'; }
+
+// Length of a leading `\s*\d+[<ends>]` followed by whitespace, including all of that trailing
+// whitespace, or npos. With ends=">" this is a prompt waiting for input; with ">." it also
+// matches continuation prompts.
+static size_t prompt_prefix(const std::string &s, const char *ends) {
+    size_t i = 0, n = s.size();
+    while (i < n && is_space(s[i])) i++;
+    size_t d = i;
+    while (i < n && is_digit(s[i])) i++;
+    if (i == d || i + 1 >= n || !std::strchr(ends, s[i]) || !is_space(s[i + 1])) return std::string::npos;
+    for (i++; i < n && is_space(s[i]); i++) {}
+    return i;
+}
 
-static std::string strip_ansi(const std::string &s) {
-    return std::regex_replace(s, ANSI_RE, "");
+// An echoed prompt anywhere in the line: whitespace, digits, '>', whitespace.
+static bool has_echo(const std::string &s) {
+    for (size_t i = 1; i < s.size(); i++) {
+        if (!is_digit(s[i]) || !is_space(s[i - 1])) continue;
+        size_t j = i;
+        while (j < s.size() && is_digit(s[j])) j++;
+        if (j + 1 < s.size() && s[j] == '>' && is_space(s[j + 1])) return true;
+        i = j;
+    }
+    return false;
 }
 
-static std::string replace_cr(const std::string &s) {
-    std::string r;
-    r.reserve(s.size());
-    for (char c : s) if (c != '\r') r += c;
-    return r;
+static bool has_error(const std::string &s) {
+    static const char pat[] = "error:";
+    for (size_t i = 0; i + 6 <= s.size(); i++) {
+        size_t k = 0;
+        while (k < 6 && std::tolower(static_cast<unsigned char>(s[i + k])) == pat[k]) k++;
+        if (k == 6) return true;
+    }
+    return false;
 }
 
+// Incremental scanner over REPL output (mirrors _OutputScanner in pexpect_engine.py).
+// It strips ANSI escapes and \r, splits lines and applies the parse rules to each
+// line as data arrives. It also notes when a prompt starts a line after the first
+// newline. Each byte is examined once, however many chunks the output arrives in.
+class OutputScanner {
+public:
+    void feed(const char *p, size_t n) {
+        for (size_t i = 0; i < n; i++) put(p[i]);
+        if (lines && prompt_prefix(line, ">") != std::string::npos) prompt = true;
+    }
+
+    bool prompt_seen() const { return prompt; }
+
+    json result() {
+        if (!line.empty()) end_line();
+        std::string out;
+        for (auto &l : output) out += l + "\n";
+        if (!errors.empty()) {
+            std::string evalue = errors[0];
+            if (evalue.substr(0, 7) == "[User] ") evalue = evalue.substr(7);
+            return {{"status", "error"}, {"stdout", out}, {"stderr", ""},
+                    {"ename", "MojoError"}, {"evalue", evalue}, {"traceback", errors}};
+        }
+        return {{"status", "ok"}, {"stdout", out}, {"stderr", ""}, {"value", ""}};
+    }
+
+private:
+    // ANSI escapes: ESC '[' ['?'] [0-9;]* letter. Anything else starting with ESC is kept as text.
+    void put(char c) {
+        if (esc.empty()) {
+            if (c == '\x1b') esc = c;
+            else text(c);
+            return;
+        }
+        bool csi = esc.size() > 1;
+        if (!csi && c == '[') { esc += c; return; }
+        if (csi && ((c == '?' && esc.size() == 2) || is_digit(c) || c == ';')) { esc += c; return; }
+        if (csi && std::isalpha(static_cast<unsigned char>(c))) { esc.clear(); return; }
+        for (char h : esc) text(h);
+        esc.clear();
+        put(c);
+    }
+
+    void text(char c) {
+        if (c == '\r') return;
+        if (c == '\n') end_line();
+        else line += c;
+    }
+
+    void end_line() {
+        if (lines++ && prompt_prefix(line, ">") != std::string::npos) prompt = true;
+        std::string l;
+        l.swap(line);
+        if (l.empty()) return;
+        auto pre = prompt_prefix(l, ">.");
+        auto stripped = pre == std::string::npos ? l : l.substr(pre);
+        if (has_error(stripped)) in_error = true;
+        if (in_error) {
+            stripped.erase(0, stripped.find_first_not_of(" \t"));
+            stripped.erase(stripped.find_last_not_of(" \t") + 1);
+            if (!stripped.empty() && stripped != "(null)") errors.push_back(stripped);
+            return;
+        }
+        if (pre != std::string::npos || has_echo(l)) return;
+        output.push_back(std::move(l));
+    }
+
+    std::string esc, line;
+    size_t lines = 0;
+    bool prompt = false, in_error = false;
+    std::vector<std::string> output, errors;
+};
+
 // --- PTY helpers ---
 
 static std::string read_pty(int fd, int timeout_ms) {
@@ -74,8 +169,9 @@ static std::string read_pty(int fd, int timeout_ms) {
     return buf;
 }
 
-static std::string read_until_prompt(int fd, int timeout_s = 30) {
-    std::string buf;
+// Feeds PTY output to `sc` until a prompt has appeared and 300ms pass with no more
+// output. Returns false on timeout.
+static bool read_until_prompt(int fd, OutputScanner &sc, int timeout_s = 30) {
     char chunk[65536];
     auto deadline = std::chrono::steady_clock::now() + std::chrono::seconds(timeout_s);
     auto prompt_time = std::chrono::steady_clock::time_point{};
@@ -91,74 +187,22 @@ static std::string read_until_prompt(int fd, int timeout_s = 30) {
         if (ret > 0 && (pfd.revents & POLLIN)) {
             ssize_t n = read(fd, chunk, sizeof(chunk));
             if (n > 0) {
-                buf.append(chunk, n);
-                auto clean = strip_ansi(buf);
-                if (prompt_time == std::chrono::steady_clock::time_point{} &&
-                    std::regex_search(clean, PROMPT_PAT)) {
+                sc.feed(chunk, n);
+                if (prompt_time == std::chrono::steady_clock::time_point{} && sc.prompt_seen())
                     prompt_time = std::chrono::steady_clock::now();
-                }
             }
             if (n <= 0 && (pfd.revents & POLLHUP)) break;
         } else if (ret == 0) {
             // timeout on poll
             if (prompt_time != std::chrono::steady_clock::time_point{}) {
                 auto elapsed = std::chrono::steady_clock::now() - prompt_time;
-                if (elapsed > std::chrono::milliseconds(300)) return strip_ansi(buf);
+                if (elapsed > std::chrono::milliseconds(300)) return true;
             }
         }
         if (pfd.revents & (POLLERR | POLLHUP)) break;
     }
 
-    if (prompt_time != std::chrono::steady_clock::time_point{})
-        return strip_ansi(buf);
-    return ""; // timeout
-}
-
-// --- Output parser (mirrors pexpect_engine.py logic) ---
-
-static bool is_prompt_line(const std::string &line) {
-    if (std::regex_search(line, PROMPT_LINE_RE)) return true;
-    if (std::regex_search(line, ECHO_RE)) return true;
-    return false;
-}
-
-static json parse_output(const std::string &raw) {
-    auto clean = replace_cr(raw);
-    std::istringstream ss(clean);
-    std::string line;
-    std::vector<std::string> output, errors;
-    bool in_error = false;
-
-    while (std::getline(ss, line)) {
-        if (line.empty()) continue;
-        // Strip prompt prefix if present
-        std::string stripped = line;
-        if (std::regex_search(line, PROMPT_LINE_RE))
-            stripped = std::regex_replace(line, std::regex(R"(^\s*\d+[>.]\s*)"), "");
-        if (std::regex_search(stripped, ERROR_RE)) in_error = true;
-        if (in_error) {
-            auto s = stripped;
-            // trim
-            s.erase(0, s.find_first_not_of(" \t"));
-            s.erase(s.find_last_not_of(" \t") + 1);
-            if (!s.empty() && s != "(null)") errors.push_back(s);
-            continue;
-        }
-        if (is_prompt_line(line)) continue;
-        output.push_back(line);
-    }
-
-    std::string stdout_str;
-    for (auto &l : output) stdout_str += l + "\n";
-
-    if (!errors.empty()) {
-        std::string evalue = errors[0];
-        if (evalue.substr(0, 7) == "[User] ") evalue = evalue.substr(7);
-        return {{"status", "error"}, {"stdout", stdout_str},
-                {"stderr", ""}, {"ename", "MojoError"},
-                {"evalue", evalue}, {"traceback", errors}};
-    }
-    return {{"status", "ok"}, {"stdout", stdout_str}, {"stderr", ""}, {"value", ""}};
+    return prompt_time != std::chrono::steady_clock::time_point{};
 }
 
 // --- Main ---
@@ -202,6 +246,15 @@ int main(int argc, char *argv[]) {
     struct winsize ws = {80, 120, 0, 0};
     ioctl(slave_fd, TIOCSWINSZ, &ws);
 
+    // Startup phase timings, reported in the ready message.
+    auto t0 = std::chrono::steady_clock::now();
+    json startup;
+    auto phase = [&](const char *name) {
+        auto t = std::chrono::steady_clock::now();
+        startup[name] = std::round(std::chrono::duration<double, std::milli>(t - t0).count() * 10) / 10;
+        t0 = t;
+    };
+
     // Initialize LLDB
     SBDebugger::Initialize();
     auto debugger = SBDebugger::Create(true);
@@ -227,6 +280,8 @@ int main(int argc, char *argv[]) {
     ci.HandleCommand("settings set stop-line-count-before 0", ret);
     ci.HandleCommand("settings set stop-line-count-after 0", ret);
 
+    phase("init_ms");
+
     // Load MojoLLDB plugin
     ci.HandleCommand(("plugin load " + plugin_path).c_str(), ret);
     if (!ret.Succeeded()) die("Failed to load MojoLLDB plugin");
@@ -236,6 +291,7 @@ int main(int argc, char *argv[]) {
     if (mojo_lang == eLanguageTypeUnknown) die("Mojo language not recognized");
     debugger.SetREPLLanguage(mojo_lang);
     std::cerr << "Mojo language type: " << static_cast<int>(mojo_lang) << "\n";
+    phase("plugin_ms");
 
     // Create target + breakpoint + launch
     SBError target_err;
@@ -245,11 +301,13 @@ int main(int argc, char *argv[]) {
     auto bp = target.BreakpointCreateByName("mojo_repl_main");
     if (!bp.IsValid()) die("Failed to create breakpoint");
     std::cerr << "Breakpoint set, " << bp.GetNumLocations() << " location(s)\n";
+    phase("target_ms");
 
     auto process = target.LaunchSimple(nullptr, nullptr, nullptr);
     if (!process.IsValid()) die("Failed to launch process");
     if (process.GetState() != eStateStopped) die("Process not stopped at breakpoint");
     std::cerr << "Process launched and stopped at breakpoint\n";
+    phase("launch_ms");
 
     // Drain any startup output from PTY
     read_pty(master_fd, 500);
@@ -266,12 +324,13 @@ int main(int argc, char *argv[]) {
 
     // Wait for initial REPL prompt
     std::cerr << "Waiting for REPL prompt...\n";
-    auto initial = read_until_prompt(master_fd, 30);
-    if (initial.empty()) die("Timed out waiting for REPL prompt");
+    OutputScanner initial;
+    if (!read_until_prompt(master_fd, initial, 30)) die("Timed out waiting for REPL prompt");
     std::cerr << "REPL ready\n";
+    phase("repl_ms");
 
     // Signal readiness
-    std::cout << json{{"status", "ready"}} << "\n" << std::flush;
+    std::cout << json{{"status", "ready"}, {"startup", startup}} << "\n" << std::flush;
 
     // Main JSON protocol loop
     std::string line;
@@ -318,13 +377,13 @@ int main(int argc, char *argv[]) {
                 write(master_fd, "\n", 1);
 
                 // Read until next prompt
-                auto raw = read_until_prompt(master_fd, 30);
-                if (raw.empty()) {
+                OutputScanner sc;
+                if (!read_until_prompt(master_fd, sc, 30)) {
                     resp = {{"status", "error"}, {"stdout", ""}, {"stderr", ""},
                             {"ename", "TimeoutError"}, {"evalue", "Expression timed out"},
                             {"traceback", json::array({"Expression evaluation timed out"})}};
                 } else {
-                    resp = parse_output(raw);
+                    resp = sc.result();
                 }
             }
         } else if (type == "complete") {
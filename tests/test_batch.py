@@ -0,0 +1,33 @@
+from mojokernel.batch import code_cells, run_notebook
+from mojokernel.engines.base import Engine, ExecutionResult
+
+
+class _EchoEngine(Engine):
+    "Prints each cell back; cells starting with `boom` fail."
+    def __init__(self): self.ran = []
+    def execute(self, code, on_output=None):
+        self.ran.append(code)
+        if code.startswith('boom'): return ExecutionResult(success=False, ename='MojoError', evalue=code, traceback=[code])
+        if on_output: on_output('stdout', code + '\n')
+        return ExecutionResult()
+
+
+def _nb(*sources): return dict(cells=[dict(cell_type='markdown', source='# hi')] + [dict(cell_type='code', source=s, outputs=[]) for s in sources])
+
+
+def test_code_cells_joins_sources():
+    nb = _nb(['var x = 1\n', 'print(x)'], 'print(2)')
+    assert code_cells(nb) == ['var x = 1\nprint(x)', 'print(2)']
+
+
+def test_run_notebook_fills_outputs_and_stops_on_error():
+    nb,e = _nb('a', 'boom', 'c'),_EchoEngine()
+    rs = run_notebook(nb, e, echo=False)
+    assert e.ran == ['a', 'boom']
+    assert [r.success for r in rs] == [True, False]
+    a,boom,c = nb['cells'][1:]
+    assert a['outputs'] == [dict(output_type='stream', name='stdout', text='a\n')] and a['execution_count'] == 1
+    assert boom['outputs'][0]['output_type'] == 'error'
+    assert c['outputs'] == []
+    run_notebook(nb, e, stop_on_error=False, echo=False)
+    assert c['outputs'][0]['text'] == 'c\n'
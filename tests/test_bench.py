@@ -0,0 +1,15 @@
+from mojokernel.bench import percentiles, summarize
+
+
+def test_percentiles_nearest_rank():
+    p = percentiles([5, 1, 4, 2, 3, 6, 7, 8, 9, 10])
+    assert (p['n'], p['min'], p['p50'], p['p90'], p['p99'], p['max'], p['mean']) == (10, 1, 5, 9, 10, 10, 5.5)
+    assert percentiles([7.5])['p50'] == 7.5
+
+
+def test_summarize_skips_failed_runs():
+    runs = [dict(import_ms=10, start_ms=100), dict(import_ms=20, start_ms=300, lsp_start_ms=50), dict(error='boom')]
+    s = summarize(runs)
+    assert s['runs'] == 3 and s['errors'] == ['boom']
+    assert s['phases']['start_ms']['max'] == 300
+    assert s['phases']['lsp_start_ms']['n'] == 1
@@ -0,0 +1,59 @@
+import pytest
+from types import SimpleNamespace
+from mojokernel.buffers import buffer_exprs, mojo_type, numpy_dtype
+
+
+def test_numpy_dtype_from_mojo_and_mlir_type_names():
+    assert numpy_dtype('Float64') == '<f8'
+    assert numpy_dtype('SIMD[float32, 1]') == '<f4'
+    assert numpy_dtype('SIMD[DType.uint8, 1]') == '|u1'
+    assert numpy_dtype('!pop.scalar<si16>') == '<i2'
+    assert numpy_dtype('UnsafePointer[Int, mut=True]') == '<i8'
+    assert numpy_dtype('Bool') == '|b1'
+    assert numpy_dtype('bfloat16') is None and numpy_dtype('String') is None
+
+
+def test_buffer_exprs():
+    assert buffer_exprs('xs') == ('xs.unsafe_ptr()', 'len(xs)')
+    assert buffer_exprs('p', 10) == ('p', '10')
+    with pytest.raises(ValueError): buffer_exprs('xs; print(1)')
+
+
+def test_mojo_type_for_numpy_dtypes():
+    assert mojo_type(SimpleNamespace(kind='f', itemsize=4)) == 'Float32'
+    assert mojo_type(SimpleNamespace(kind='u', itemsize=1)) == 'UInt8'
+    assert mojo_type(SimpleNamespace(kind='c', itemsize=16)) is None
+
+
+class _FakeEngine:
+    def buffer_info(self, pointer, length): return dict(address=64, length=3, type='List[Float32]', pointee='SIMD[float32, 1]')
+    def read_memory(self, address, size, shm):
+        from multiprocessing import shared_memory
+        m = shared_memory.SharedMemory(shm.lstrip('/'))
+        m.buf[:size] = bytes(size)
+        m.buf[:4] = b'\x00\x00\x80\x3f'  # 1.0f
+        m.close()
+
+
+def test_pull_maps_shared_memory_as_array():
+    np = pytest.importorskip('numpy')
+    from mojokernel.buffers import pull
+    arr = pull(_FakeEngine(), 'xs')
+    assert arr.array.dtype == np.float32 and arr.array.tolist() == [1.0, 0.0, 0.0]
+    arr.close()
+
+
+def test_push_copies_data_and_returns_binding():
+    np = pytest.importorskip('numpy')
+    from mojokernel.buffers import push
+    got = {}
+    class Engine:
+        def write_memory(self, size, shm):
+            from multiprocessing import shared_memory
+            m = shared_memory.SharedMemory(shm.lstrip('/'))
+            got['data'] = bytes(m.buf[:size])
+            m.close()
+            return dict(address=4096)
+    code = push(Engine(), 'ys', np.arange(3, dtype=np.int32))
+    assert got['data'] == np.arange(3, dtype=np.int32).tobytes()
+    assert code.startswith('var ys = Span[Int32, ') and 'unsafe_from_address=4096' in code and 'length=3' in code
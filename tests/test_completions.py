@@ -0,0 +1,31 @@
+from mojokernel.completions import CompletionCache, MatchIndex, initials
+
+
+def test_completion_cache_lru_and_versions():
+    c = CompletionCache(size=2)
+    c.put(1, ('a', False), 'pr', dict(items=[1]))
+    assert c.get(1, ('a', False), 'pri') == dict(items=[1])
+    assert c.get(1, ('a', False), 'p') is None and c.get(1, ('a', True), 'pri') is None
+    c.put(1, ('b', False), '', dict(items=[2]))
+    c.get(1, ('a', False), 'pr')
+    c.put(1, ('c', False), '', dict(items=[3]))
+    assert list(c.entries) == [('a', False), ('c', False)]
+    c.put(1, ('d', False), '', dict(isIncomplete=True, items=[]))
+    assert ('d', False) not in c.entries
+    assert c.get(2, ('a', False), 'pr') is None and not c.entries
+    c.note(True, 0.001)
+    c.note(False, 0.1)
+    c.note(False, 0.3)
+    assert c.stats() == dict(hits=1, misses=2, hit_rate=0.333, hit_ms=1.0, miss_ms=200.0, entries=0)
+
+
+def test_match_index_ranks_tiers():
+    assert [initials(o) for o in ('get_value', 'getValue', 'HTTPServer', '__init__')] == ['gv', 'gv', 'hs', 'i']
+    ix = MatchIndex(['gravity', 'get_value', 'GetVector', 'getValue', 'get_value', 'give', 'g'])
+    assert ix.names == ['gravity', 'get_value', 'GetVector', 'getValue', 'give', 'g']
+    assert ix.ranked('get') == ['get_value', 'getValue', 'GetVector']
+    assert ix.ranked('gv') == ['get_value', 'GetVector', 'getValue', 'gravity', 'give']
+    assert ix.ranked('gv', limit=2) == ['get_value', 'GetVector']
+    assert ix.ranked('g') == ['gravity', 'get_value', 'getValue', 'give', 'g', 'GetVector']
+    assert ix.ranked('') == ix.names and ix.ranked('', limit=1) == ['gravity']
+    assert ix.ranked('vg') == [] and ix.ranked('v') == []
@@ -1,8 +1,13 @@
-import logging, re, pytest, time
+import asyncio, json, logging, os, re, pytest, sys, threading, time
+from pathlib import Path
 import jupyter_client
 import mojokernel
+from mojokernel.engines.base import Engine, ExecutionResult
 from mojokernel.kernel import MojoKernel
 from mojokernel.lsp_client import LSPError
+from mojokernel.completions import CompletionCache
+from mojokernel.preamble import Preamble
+from mojokernel.symbols import SymbolIndex
 
 def test_version():
     v = mojokernel.__version__
@@ -46,6 +51,52 @@ def _run(kc, code, timeout=15):
         elif msg['msg_type'] == 'status' and msg['content']['execution_state'] == 'idle': break
     return ''.join(stdouts), errors
 
+# A real MojoKernel process whose engine runs the fake server of test_server_engine.
+_FAKE_SERVER_KERNEL = r'''
+import sys
+from mojokernel import kernel
+from mojokernel.engines.server_engine import ServerEngine
+from tests.test_server_engine import _FAKE_SERVER
+class FakeServerEngine(ServerEngine):
+    def start(self): self._launch([sys.executable, '-u', '-c', _FAKE_SERVER], None)
+kernel.make_engine = lambda logger=None: FakeServerEngine()
+from ipykernel.kernelapp import IPKernelApp
+IPKernelApp.launch_instance(kernel_class=kernel.MojoKernel, argv=sys.argv[1:])
+'''
+
+
+def _fake_server_kernel(tmp_path, interrupt_mode):
+    from jupyter_client.kernelspec import KernelSpecManager
+    spec = tmp_path / 'kernels' / 'mojo-fake'
+    spec.mkdir(parents=True)
+    argv = [sys.executable, '-c', _FAKE_SERVER_KERNEL, '-f', '{connection_file}']
+    (spec / 'kernel.json').write_text(json.dumps(dict(argv=argv, display_name='Mojo (fake)', language='mojo', interrupt_mode=interrupt_mode)))
+    km = jupyter_client.KernelManager(kernel_name='mojo-fake', kernel_spec_manager=KernelSpecManager(kernel_dirs=[str(spec.parent)]))
+    root = str(Path(__file__).resolve().parents[1])
+    km.start_kernel(cwd=root, env=dict(os.environ, PYTHONPATH=root, MOJO_KERNEL_LSP='0', MOJO_KERNEL_SESSION_LOG='0', MOJO_REPL_ZYGOTE='off'))
+    return km
+
+
+@pytest.mark.parametrize('interrupt_mode', ['signal', 'message'])
+def test_interrupt_stops_cell_and_kernel_survives(tmp_path, interrupt_mode):
+    km = _fake_server_kernel(tmp_path, interrupt_mode)
+    kc = km.client()
+    kc.start_channels()
+    try:
+        kc.wait_for_ready(timeout=30)
+        msg_id = kc.execute('sleep:30')
+        time.sleep(1)
+        km.interrupt_kernel()
+        reply = kc.get_shell_msg(timeout=10)
+        while reply['parent_header'].get('msg_id') != msg_id: reply = kc.get_shell_msg(timeout=10)
+        assert reply['content']['ename'] == 'Interrupted'
+        assert km.is_alive()
+        assert kc.execute_interactive('chunk:ok', timeout=10)['content']['status'] == 'ok'
+    finally:
+        kc.stop_channels()
+        km.shutdown_kernel(now=True)
+
+
 # -- Kernel output --
 
 def test_kernel_smoke_output_state_and_multiline(kc):
@@ -94,7 +145,21 @@ def test_kernel_completion_and_signature_e2e(kc):
     assert '_ktest_sig(' in txt
 
 
-class _WrapScopeOnlyLSP:
+class _Deferred:
+    def __init__(self, fn): self.fn = fn
+    def result(self, timeout=None): return self.fn()
+    def cancel(self): pass
+
+
+class _BlockingLSP:
+    "Fake LSP whose `submit` runs its blocking `complete`/`hover`/`signature_help` when the result is wanted."
+    _methods = dict(completion='complete', hover='hover', signatureHelp='signature_help')
+    def submit(self, method, text, pos, doc=None):
+        fn = getattr(self, self._methods[method.split('/')[1]])
+        return _Deferred(lambda: fn(text, pos))
+
+
+class _WrapScopeOnlyLSP(_BlockingLSP):
     def __init__(self): self.calls = []
 
     def _is_wrapped(self, text): return text.startswith('fn __mojokernel_cell__():\n')
@@ -141,7 +206,7 @@ class _WrapScopeOutdatedBurstLSP(_WrapScopeOnlyLSP):
         return dict(isIncomplete=False, items=[dict(label='sort', kind=2)])
 
 
-class _AlwaysTimeoutLSP:
+class _AlwaysTimeoutLSP(_BlockingLSP):
     def complete(self, text, cursor_offset): raise TimeoutError('LSP request timed out: textDocument/completion')
     def signature_help(self, text, cursor_offset): return dict(signatures=[])
     def hover(self, text, cursor_offset): return None
@@ -164,7 +229,7 @@ class _TimeoutThenRecoverLSP(_WrapScopeOnlyLSP):
     def restart(self): self.restart_calls += 1
 
 
-class _UnfilteredLSP:
+class _UnfilteredLSP(_BlockingLSP):
     def complete(self, text, cursor_offset):
         items = [dict(label='print', kind=3), dict(label='Int', kind=7), dict(label='len', kind=3), dict(insertText='println', kind=3), dict(label='pri_helper', kind=3)]
         return dict(isIncomplete=False, items=items)
@@ -173,19 +238,26 @@ class _UnfilteredLSP:
     def hover(self, text, cursor_offset): return None
 
 
-def _mk_kernel_for_lsp(lsp):
+def _mk_kernel_for_lsp(lsp, cache=0):
+    # No completion caching by default, so repeated completions reach the LSP.
     k = MojoKernel.__new__(MojoKernel)
     k.lsp = lsp
-    k._lsp_preamble = ''
+    k.preamble = Preamble()
+    k.symbols = SymbolIndex(MojoKernel._builtin_signatures)
+    k._completions = CompletionCache(size=cache)
     k.log = logging.getLogger('test-kernel-lsp')
     return k
 
 
+def _complete(k, *args): return asyncio.run(k.do_complete(*args))
+def _inspect(k, *args): return asyncio.run(k.do_inspect(*args))
+
+
 def test_do_complete_uses_wrapped_scope_fallback_for_member_completion():
     lsp = _WrapScopeOnlyLSP()
     k = _mk_kernel_for_lsp(lsp)
     code = 'var list = [2, 3, 5]\nlist.'
-    out = k.do_complete(code, len(code))
+    out = _complete(k, code, len(code))
     assert out['status'] == 'ok'
     assert 'sort' in out['matches']
     comp_calls = [o for o in lsp.calls if o['kind'] == 'complete']
@@ -197,7 +269,7 @@ def test_do_inspect_uses_wrapped_scope_fallback_for_signature():
     lsp = _WrapScopeOnlyLSP()
     k = _mk_kernel_for_lsp(lsp)
     code = 'var list = [2, 3, 5]\nlist.sort('
-    out = k.do_inspect(code, len(code))
+    out = _inspect(k, code, len(code))
     assert out['status'] == 'ok'
     assert out['found']
     assert out['data'].get('text/plain') == 'sort()'
@@ -211,25 +283,191 @@ def test_do_complete_repeated_member_completion_still_returns_matches():
     lsp = _WrapScopeOutdatedOnceLSP()
     k = _mk_kernel_for_lsp(lsp)
     code = 'var list = [2, 3, 5]\nlist.'
-    first = k.do_complete(code, len(code))
+    first = _complete(k, code, len(code))
     assert 'sort' in first.get('matches', [])
-    second = k.do_complete(code, len(code))
+    second = _complete(k, code, len(code))
     assert 'sort' in second.get('matches', [])
 
 
 def test_do_complete_filters_lsp_matches_by_prefix():
     k = _mk_kernel_for_lsp(_UnfilteredLSP())
-    out = k.do_complete('pri', 3)
+    out = _complete(k, 'pri', 3)
     assert out.get('matches', []) == ['print', 'println', 'pri_helper']
     typed = out.get('metadata', {}).get('_jupyter_types_experimental', [])
     assert [o.get('text') for o in typed] == ['print', 'println', 'pri_helper']
 
 
+def test_do_complete_ranks_fuzzy_lsp_matches_and_caps_them():
+    k = _mk_kernel_for_lsp(_UnfilteredLSP())
+    assert _complete(k, 'ph', 2)['matches'] == ['pri_helper']
+    assert _complete(k, 'in', 2)['matches'] == ['Int']
+    k._completion_limit = 2
+    out = _complete(k, 'pri', 3)
+    assert out['matches'] == ['print', 'println'] and len(out['metadata']['_jupyter_types_experimental']) == 2
+
+
+class _CountingLSP(_UnfilteredLSP):
+    def __init__(self): self.texts = []
+
+    def complete(self, text, cursor_offset):
+        self.texts.append(text)
+        return super().complete(text, cursor_offset)
+
+
+def test_do_complete_caches_and_narrows_by_prefix():
+    lsp = _CountingLSP()
+    k = _mk_kernel_for_lsp(lsp, cache=8)
+    assert _complete(k, 'x = 1\npri', 9)['matches'] == ['print', 'println', 'pri_helper']
+    out = _complete(k, 'x = 1\nprin', 10)
+    assert out['matches'] == ['print', 'println']
+    assert [o['text'] for o in out['metadata']['_jupyter_types_experimental']] == ['print', 'println']
+    assert _complete(k, 'x = 1\nprintln', 12)['matches'] == ['println']
+    assert len(lsp.texts) == 1
+    _complete(k, 'x = 2\nprin', 10)
+    _complete(k, 'x = 1\np', 7)
+    assert len(lsp.texts) == 3
+    k.preamble.add('fn f(): pass')
+    _complete(k, 'x = 1\nprin', 10)
+    assert len(lsp.texts) == 4 and lsp.texts[-1].startswith('fn f(): pass\n')
+    st = k._completions.stats()
+    assert (st['hits'], st['misses'], st['hit_rate']) == (2, 4, 0.333)
+
+
+class _Call:
+    def __init__(self, result=None, hang=False): self.res,self.hang,self.cancelled = result,hang,False
+    def result(self, timeout=None):
+        if self.hang:
+            time.sleep(timeout)
+            raise TimeoutError('LSP request timed out')
+        return self.res
+    def cancel(self): self.cancelled = True
+
+
+class _RaceLSP:
+    "LSP with `submit`: requests on the wrapped document answer, the rest hang until the deadline."
+    request_timeout = 0.2
+    def __init__(self): self.calls = []
+
+    def submit(self, method, text, pos, doc=None):
+        items = [dict(label='sort', kind=2)] if doc == 'cell' else []
+        res = dict(completion=dict(isIncomplete=False, items=items), hover=dict(contents='sort docs')).get(method.split('/')[1]) if doc == 'cell' else None
+        self.calls.append((method, doc, _Call(res, hang=doc != 'cell' or method.endswith('signatureHelp'))))
+        return self.calls[-1][2]
+
+
+def test_lsp_race_shares_one_deadline_and_cancels_losers():
+    lsp = _RaceLSP()
+    k = _mk_kernel_for_lsp(lsp)
+    code = 'var list = [2, 3, 5]\nlist.s'
+    out = _complete(k, code, len(code))
+    assert out['matches'] == ['sort']
+    assert [(m, d) for m,d,_ in lsp.calls] == [('textDocument/completion', 'cell'), ('textDocument/completion', None)]
+    assert lsp.calls[1][2].cancelled
+    lsp.calls = []
+    t0 = time.monotonic()
+    out = _inspect(k, code, len(code))
+    assert out['data'] == {'text/plain': 'sort docs'}
+    assert time.monotonic() - t0 < 0.35
+    assert [m.split('/')[1] for m,_,_ in lsp.calls] == ['signatureHelp', 'hover', 'signatureHelp', 'hover']
+    assert all(c.cancelled for _,_,c in lsp.calls)
+
+
+class _SlowLSP:
+    request_timeout = 0.4
+    def submit(self, method, text, pos, doc=None): return _Call(hang=True)
+
+
+class _TickingEngine(Engine):
+    def execute(self, code, on_output=None):
+        for i in range(8):
+            on_output('stdout', f'{i}\n')
+            time.sleep(0.05)
+        return ExecutionResult()
+
+
+def test_slow_lsp_does_not_stall_streaming_cell_output():
+    k = _mk_kernel_for_lsp(_SlowLSP())
+    k.engine,k.execution_count,k._session_log = _TickingEngine(),1,None
+    sent = []
+    k._send_stream = lambda name, text: sent.append(time.monotonic())
+    async def main():
+        cell = asyncio.create_task(k.do_execute('tick()', silent=False))
+        await asyncio.sleep(0.05)
+        t0 = time.monotonic()
+        await k.do_complete('pri', 3)
+        t1 = time.monotonic()
+        await cell
+        return t0,t1
+    t0,t1 = asyncio.run(main())
+    assert t1 - t0 >= 0.35 and len([t for t in sent if t0 < t < t1]) >= 3
+
+
+class _StaleCall(_Call):
+    def __init__(self, stale): super().__init__(); self.stale = stale
+    def result(self, timeout=None): raise LSPError(dict(code=-32801, message='outdated request'))
+
+
+class _OutdatedLSP:
+    request_timeout = 0.2
+    def __init__(self, stale): self.stale,self.calls = stale,[]
+    def submit(self, method, text, pos, doc=None):
+        self.calls.append(doc)
+        return _StaleCall(self.stale)
+
+
+def test_outdated_answers_are_retried_only_while_document_is_current():
+    for stale,n in ((True, 2), (False, 4)):
+        lsp = _OutdatedLSP(stale)
+        _complete(_mk_kernel_for_lsp(lsp), 'pri', 3)
+        assert len(lsp.calls) == n
+
+
+def test_superseded_requests_are_skipped():
+    lsp = _CountingLSP()
+    k = _mk_kernel_for_lsp(lsp)
+    k.get_parent = lambda channel='shell': dict(header=dict(msg_id='a'))
+    k._newest = dict(complete_request='b', inspect_request='a')
+    assert _complete(k, 'pri', 3)['matches'] == [] and not lsp.texts
+    assert _inspect(k, 'print', 5)['status'] == 'ok'
+    k._newest['complete_request'] = 'a'
+    assert _complete(k, 'pri', 3)['matches'] == ['print', 'println', 'pri_helper'] and lsp.texts
+
+
+def test_shell_main_queues_requests_without_ipykernel7_internals(monkeypatch):
+    from ipykernel.kernelbase import Kernel
+    assert MojoKernel._can_dispatch_concurrently  # the installed ipykernel has them
+    k = _mk_kernel_for_lsp(None)
+    k._newest,k._shell_header = {},lambda msg: dict(msg_type='complete_request', msg_id='a')
+    calls = []
+    async def base(self, subshell_id, msg): calls.append('queued')
+    async def dispatch(self, msg, subshell_id=None, concurrent=False): calls.append('concurrent')
+    monkeypatch.setattr(Kernel, 'shell_main', base)
+    monkeypatch.setattr(MojoKernel, 'dispatch_shell', dispatch)
+    monkeypatch.setattr(MojoKernel, '_can_dispatch_concurrently', False)
+    async def main():
+        k._main_asyncio_lock = asyncio.Lock()
+        await k._main_asyncio_lock.acquire()
+        await k.shell_main(None, [])
+    asyncio.run(main())
+    assert calls == ['queued'] and k._newest == dict(complete_request='a')
+
+
+def test_fallback_completion_uses_symbol_index():
+    k = _mk_kernel_for_lsp(None)
+    k.symbols.add('struct Point:\n    var x: Int\n    fn norm(self) -> Float64:\n        return 0\nvar pt = Point(1)\nfn plot(a: Int): pass')
+    out = _complete(k, 'var pk = 1\np', 12)
+    assert out['matches'] == ['pk', 'plot', 'print', 'pt', 'Point']  # exact-case prefix matches rank first
+    assert out['metadata']['_jupyter_types_experimental'][1]['signature'] == 'plot(a: Int)'
+    assert _complete(k, 'pt.n', 4)['matches'] == ['norm']
+    assert _complete(k, 'pt.', 3)['matches'] == ['norm', 'x']
+    assert _inspect(k, 'plot(', 5)['data'] == {'text/plain': 'plot(a: Int)'}
+
+
 def test_do_complete_member_prefix_uses_wrapped_first():
     lsp = _WrapScopeOnlyLSP()
     k = _mk_kernel_for_lsp(lsp)
     code = 'var list = [2, 3, 5]\nlist.s'
-    out = k.do_complete(code, len(code))
+    out = _complete(k, code, len(code))
     assert 'sort' in out.get('matches', [])
     comp_calls = [o for o in lsp.calls if o['kind'] == 'complete']
     assert comp_calls[0]['text'].startswith('fn __mojokernel_cell__():\n')
@@ -239,13 +477,13 @@ def test_do_complete_outdated_burst_falls_back_without_retry_loop():
     lsp = _WrapScopeOutdatedBurstLSP(3)
     k = _mk_kernel_for_lsp(lsp)
     code = 'var list = [2, 3, 5]\nlist.'
-    out = k.do_complete(code, len(code))
+    out = _complete(k, code, len(code))
     assert out.get('matches', []) == []
 
 
 def test_do_complete_includes_debug_metadata_when_member_completion_fails():
     k = _mk_kernel_for_lsp(_AlwaysTimeoutLSP())
-    out = k.do_complete('a.', 2)
+    out = _complete(k, 'a.', 2)
     dbg = out.get('metadata', {}).get('_mojokernel_debug', [])
     assert out['status'] == 'ok'
     assert out.get('matches', []) == []
@@ -255,6 +493,197 @@ def test_do_complete_includes_debug_metadata_when_member_completion_fails():
 def test_do_complete_timeout_does_not_restart_lsp():
     lsp = _TimeoutThenRecoverLSP()
     k = _mk_kernel_for_lsp(lsp)
-    out = k.do_complete('var list = [2, 3, 5]\nlist.', len('var list = [2, 3, 5]\nlist.'))
+    out = _complete(k, 'var list = [2, 3, 5]\nlist.', len('var list = [2, 3, 5]\nlist.'))
     assert out.get('matches', []) == []
     assert lsp.restart_calls == 0
+
+
+class _TimedEngine(Engine):
+    def execute(self, code, on_output=None): return ExecutionResult(timing=dict(wall_ms=5.0, eval_ms=5.0, cpu_ms=4.0, drain_ms=0.0))
+
+
+def test_execute_reply_metadata_includes_timing():
+    k = _mk_kernel_for_lsp(None)
+    k.engine = _TimedEngine()
+    k.execution_count = 1
+    assert asyncio.run(k.do_execute('var x = 1', silent=True))['status'] == 'ok'
+    assert k.finish_metadata({}, {}, {})['timing'] == dict(wall_ms=5.0, eval_ms=5.0, cpu_ms=4.0, drain_ms=0.0)
+    asyncio.run(k.do_execute('', silent=True))
+    assert 'timing' not in k.finish_metadata({}, {}, {})
+
+
+class _ReplayEngine(Engine):
+    def __init__(self): self.ran,self.alive,self.restarts = [],True,0
+    def execute(self, code, on_output=None):
+        if code == 'crash':
+            self.alive = False
+            raise RuntimeError('Server process died. stderr: ')
+        self.ran.append(code)
+        return ExecutionResult()
+    def restart(self): self.alive,self.restarts = True,self.restarts + 1
+
+
+def _mk_restore_kernel(tmp_path):
+    from mojokernel.restore import SessionLog
+    k = _mk_kernel_for_lsp(None)
+    k.engine,k.execution_count = _ReplayEngine(),1
+    k._session_log = SessionLog(tmp_path / 'session.jsonl')
+    return k
+
+
+def test_restore_magic_replays_logged_cells(tmp_path):
+    k = _mk_restore_kernel(tmp_path)
+    k._restorable = ['fn a(): pass', 'fn b(): pass', 'var x = 1']
+    assert asyncio.run(k.do_execute('%restore', silent=True))['status'] == 'ok'
+    assert k.engine.ran == ['fn a(): pass\n\nfn b(): pass', 'var x = 1']
+    assert k._session_log.cells() == ['fn a(): pass', 'fn b(): pass', 'var x = 1']
+    assert k._restorable == []
+    assert asyncio.run(k.do_execute('%nope', silent=True))['ename'] == 'UsageError'
+
+
+def test_unwritable_session_log_still_replies(tmp_path, caplog):
+    k = _mk_restore_kernel(tmp_path)
+    k._session_log.path = tmp_path / 'missing' / 'session.jsonl'
+    k.log = logging.getLogger('mojokernel-test')
+    out = asyncio.run(k.do_execute('var x = 1', silent=True))
+    assert out['status'] == 'ok' and 'session log not written' in caplog.text
+
+
+def test_engine_crash_restarts_and_makes_cells_restorable(tmp_path, monkeypatch):
+    monkeypatch.delenv('MOJO_KERNEL_AUTO_RESTORE', raising=False)
+    k = _mk_restore_kernel(tmp_path)
+    asyncio.run(k.do_execute('var x = 1', silent=True))
+    out = asyncio.run(k.do_execute('crash', silent=True))
+    assert out['ename'] == 'MojoServerDied' and '%restore' in out['evalue']
+    assert k.engine.restarts == 1 and k._restorable == ['var x = 1']
+    monkeypatch.setenv('MOJO_KERNEL_AUTO_RESTORE', '1')
+    asyncio.run(k.do_execute('crash', silent=True))
+    assert k.engine.ran == ['var x = 1', 'var x = 1'] and k._restorable == []
+
+
+def test_server_killed_between_cells_is_recovered(tmp_path, monkeypatch):
+    from tests.test_server_engine import _FakeServerEngine
+    monkeypatch.delenv('MOJO_KERNEL_AUTO_RESTORE', raising=False)
+    k = _mk_restore_kernel(tmp_path)
+    k.engine = _FakeServerEngine()
+    k.engine.start()
+    try:
+        assert asyncio.run(k.do_execute('chunk:ok', silent=True))['status'] == 'ok'
+        k.engine.proc.kill()
+        k.engine.proc.wait()
+        out = asyncio.run(k.do_execute('chunk:again', silent=True))
+        assert out['ename'] == 'MojoServerDied' and k._restorable == ['chunk:ok']
+        assert k.engine.alive and k.engine.execute('chunk:back').stdout == 'back'
+    finally: k.engine.shutdown()
+
+
+def test_shutdown_for_restart_stops_the_engine_and_its_pool(tmp_path):
+    from mojokernel.engines.pool import EnginePool
+    from tests.test_server_engine import _FakeServerEngine, _wait_for
+    k = _mk_restore_kernel(tmp_path)
+    pool = EnginePool(_FakeServerEngine, size=1)
+    k.engine,k._engine_ready,k.pulled,k._spills = _FakeServerEngine(pool=pool),None,{},[]
+    k.engine.start()
+    assert _wait_for(lambda: pool.ready == 1)
+    spare = pool._spares[0][0].proc
+    assert k.do_shutdown(restart=True) == dict(status='ok', restart=True)
+    assert not k.engine.alive and pool.ready == 0 and spare.wait(5) is not None
+
+
+class _SlowStartEngine(_ReplayEngine):
+    def __init__(self, fail=False):
+        super().__init__()
+        self.fail = fail
+    def start(self):
+        time.sleep(0.2)
+        if self.fail: raise FileNotFoundError('mojo-repl-server not found')
+
+
+def _start_in_background(engine):
+    k = _mk_kernel_for_lsp(None)
+    k.engine,k.execution_count = engine,1
+    k._engine_ready = threading.Event()
+    threading.Thread(target=k._start_engine, daemon=True).start()
+    return k
+
+
+def test_execute_waits_for_background_engine_start():
+    k = _start_in_background(_SlowStartEngine())
+    assert not k._engine_ready.is_set()
+    assert asyncio.run(k.do_execute('var x = 1', silent=True))['status'] == 'ok'
+    assert k.engine.ran == ['var x = 1']
+    assert k.preamble.text == 'var x = 1\n'
+
+
+def test_execute_reports_failed_engine_start():
+    k = _start_in_background(_SlowStartEngine(fail=True))
+    out = asyncio.run(k.do_execute('var x = 1', silent=True))
+    assert out['status'] == 'error' and out['ename'] == 'MojoEngineError'
+    assert 'mojo-repl-server not found' in out['evalue']
+
+
+class _LimitedEngine(_ReplayEngine):
+    def __init__(self): super().__init__(); self.timeout,self.idle_timeout,self.seen = None,60.0,[]
+    def execute(self, code, on_output=None):
+        self.seen.append((self.timeout, self.idle_timeout))
+        return super().execute(code, on_output)
+
+
+def test_timeout_magics_set_and_scope_limits():
+    k = _mk_kernel_for_lsp(None)
+    k.engine,k.execution_count = _LimitedEngine(),1
+    assert asyncio.run(k.do_execute('%timeout 300 --idle off', silent=True))['status'] == 'ok'
+    assert (k.engine.timeout, k.engine.idle_timeout) == (300, None)
+    assert asyncio.run(k.do_execute('%%timeout off --idle 5\ntrain()', silent=True))['status'] == 'ok'
+    assert k.engine.ran == ['train()'] and k.engine.seen == [(None, 5)]
+    assert (k.engine.timeout, k.engine.idle_timeout) == (300, None)
+    assert asyncio.run(k.do_execute('%%nope\nx', silent=True))['ename'] == 'UsageError'
+    k.engine = _ReplayEngine()
+    assert asyncio.run(k.do_execute('%timeout 5', silent=True))['status'] == 'error'
+
+
+class _SpillEngine(_ReplayEngine):
+    def __init__(self, path): super().__init__(); self.path = path
+    def execute(self, code, on_output=None):
+        self.path.write_text('x\n' * 40000)
+        return ExecutionResult(spill=dict(path=str(self.path), bytes=80000, shown=10, tail='x\n'))
+
+
+def test_spilled_output_shows_notice_and_pages(tmp_path):
+    k = _mk_kernel_for_lsp(None)
+    k.engine,k.execution_count = _SpillEngine(tmp_path / 'out'),1
+    sent = []
+    k._send_stream = lambda name, text: sent.append(text)
+    asyncio.run(k.do_execute('spam()', silent=False))
+    assert 'Output truncated' in sent[0] and str(tmp_path / 'out') in sent[0]
+    asyncio.run(k.do_execute('%page 2', silent=False))
+    assert sent[-1].endswith(f'[page 2/2 of {tmp_path / "out"}]\n') and sent[-1].startswith('x\n')
+
+
+class _VarEngine(_ReplayEngine):
+    def variables(self, names=()): return [dict(name=n, type='Int', value='1', summary='', expandable=False) for n in names]
+    def variable_children(self, name, path=(), offset=0, count=100):
+        if name != 'xs': raise KeyError(name)
+        return [dict(index=i, name=f'[{i}]', type='Int', value=str(i), summary='', expandable=False) for i in range(offset, offset + count)],True
+
+
+class _Comm:
+    def __init__(self): self.sent = []
+    def send(self, data): self.sent.append(data)
+
+
+def test_variables_comm_and_magic():
+    k = _mk_kernel_for_lsp(None)
+    k.engine,k.execution_count = _VarEngine(),1
+    k.preamble.add('var n = 1\nfn f():\n    var local = 2\nlet m = 3\n')
+    c = _Comm()
+    asyncio.run(k._variables_request(c, dict(request='variables', id=1)))
+    asyncio.run(k._variables_request(c, dict(request='children', name='xs', offset=5, count=2, id=2)))
+    asyncio.run(k._variables_request(c, dict(request='children', name='nope', id=3)))
+    assert [v['name'] for v in c.sent[0]['variables']] == ['n', 'm']
+    assert [o['index'] for o in c.sent[1]['children']] == [5, 6] and c.sent[1]['more']
+    assert c.sent[2]['id'] == 3 and c.sent[2]['error'].startswith('KeyError')
+    sent = []
+    k._send_stream = lambda name, text: sent.append(text)
+    asyncio.run(k.do_execute('%vars xs 20', silent=False))
+    assert sent[-1].startswith('[20]: Int = 20\n[21]: Int = 21') and '%vars xs 40' in sent[-1]
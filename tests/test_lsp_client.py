@@ -1,8 +1,8 @@
-import sys, tempfile, time, pytest
+import json, sys, tempfile, threading, time, pytest
 from pathlib import Path
 from mojokernel.lsp_client import (
-    MojoLSPClient, completion_matches, completion_metadata, hover_text, identifier_span, lsp_position_to_offset,
-    offset_to_lsp_position, signature_text,
+    LineIndex, LSPError, MojoLSPClient, completion_matches, completion_metadata, hover_text, identifier_span, lsp_position_to_offset,
+    offset_to_lsp_position, signature_text, text_edit,
 )
 
 
@@ -124,6 +124,105 @@ while True:
     return [sys.executable, '-u', '-c', code]
 
 
+def _fake_lsp_cmd_tracks_document():
+    "Applies incremental didChange edits; hover returns the document it holds and the last change it was sent."
+    code = r"""
+import json, sys
+doc,last = "",None
+
+def read_msg():
+    headers = {}
+    while True:
+        line = sys.stdin.buffer.readline()
+        if not line: return None
+        if line in (b"\r\n", b"\n"): break
+        if b":" not in line: continue
+        k,v = line.decode("ascii", "replace").split(":", 1)
+        headers[k.strip().lower()] = v.strip()
+    n = int(headers.get("content-length", "0"))
+    if n <= 0: return None
+    return json.loads(sys.stdin.buffer.read(n).decode("utf-8"))
+
+def send(obj):
+    payload = json.dumps(obj).encode("utf-8")
+    sys.stdout.buffer.write(f"Content-Length: {len(payload)}\r\n\r\n".encode("ascii"))
+    sys.stdout.buffer.write(payload)
+    sys.stdout.buffer.flush()
+
+def offset(txt, p):
+    # Characters are UTF-16 code units, as in a real server.
+    lines = txt.split("\n")
+    line,units,i = (lines[p["line"]] if p["line"] < len(lines) else ""),0,0
+    while i < len(line) and units < p["character"]:
+        units += 2 if ord(line[i]) > 0xFFFF else 1
+        i += 1
+    return sum(len(o)+1 for o in lines[:p["line"]]) + i
+
+while True:
+    msg = read_msg()
+    if msg is None: break
+    mid,method,params = msg.get("id"),msg.get("method"),msg.get("params", {})
+    if method == "initialize": send({"jsonrpc":"2.0","id":mid,"result":{"capabilities":{"textDocumentSync":{"change":2}}}})
+    elif method == "shutdown": send({"jsonrpc":"2.0","id":mid,"result":None})
+    elif method == "textDocument/didOpen": doc = params["textDocument"]["text"]
+    elif method == "textDocument/didChange":
+        for last in params["contentChanges"]:
+            if "range" not in last: doc = last["text"]
+            else: doc = doc[:offset(doc, last["range"]["start"])] + last["text"] + doc[offset(doc, last["range"]["end"]):]
+    elif method == "textDocument/hover": send({"jsonrpc":"2.0","id":mid,"result":{"contents":json.dumps(dict(doc=doc, last=last))}})
+    elif method == "exit": break
+"""
+    return [sys.executable, '-u', '-c', code]
+
+
+def _fake_lsp_cmd_holds_session_requests():
+    "Answers completions on other documents right away but holds those on session.mojo until cancelled; hover reports state."
+    code = r"""
+import json, sys
+docs,held,cancelled = {},set(),[]
+
+def read_msg():
+    headers = {}
+    while True:
+        line = sys.stdin.buffer.readline()
+        if not line: return None
+        if line in (b"\r\n", b"\n"): break
+        if b":" not in line: continue
+        k,v = line.decode("ascii", "replace").split(":", 1)
+        headers[k.strip().lower()] = v.strip()
+    n = int(headers.get("content-length", "0"))
+    if n <= 0: return None
+    return json.loads(sys.stdin.buffer.read(n).decode("utf-8"))
+
+def send(obj):
+    payload = json.dumps(obj).encode("utf-8")
+    sys.stdout.buffer.write(f"Content-Length: {len(payload)}\r\n\r\n".encode("ascii"))
+    sys.stdout.buffer.write(payload)
+    sys.stdout.buffer.flush()
+
+name = lambda p: p["textDocument"]["uri"].rsplit("/", 1)[-1][:-5]
+while True:
+    msg = read_msg()
+    if msg is None: break
+    mid,method,params = msg.get("id"),msg.get("method"),msg.get("params", {})
+    if method == "initialize": send({"jsonrpc":"2.0","id":mid,"result":{"capabilities":{"textDocumentSync":1}}})
+    elif method == "shutdown": send({"jsonrpc":"2.0","id":mid,"result":None})
+    elif method == "textDocument/didOpen": docs[name(params)] = params["textDocument"]["text"]
+    elif method == "textDocument/didChange": docs[name(params)] = params["contentChanges"][-1]["text"]
+    elif method == "$/cancelRequest":
+        if params["id"] in held:
+            held.discard(params["id"])
+            cancelled.append(params["id"])
+            send({"jsonrpc":"2.0","id":params["id"],"error":{"code":-32800,"message":"cancelled"}})
+    elif method == "textDocument/completion":
+        if name(params) == "session": held.add(mid)
+        else: send({"jsonrpc":"2.0","id":mid,"result":{"isIncomplete":False,"items":[{"label":name(params) + ":" + docs[name(params)]}]}})
+    elif method == "textDocument/hover": send({"jsonrpc":"2.0","id":mid,"result":{"contents":json.dumps(dict(docs=docs, cancelled=cancelled))}})
+    elif method == "exit": break
+"""
+    return [sys.executable, '-u', '-c', code]
+
+
 def _fake_lsp_cmd_echo_profile_env():
     code = r'''
 import json, os, sys
@@ -269,6 +368,76 @@ def test_position_helpers():
     assert identifier_span("hello_world()", 7) == (0, 11)
 
 
+def test_line_index_and_text_edit():
+    ix = LineIndex("abc\ndefg\nx")
+    assert ix.starts == [0, 4, 9]
+    assert ix.position(5) == (1, 1) and ix.offset(1, 1) == 5
+    assert ix.offset(1, 99) == 8 and ix.offset(7, 0) == 10
+    fire = LineIndex('a\n🔥é🔥b')
+    assert fire.position(4) == (1, 3) and fire.position(5) == (1, 5) and fire.position(6) == (1, 6)
+    assert [fire.offset(1, o) for o in (0, 2, 3, 5, 9)] == [2, 3, 4, 5, 6]
+    old,new = "abc\ndefg\nx","abc\ndeXYfg\n\nx"
+    start,end,sub = text_edit(old, new)
+    assert (start,end,sub) == (6, 8, 'XYfg\n')
+    assert old[:start] + sub + old[end:] == new
+    ix.update(new, start)
+    assert ix.starts == LineIndex(new).starts
+    assert text_edit('same', 'same') == (4, 4, '')
+    assert text_edit('aa', 'aaa') == (2, 2, 'a')
+
+
+def test_lsp_client_sends_incremental_changes():
+    c = MojoLSPClient(cmd=_fake_lsp_cmd_tracks_document(), request_timeout=1.0, shutdown_timeout=0.2)
+    c.start()
+    pre = 'fn f(x: Int) -> Int:\n    return x\n\nvar a = 1\n' * 50
+    # Edits after a non-BMP character on the same line need UTF-16 columns.
+    fire = [pre + 'var s = "🔥🔥"; pri', pre + 'var s = "🔥🔥"; print(s', pre + 'var s = "🔥🔥x"; print(s)']
+    texts = [pre + 'pri', 'var b = 2\n' + pre + 'pri', pre[:-5] + 'é\n', *fire, pre + 'print(a', pre + 'print(a)\nf(']
+    for text in texts:
+        got = json.loads(hover_text(c.hover(text, len(text))))
+        assert got['doc'] == text
+    assert c.debug_state()['incremental_sync']
+    assert len(got['last']['text']) < 10 and 'range' in got['last']
+    c.shutdown()
+
+
+def test_lsp_client_concurrent_requests_on_separate_documents():
+    c = MojoLSPClient(cmd=_fake_lsp_cmd_holds_session_requests(), request_timeout=2.0, shutdown_timeout=0.2)
+    c.start()
+    slow = c.submit('textDocument/completion', 'aaa', 3)
+    fast = c.submit('textDocument/completion', 'bbb', 3, doc='cell')
+    assert completion_matches(fast.result(1)) == ['cell:bbb']
+    assert not slow.done()
+    slow.cancel()
+    with pytest.raises(LSPError): slow.result(1)
+    with pytest.raises(TimeoutError): c.complete('aaa', 3, timeout=0.05)
+    def edit(i):
+        for j in range(20): c.submit('textDocument/completion', f'doc {i} v{j}', 0, doc=f'd{i}').result(1)
+    ts = [threading.Thread(target=edit, args=(i,)) for i in range(6)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    st = json.loads(hover_text(c.hover('aaa', 0)))
+    assert st['docs'] == dict(session='aaa', cell='bbb', **{f'd{i}': f'doc {i} v19' for i in range(6)})
+    assert len(st['cancelled']) == 2 and st['cancelled'][0] == slow.id
+    assert c.debug_state()['pending'] == 0 and c.debug_state()['docs'] == 8
+    c.shutdown()
+
+
+def test_lsp_client_document_change_cancels_stale_requests():
+    c = MojoLSPClient(cmd=_fake_lsp_cmd_holds_session_requests(), request_timeout=2.0, shutdown_timeout=0.2)
+    c.start()
+    old = c.submit('textDocument/completion', 'pr', 2)
+    same = c.submit('textDocument/hover', 'pr', 1)
+    assert same.result(1) and not old.done() and not old.stale
+    new = c.submit('textDocument/completion', 'pri', 3)
+    assert old.done() and old.stale and not new.stale
+    with pytest.raises(LSPError, match='superseded'): old.result(1)
+    new.cancel()
+    st = json.loads(hover_text(c.hover('pri', 0)))
+    assert st['cancelled'] == [old.id, new.id] and st['docs'] == dict(session='pri')
+    c.shutdown()
+
+
 def test_lsp_client_reopens_when_did_change_not_supported():
     c = MojoLSPClient(cmd=_fake_lsp_cmd_ignores_did_change(False), request_timeout=1.0, shutdown_timeout=0.2)
     c.start()
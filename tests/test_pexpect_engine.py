@@ -1,6 +1,7 @@
-import pytest
+import re, time
+import pexpect, pytest
 from mojokernel.engines.pexpect_engine import (
-    PexpectEngine, _parse_output, _strip_ansi, _is_prompt_line, _PROMPT_PAT, _ECHO_RE)
+    PexpectEngine, _OutputScanner, _parse_output, _strip_ansi, _is_prompt_line, _PROMPT_PAT, _ECHO_RE)
 
 # Pexpect fallback engine tests are slow and optional in normal development.
 pytestmark = pytest.mark.slow
@@ -177,3 +178,101 @@ def test_whitespace_only_code(engine):
     r = engine.execute('   \n  \n  ')
     assert r.success
     assert r.stdout == ''
+
+# ── Sentinel end-of-output detection (scripted child, no mojo needed) ──
+
+class _ScriptedChild:
+    "Stands in for the pexpect child: replies to the sentinel line with `reply` (a line at a time) plus the marker and a prompt."
+    def __init__(self, reply): self.reply,self.sent,self.out = reply,[],[]
+    def isalive(self): return True
+    def sendline(self, line):
+        self.sent.append(line)
+        m = re.match(r'print\("__MK_" \+ "(DONE_\w+__)"\)', line)
+        if m: self.out += (self.reply + f'  3> {line}\r\n').splitlines(keepends=True) + ['__MK_' + m.group(1) + '\r\n', '  4> ']
+    def read_nonblocking(self, size, timeout):
+        if self.out: return self.out.pop(0)
+        raise pexpect.TIMEOUT('')
+
+def _scripted_engine(reply):
+    e = PexpectEngine(sentinel=True)
+    e.child = _ScriptedChild(reply)
+    return e
+
+def test_sentinel_ends_read_and_strips_marker():
+    e = _scripted_engine('  1> print(42)\r\n42\r\n')
+    t0 = time.time()
+    r = e.execute('print(42)')
+    assert time.time() - t0 < 0.3
+    assert r.success and r.stdout == '42\n'
+    assert e.child.sent[:2] == ['print(42)', ''] and '__MK_' in e.child.sent[2]
+
+def test_sentinel_echo_not_in_error_traceback():
+    r = _scripted_engine("  1> print(bad)\r\nerror: use of unknown declaration 'bad'\r\n").execute('print(bad)')
+    assert not r.success
+    assert r.evalue == "error: use of unknown declaration 'bad'"
+    assert not any('__MK_' in o for o in r.traceback)
+
+class _HangingChild(_ScriptedChild):
+    "A cell that prints `first` and then runs until interrupted; the queued sentinel only answers after sendintr."
+    def __init__(self, first): super().__init__('  1> loop()\r\n' + first); self.intrs,self.held = 0,[]
+    def sendline(self, line):
+        super().sendline(line)
+        if '__MK_' in line: self.held,self.out = self.out[-3:],self.out[:-3]
+    def sendintr(self): self.intrs += 1; self.out += self.held
+
+def test_output_streams_before_cell_finishes():
+    e = _scripted_engine('  1> f()\r\n1\r\n2\r\n')
+    got = []
+    r = e.execute('f()', on_output=lambda n,t: got.append(t))
+    assert got == ['1\n', '2\n'] and r.success and r.stdout == ''
+
+def test_idle_timeout_interrupts_and_resyncs():
+    e = PexpectEngine(sentinel=True, idle_timeout=0.3)
+    e.child = _HangingChild('tick\r\n')
+    t0 = time.time()
+    r = e.execute('loop()')
+    assert 0.3 < time.time() - t0 < 1
+    assert not r.success and r.ename == 'TimeoutError' and 'no output for 0.3s' in r.evalue
+    assert r.stdout == 'tick\n' and e.child.intrs == 1 and not e.child.out
+
+def test_timeout_sends_remaining_output_through_on_output():
+    e = PexpectEngine(sentinel=True, timeout=0.3)
+    e.child = _HangingChild('tick\r\n')
+    got = []
+    r = e.execute('loop()', on_output=lambda n,t: got.append((n, t)))
+    assert got == [('stdout', 'tick\n'), ('stderr', 'Expression timed out\n')]
+    assert not r.success and r.ename == 'TimeoutError' and r.stdout == r.stderr == ''
+
+def test_limits_default_to_unbounded_and_read_env(monkeypatch):
+    monkeypatch.delenv('MOJO_PEXPECT_TIMEOUT', raising=False)
+    monkeypatch.setenv('MOJO_PEXPECT_IDLE_TIMEOUT', '45')
+    e = PexpectEngine()
+    assert e.timeout is None and e.idle_timeout == 45
+    assert PexpectEngine(timeout=5).timeout == 5
+
+# ── Incremental output scanner ──
+
+_REPL_SAMPLES = ['  1> print(42)\r\n42\r\n  2> ',
+                 '\x1b[2m  1> \x1b[0mfor i in range(3):\r\n  2.     print(i)\r\n  3. \r\n0\r\n1\r\n2\r\n  4> ',
+                 "  1> print(bad)\r\nerror: use of unknown declaration 'bad'\r\n(null)\r\n  2> ",
+                 'hello\nworld\n']
+
+def test_scanner_matches_whole_buffer_parse_for_any_chunking():
+    for raw in _REPL_SAMPLES:
+        whole = _parse_output(raw)
+        for size in (1, 2, 3, 7):
+            sc = _OutputScanner()
+            for i in range(0, len(raw), size): sc.feed(raw[i:i+size])
+            assert sc.result() == whole
+            assert sc.prompt_seen == bool(_PROMPT_PAT.search(_strip_ansi(raw).replace('\r', '')))
+
+def test_scanner_holds_split_escape_sequence():
+    sc = _OutputScanner().feed('ab\x1b[').feed('6Gcd\n')
+    assert sc.result().stdout == 'abcd\n'
+
+def test_scanner_streams_parsed_lines():
+    sc = _OutputScanner().feed('  1> print(1)\r\n1\r\n2')
+    assert sc.take_stdout() == '1\n'
+    sc.feed('\r\n3\r\n  2> ')
+    assert sc.take_stdout() == '2\n3\n'
+    assert sc.prompt_seen and sc.result().stdout == ''
@@ -0,0 +1,47 @@
+from mojokernel.preamble import Preamble, decl_key
+
+
+def test_decl_key():
+    assert decl_key('fn foo(x: Int) -> Int:\n    return x') == ('fn', 'foo', '(x:Int)')
+    assert decl_key('@always_inline\nfn foo[T: AnyType](x: T):\n    pass') == ('fn', 'foo', '[T:AnyType](x:T)')
+    assert decl_key('struct P:\n    var x: Int') == ('type', 'P')
+    assert decl_key('var xs = List[Int]()') == decl_key('let xs = 3') == ('value', 'xs')
+    assert decl_key('from  math import sqrt') == ('import', 'from math import sqrt')
+    assert decl_key('print(1)') is None and decl_key('for i in range(3):\n    print(i)') is None
+
+
+def test_preamble_replaces_superseded_definitions():
+    p = Preamble()
+    p.add('fn foo() -> Int:\n    return 1\n\nprint(foo())')
+    p.add('var x = 1\nx += 1\nfor i in range(3):\n    print(i)')
+    v = p.version
+    p.add('print(x)')
+    assert p.version == v
+    p.add('fn foo() -> Int:\n    # two now\n    return 2')
+    p.add('fn foo(a: Int) -> Int:\n    return a')
+    assert p.text == 'var x = 1\nfn foo() -> Int:\n    return 2\nfn foo(a: Int) -> Int:\n    return a\n'
+    assert p.version > v and len(p) == p.size == len(p.text)
+    p.clear()
+    assert p.text == '' and p.size == 0
+
+
+def test_preamble_stays_bounded_over_a_long_session():
+    p = Preamble(limit=2000)
+    for i in range(1000):
+        p.add(f'fn f{i % 7}(x: Int) -> Int:\n    return x + {i}\n\nvar v{i} = f{i % 7}({i})\nprint(v{i})')
+    assert p.size <= 2000 and p.size == len(p.text)
+    assert 'var v999 = f5(999)' in p.text and 'return x + 999' in p.text
+    assert 'var v0 =' not in p.text and p.text.count('fn f6(') == 1
+
+
+def test_eviction_keeps_imports_and_definitions_in_use():
+    p = Preamble(limit=400)
+    p.add('from math import sqrt\nstruct Point:\n    var x: Float64\nfn norm(p: Point) -> Float64:\n    return sqrt(p.x)')
+    p.add('fn unused_helper() -> Int:\n    return 42')
+    p.add('fn dist(a: Point) -> Float64:\n    return norm(a)')
+    for i in range(30): p.add(f'var p{i} = Point({i})')
+    assert p.size <= 400 and p.size == len(p.text)
+    assert 'var p29 = Point(29)' in p.text and 'var p0 =' not in p.text and 'unused_helper' in p.text
+    p.add('fn filler() -> Int:\n    return ' + '1 + ' * 50 + '1')
+    assert p.size <= 400 and 'var p' not in p.text and 'unused_helper' not in p.text
+    assert p.text.startswith('from math import sqrt\nstruct Point:') and 'fn norm(' in p.text and 'fn filler' in p.text
@@ -0,0 +1,68 @@
+from mojokernel.engines.base import Engine, ExecutionResult
+import os, stat, tempfile
+from mojokernel.restore import SessionLog, classify_cell, defined_names, replay, replay_plan, session_log_path, strip_io
+
+
+class _RecordingEngine(Engine):
+    "Records executed code; code containing `bad` fails, as does any chunk containing `fails_merged` plus another cell."
+    def __init__(self): self.ran = []
+    def execute(self, code, on_output=None):
+        self.ran.append(code)
+        ok = 'bad' not in code and not ('fails_merged' in code and '\n\n' in code)
+        return ExecutionResult(success=ok, ename='' if ok else 'MojoError', evalue='' if ok else 'nope')
+
+
+def test_classify_cell():
+    assert classify_cell('fn f():\n    print(1)\n\n@value\nstruct S:\n    var x: Int') == 'definition'
+    assert classify_cell('from math import sqrt\nalias N = 4') == 'definition'
+    assert classify_cell('var x = 1\nx += 1') == 'state'
+    assert classify_cell('var x = 1\nprint(x)') == 'io'
+    assert classify_cell('for i in range(3):\n    print(i)') == 'io'
+
+
+def test_strip_io_and_defined_names():
+    assert strip_io('var x = 1\nprint(x)\n# note\nx += 1') == 'var x = 1\nx += 1'
+    assert defined_names('@value\nstruct P:\n    var a: Int\nfn g(): pass\nvar y = 2') == {'P', 'g'}
+
+
+def test_replay_plan_merges_definitions_and_flags_io():
+    cells = ['fn a(): pass', 'struct B: pass', 'var x = 1', 'print(x)', 'var y = 2\nprint(y)', 'fn a(): return', 'fn c(): pass', 'fn a(x: Int): pass']
+    chunks,flagged = replay_plan(cells)
+    assert [c.cells for c in chunks] == [[0, 1], [2], [4], [5, 6], [7]]
+    assert chunks[0].code == 'fn a(): pass\n\nstruct B: pass'
+    assert chunks[2].code == 'var y = 2'
+    assert flagged == [3, 4]
+    chunks,flagged = replay_plan(cells, include_io=True)
+    assert [c.cells for c in chunks][1:4] == [[2], [3], [4]] and flagged == []
+
+
+def test_replay_retries_failed_merge_cell_by_cell():
+    e = _RecordingEngine()
+    done,flagged,failed = replay(e, ['fn a(): pass', 'fn fails_merged(): pass', 'var x = 1', 'print(x)'])
+    assert done == [0, 1, 2] and flagged == [3] and failed is None
+    assert e.ran == ['fn a(): pass\n\nfn fails_merged(): pass', 'fn a(): pass', 'fn fails_merged(): pass', 'var x = 1']
+
+
+def test_replay_stops_at_failing_cell():
+    done,_,failed = replay(_RecordingEngine(), ['var x = 1', 'var bad = 2', 'var y = 3'])
+    assert done == [0]
+    assert failed[0] == 1 and failed[1].evalue == 'nope'
+
+
+def test_session_log_round_trip(tmp_path):
+    log = SessionLog(tmp_path / 'sub' / 'log.jsonl')
+    log.append('var x = 1')
+    log.append('fn f():\n    pass')
+    with log.path.open('a') as f: f.write('{"code": "torn')
+    assert log.take() == ['var x = 1', 'fn f():\n    pass']
+    assert log.cells() == []
+
+
+def test_session_log_lives_in_private_user_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    shared = tmp_path / f'mojokernel-{os.getuid()}'
+    shared.mkdir(mode=0o755)
+    shared.chmod(0o755)
+    path = session_log_path(b'key')
+    assert path.parent == shared and stat.S_IMODE(shared.stat().st_mode) == 0o700
+    assert session_log_path(b'key') == path and session_log_path(b'other') != path
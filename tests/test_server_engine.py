@@ -0,0 +1,477 @@
+"""ServerEngine tests against a fake mojo-repl-server speaking the same JSON protocol."""
+import asyncio, io, os, socket, stat, subprocess, sys, tempfile, threading, time
+import pytest
+from mojokernel.engines.pool import EnginePool, pool_from_env
+from mojokernel.engines import server_engine
+from mojokernel.engines.server_engine import ServerEngine, ServerRequestError, _encode_frame, _read_frame, _zygote_socket
+
+_FAKE_SERVER = r'''
+import json, os, signal, struct, sys, time
+framed = False
+interrupted = False
+
+def on_sigint(*args):
+    global interrupted
+    interrupted = True
+
+signal.signal(signal.SIGINT, on_sigint)
+out, inp = sys.stdout.buffer, sys.stdin.buffer
+
+def emit(obj):
+    if not framed:
+        out.write((json.dumps(obj) + "\n").encode())
+        out.flush()
+        return
+    names = [k for k in ("code", "stdout", "stderr", "text") if isinstance(obj.get(k), str)]
+    blobs = [obj.pop(k).encode() for k in names]
+    obj["blobs"] = names
+    meta = json.dumps(obj).encode()
+    out.write(struct.pack("<II", len(meta), len(blobs)) + meta)
+    for b in blobs: out.write(struct.pack("<Q", len(b)) + b)
+    out.flush()
+
+def read():
+    if not framed:
+        line = inp.readline()
+        return json.loads(line) if line else None
+    head = inp.read(8)
+    if len(head) < 8: return None
+    n, count = struct.unpack("<II", head)
+    req = json.loads(inp.read(n))
+    for name in req.pop("blobs", [])[:count]: req[name] = inp.read(struct.unpack("<Q", inp.read(8))[0]).decode()
+    return req
+
+def run(code, rid, cell=None, req={}):
+    # `chunk:a|b|c` streams each piece; `fail:msg` reports an error after streaming; `big:n` prints n bytes;
+    # `sleep:s` runs for s seconds unless interrupted; `cwd:` and `env:NAME` report the process's context.
+    global interrupted
+    kind, _, arg = code.partition(":")
+    if kind in ("cwd", "env"): return {"status": "ok", "stdout": os.getcwd() if kind == "cwd" else os.environ.get(arg, ""), "stderr": "", "value": ""}
+    if kind == "sleep":
+        interrupted, deadline = False, time.time() + float(arg)
+        while not interrupted and time.time() < deadline: time.sleep(0.01)
+        if interrupted: return {"status": "error", "stdout": "", "stderr": "", "ename": "Interrupted", "evalue": "execution interrupted", "traceback": []}
+    timing = {"wall_ms": 3.0, "eval_ms": 2.5, "cpu_ms": 2.0, "drain_ms": 0.5}
+    if kind == "big":
+        text, limit = "x\n" * (int(arg) // 2), req.get("output_limit", 0)
+        if not limit or len(text) <= limit: return {"status": "ok", "stdout": text, "stderr": "", "value": ""}
+        os.makedirs(req["spill_dir"], exist_ok=True)
+        path = os.path.join(req["spill_dir"], "output-fake")
+        written = text[:req.get("spill_limit") or len(text)]
+        with open(path, "w") as f: f.write(written)
+        spill = {"path": path, "bytes": len(text), "shown": limit, "written": len(written), "tail": text[-req["output_tail"]:]}
+        return {"status": "ok", "stdout": text[:limit], "stderr": "", "value": "", "spill": spill}
+    parts = arg.split("|") if arg else []
+    for p in parts[:-1]: emit(dict({"id": rid, "type": "stream", "name": "stdout", "text": p}, **({} if cell is None else {"cell": cell})))
+    tail = parts[-1] if parts else ""
+    if kind == "fail": return {"status": "error", "stdout": "", "stderr": "", "ename": "MojoError", "evalue": tail, "traceback": [tail], "timing": timing}
+    return {"status": "ok", "stdout": tail, "stderr": "", "value": "", "timing": timing}
+
+if "--forked" in sys.argv:
+    # As a zygote child: take on the kernel's cwd and environment if it wants the root we serve.
+    hello, root = json.loads(inp.readline()), sys.argv[sys.argv.index("--forked") + 1]
+    if hello["root"] != root:
+        emit({"status": "error", "message": "zygote serves Mojo root " + root})
+        sys.exit(1)
+    os.chdir(hello["cwd"])
+    os.environ.clear()
+    os.environ.update(hello["env"])
+    emit({"status": "forked", "pid": os.getpid(), "root": root})
+    if "MK_FAIL_START" in hello["env"]:
+        sys.stderr.write("startup failed: " + hello["env"]["MK_FAIL_START"] + "\n")
+        sys.exit(1)
+emit({"status": "ready", "protocols": ["json", "framed"]} if "--framed" in sys.argv else {"status": "ready"})
+while True:
+    req = read()
+    if req is None: break
+    rid, typ = req.get("id", 0), req.get("type")
+    if typ == "shutdown":
+        emit({"id": rid, "status": "ok"})
+        break
+    if typ == "protocol":
+        emit({"id": rid, "status": "ok", "protocol": req["protocol"]})
+        framed = req["protocol"] == "framed"
+        continue
+    if typ == "execute_batch" and "--no-batch" not in sys.argv:
+        results = []
+        for i, code in enumerate(req["cells"]):
+            r = run(code, rid, i, req)
+            if r["stdout"]: emit({"id": rid, "type": "stream", "name": "stdout", "text": r["stdout"], "cell": i})
+            results.append(dict(r, stdout=""))
+            if req.get("stop_on_error", True) and results[-1]["status"] != "ok": break
+        emit({"id": rid, "status": "ok", "results": results})
+        continue
+    if typ == "buffer_info":
+        if req["pointer"] != "xs.unsafe_ptr()": emit({"id": rid, "status": "error", "ename": "BufferError", "evalue": "cannot evaluate `" + req["pointer"] + "`", "traceback": []})
+        else: emit({"id": rid, "status": "ok", "address": 4096, "length": 4, "type": "UnsafePointer[Float64]", "pointee": "Float64"})
+        continue
+    if typ == "read_memory":
+        import mmap
+        with open("/dev/shm" + req["shm"], "r+b") as f, mmap.mmap(f.fileno(), req["size"]) as m: m[:] = bytes(i % 256 for i in range(req["size"]))
+        emit({"id": rid, "status": "ok", "bytes": req["size"]})
+        continue
+    if typ == "variables":
+        vs = [{"name": n, "type": "List[Int]", "value": "", "summary": "size=1000", "expandable": True} for n in ["xs"] + req["names"]]
+        emit({"id": rid, "status": "ok", "variables": vs})
+        continue
+    if typ == "variable_children":
+        end = min(req["offset"] + req["count"], 1000)
+        kids = [{"index": i, "name": "[%d]" % i, "type": "Int", "value": str(i * i), "summary": "", "expandable": False} for i in range(req["offset"], end)]
+        emit({"id": rid, "status": "ok", "children": kids, "more": end < 1000})
+        continue
+    if typ == "write_memory":
+        import mmap
+        with open("/dev/shm" + req["shm"], "r+b") as f, mmap.mmap(f.fileno(), req["size"]) as m: written = m[:]
+        emit({"id": rid, "status": "ok", "address": req["address"] or 8192, "bytes": len(written), "sum": sum(written)})
+        continue
+    if typ != "execute":
+        emit({"id": rid, "status": "error", "ename": "ProtocolError", "evalue": "unknown request type: " + str(typ), "traceback": []})
+        continue
+    emit(dict(run(req.get("code", ""), rid, req=req), id=rid))
+'''
+
+
+def _fake_engine(*args):
+    e = ServerEngine()
+    e._launch([sys.executable, '-u', '-c', _FAKE_SERVER, *args], None)
+    return e
+
+
+def test_execute_collects_streamed_output_without_callback():
+    e = _fake_engine()
+    try:
+        r = e.execute('chunk:a|b|c')
+        assert r.success
+        assert r.stdout == 'abc'
+    finally: e.shutdown()
+
+
+def test_execute_forwards_stream_frames_in_order():
+    e = _fake_engine()
+    try:
+        got = []
+        r = e.execute('chunk:1\n|2\n|3', on_output=lambda name, text: got.append((name, text)))
+        assert got == [('stdout', '1\n'), ('stdout', '2\n'), ('stdout', '3')]
+        assert r.success and r.stdout == ''
+    finally: e.shutdown()
+
+
+def test_execute_error_after_streamed_output():
+    e = _fake_engine()
+    try:
+        got = []
+        r = e.execute('fail:partial|boom', on_output=lambda name, text: got.append(text))
+        assert got == ['partial']
+        assert not r.success
+        assert r.evalue == 'boom'
+        r = e.execute('chunk:ok')
+        assert r.success and r.stdout == 'ok'
+    finally: e.shutdown()
+
+
+def test_execute_carries_server_timing():
+    e = _fake_engine()
+    try:
+        r = e.execute('chunk:a')
+        assert r.timing == dict(wall_ms=3.0, eval_ms=2.5, cpu_ms=2.0, drain_ms=0.5)
+        assert e.execute('fail:boom').timing['cpu_ms'] == 2.0
+        assert e.execute('big:4').timing == {}
+    finally: e.shutdown()
+
+
+def test_execute_many_runs_cells_in_one_batch():
+    e = _fake_engine()
+    try:
+        got = []
+        rs = e.execute_many(['chunk:a|b', 'fail:x|boom', 'chunk:never'], on_output=lambda i, name, text: got.append((i, text)))
+        assert got == [(0, 'a'), (0, 'b'), (1, 'x')]
+        assert [r.success for r in rs] == [True, False]
+        assert rs[1].evalue == 'boom'
+        assert e._next_id == 1
+        rs = e.execute_many(['chunk:a|b', 'fail:boom', '', 'chunk:c'], stop_on_error=False)
+        assert [(r.success, r.stdout) for r in rs] == [(True, 'ab'), (False, ''), (True, ''), (True, 'c')]
+    finally: e.shutdown()
+
+
+def test_execute_many_falls_back_without_batch_support():
+    e = _fake_engine('--no-batch')
+    try:
+        got = []
+        rs = e.execute_many(['chunk:a|b', 'fail:boom', 'chunk:c'], on_output=lambda i, name, text: got.append((i, text)))
+        assert got == [(0, 'a'), (0, 'b')]
+        assert [r.success for r in rs] == [True, False]
+    finally: e.shutdown()
+
+
+class _FakeServerEngine(ServerEngine):
+    def start(self):
+        self._launch([sys.executable, '-u', '-c', _FAKE_SERVER], None)
+        if self.pool: self.pool.start()
+
+
+def _wait_for(cond, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if cond(): return True
+        time.sleep(0.02)
+    return False
+
+
+def test_restart_adopts_warm_spare_and_replenishes():
+    pool = EnginePool(_FakeServerEngine, size=1)
+    e = _FakeServerEngine(pool=pool)
+    e.start()
+    try:
+        assert _wait_for(lambda: pool.ready == 1)
+        spare_pid,pool_startup = pool._spares[0][0].proc.pid,pool._spares[0][0].startup
+        old_pid = e.proc.pid
+        e.restart()
+        assert e.proc.pid == spare_pid != old_pid
+        assert e.startup is pool_startup
+        assert e.execute('chunk:ok').stdout == 'ok'
+        assert _wait_for(lambda: pool.ready == 1)
+    finally: e.shutdown()
+    assert pool.ready == 0
+
+
+def test_restart_without_spare_falls_back_to_cold_start():
+    e = _FakeServerEngine(pool=EnginePool(_FakeServerEngine, size=0))
+    e.start()
+    try:
+        old_pid = e.proc.pid
+        e.restart()
+        assert e.alive and e.proc.pid != old_pid
+    finally: e.shutdown()
+
+
+def test_pool_expires_idle_spares_after_ttl():
+    pool = EnginePool(_FakeServerEngine, size=1, ttl=0.3)
+    pool.start()
+    try:
+        assert _wait_for(lambda: pool.ready == 1)
+        first = pool._spares[0][0]
+        assert _wait_for(lambda: not first.alive)
+        assert _wait_for(lambda: pool.ready == 1 and pool._spares[0][0] is not first)
+    finally: pool.close()
+
+
+def test_pool_from_env(monkeypatch):
+    monkeypatch.delenv('MOJO_KERNEL_POOL_SIZE', raising=False)
+    assert pool_from_env(_FakeServerEngine) is None
+    monkeypatch.setenv('MOJO_KERNEL_POOL_SIZE', '2')
+    monkeypatch.setenv('MOJO_KERNEL_POOL_TTL', '600')
+    pool = pool_from_env(_FakeServerEngine)
+    assert (pool.size, pool.ttl) == (2, 600)
+
+
+def _fake_zygote(path, root='/mojo'):
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    srv.bind(path)
+    srv.listen()
+    children = []
+
+    def loop():
+        while True:
+            try: conn,_ = srv.accept()
+            except OSError: return
+            _,fds,_,_ = socket.recv_fds(conn, 1, 1)
+            children.append(subprocess.Popen([sys.executable, '-u', '-c', _FAKE_SERVER, '--forked', root], stdin=conn.fileno(), stdout=conn.fileno(), stderr=fds[0]))
+            for fd in fds: os.close(fd)
+            conn.close()
+
+    threading.Thread(target=loop, daemon=True).start()
+    return srv, children
+
+
+def _zygote_env(tmp_path, monkeypatch):
+    path = str(tmp_path/'z.sock')
+    monkeypatch.setenv('MOJO_REPL_ZYGOTE', path)
+    monkeypatch.setattr(server_engine, '_find_modular_root', lambda: '/mojo')
+    monkeypatch.setattr(server_engine, '_find_server_binary', lambda: None)
+    return path
+
+
+def test_start_connects_to_zygote_socket(tmp_path, monkeypatch):
+    path = _zygote_env(tmp_path, monkeypatch)
+    srv,children = _fake_zygote(path)
+    (tmp_path/'work').mkdir()
+    monkeypatch.chdir(tmp_path/'work')
+    monkeypatch.setenv('MK_TEST_VAR', 'kernel-side')
+    e = ServerEngine()
+    try:
+        e.start()
+        assert e.alive
+        assert [o.pid for o in children] == [e.proc.pid]
+        assert e.execute('chunk:a|b').stdout == 'ab'
+        assert e.execute('cwd:').stdout == str(tmp_path/'work') and e.execute('env:MK_TEST_VAR').stdout == 'kernel-side'
+        assert e.execute('env:MODULAR_MAX_PACKAGE_ROOT').stdout == '/mojo'
+        e.shutdown()
+        assert children[0].wait(timeout=5) is not None
+    finally:
+        srv.close()
+        for o in children: o.kill()
+
+
+def test_zygote_child_stderr_reaches_the_kernel(tmp_path, monkeypatch):
+    path = _zygote_env(tmp_path, monkeypatch)
+    srv,children = _fake_zygote(path)
+    monkeypatch.setenv('MK_FAIL_START', 'no plugin')
+    try:
+        with pytest.raises(RuntimeError, match='startup failed: no plugin'): ServerEngine().start()
+    finally:
+        srv.close()
+        for o in children: o.kill()
+
+
+@pytest.mark.parametrize('why', ['root', 'uid'])
+def test_zygote_mismatch_falls_back_to_cold_start(tmp_path, monkeypatch, why):
+    path = _zygote_env(tmp_path, monkeypatch)
+    srv,children = _fake_zygote(path, root='/other-mojo' if why == 'root' else '/mojo')
+    if why == 'uid': monkeypatch.setattr(server_engine, '_peer_uid', lambda sock: os.getuid() + 1)
+    try:
+        with pytest.raises(FileNotFoundError): ServerEngine().start()  # the cold start finds no binary here
+        for o in children: assert o.wait(timeout=5) is not None
+    finally:
+        srv.close()
+        for o in children: o.kill()
+
+
+def test_zygote_socket_env(monkeypatch):
+    monkeypatch.setenv('MOJO_REPL_ZYGOTE', 'off')
+    assert _zygote_socket() is None
+    monkeypatch.setenv('MOJO_REPL_ZYGOTE', '/tmp/x.sock')
+    assert _zygote_socket() == '/tmp/x.sock'
+    monkeypatch.delenv('MOJO_REPL_ZYGOTE')
+    assert _zygote_socket().endswith('.sock')
+
+
+def test_execute_async_delivers_output_on_loop_before_result():
+    e = _fake_engine()
+    try:
+        async def run():
+            got,tick = [],asyncio.Event()
+            loop = asyncio.get_running_loop()
+            def on_output(name, text):
+                assert asyncio.get_running_loop() is loop
+                got.append(text)
+            r,_ = await asyncio.gather(e.execute_async('chunk:a|b|c', on_output=on_output), _set_soon(tick))
+            assert tick.is_set()
+            return r,got
+        r,got = asyncio.run(run())
+        assert got == ['a', 'b', 'c']
+        assert r.success and r.stdout == ''
+    finally: e.shutdown()
+
+
+async def _set_soon(ev):
+    await asyncio.sleep(0)
+    ev.set()
+
+
+def test_framed_protocol_negotiated_when_offered():
+    e = _fake_engine('--framed')
+    try:
+        assert e.protocol == 'framed'
+        got = []
+        r = e.execute('chunk:h\u00e9|llo \u2603', on_output=lambda name, text: got.append(text))
+        assert got == ['h\u00e9', 'llo \u2603']
+        e.output_limit = 0
+        r = e.execute('big:2000000')
+        assert r.success and len(r.stdout) == 2000000
+        r = e.execute('fail:boom')
+        assert not r.success and r.evalue == 'boom'
+    finally: e.shutdown()
+
+
+def test_json_protocol_when_not_offered_or_disabled(monkeypatch):
+    e = _fake_engine()
+    try: assert e.protocol == 'json'
+    finally: e.shutdown()
+    monkeypatch.setenv('MOJO_SERVER_PROTOCOL', 'json')
+    e = _fake_engine('--framed')
+    try:
+        assert e.protocol == 'json'
+        assert e.execute('chunk:a|b').stdout == 'ab'
+    finally: e.shutdown()
+
+
+def test_frame_codec_round_trip():
+    msg = dict(type='execute', id=3, code='print("\u00e9")\n' * 3)
+    buf = io.BytesIO(_encode_frame(msg))
+    assert _read_frame(buf) == msg
+
+
+def test_execute_passes_output_budget_and_returns_spill(tmp_path):
+    e = _fake_engine()
+    e.output_limit,e.output_tail,e.spill_dir = 10,4,str(tmp_path)
+    try:
+        r = e.execute('big:100')
+        assert r.stdout == 'x\n' * 5
+        assert r.spill == dict(path=str(tmp_path / 'output-fake'), bytes=100, shown=10, written=100, tail='x\nx\n')
+        assert (tmp_path / 'output-fake').read_text() == 'x\n' * 50
+        assert e.execute('big:8').spill == {}
+        e.spill_limit = 40
+        assert e.execute('big:100').spill['written'] == 40 and (tmp_path / 'output-fake').read_text() == 'x\n' * 20
+    finally: e.shutdown()
+
+
+def test_output_limit_from_env(monkeypatch):
+    monkeypatch.delenv('MOJO_KERNEL_OUTPUT_LIMIT', raising=False)
+    assert ServerEngine().output_limit == 1 << 20
+    monkeypatch.setenv('MOJO_KERNEL_OUTPUT_LIMIT', 'off')
+    assert ServerEngine().output_limit == 0
+    monkeypatch.delenv('MOJO_KERNEL_SPILL_LIMIT', raising=False)
+    assert ServerEngine().spill_limit == 256 << 20
+    monkeypatch.setenv('MOJO_KERNEL_SPILL_LIMIT', '1000')
+    assert ServerEngine().spill_limit == 1000
+
+
+def test_spill_dir_is_private_to_the_user(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    d = ServerEngine().spill_dir
+    assert d == str(tmp_path / f'mojokernel-{os.getuid()}') and stat.S_IMODE(os.stat(d).st_mode) == 0o700
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason='fake server writes shared memory through /dev/shm')
+def test_buffer_requests_move_memory_through_shared_memory():
+    from multiprocessing import shared_memory
+    e = _fake_engine('--framed')
+    shm = shared_memory.SharedMemory(create=True, size=32)
+    try:
+        info = e.buffer_info('xs.unsafe_ptr()', 'len(xs)')
+        assert (info['address'], info['length'], info['pointee']) == (4096, 4, 'Float64')
+        assert e.read_memory(4096, 32, '/' + shm.name)['bytes'] == 32
+        assert bytes(shm.buf) == bytes(range(32))
+        with pytest.raises(ServerRequestError, match='cannot evaluate `ys`'): e.buffer_info('ys', '1')
+        r = e.write_memory(32, '/' + shm.name)
+        assert (r['address'], r['bytes'], r['sum']) == (8192, 32, sum(range(32)))
+        assert e.execute('chunk:ok').stdout == 'ok'
+    finally:
+        shm.close()
+        shm.unlink()
+        e.shutdown()
+
+
+def test_variables_and_paged_children():
+    e = _fake_engine()
+    try:
+        assert [v['name'] for v in e.variables(['n'])] == ['xs', 'n']
+        kids,more = e.variable_children('xs', offset=990, count=20)
+        assert [c['value'] for c in kids[:2]] == ['980100', '982081'] and len(kids) == 10 and not more
+        assert e.variable_children('xs', count=5)[1]
+    finally: e.shutdown()
+
+
+def test_requests_from_other_threads_wait_for_the_running_one():
+    e = _fake_engine()
+    try:
+        got = []
+        def slow_stream(m):
+            if not got: threading.Thread(target=lambda: got.append(e.variables())).start()
+            time.sleep(0.2)
+        r = e._send({'type': 'execute', 'code': 'chunk:a|b|c'}, on_stream=slow_stream)
+        assert r['stdout'] == 'c'
+        deadline = time.time() + 5
+        while not got and time.time() < deadline: time.sleep(0.01)
+        assert got[0][0]['name'] == 'xs'
+    finally: e.shutdown()
@@ -75,3 +75,18 @@ def test_unknown_type(server):
     resp = _send(server, {'type': 'bogus', 'id': 6})
     assert resp['status'] == 'error'
     assert 'ProtocolError' in resp.get('ename', '')
+
+def test_execute_streams_output_before_reply(server):
+    req = {'type': 'execute', 'id': 7, 'code': 'for i in range(3):\n    print(i)'}
+    server.stdin.write((json.dumps(req, separators=(',', ':')) + '\n').encode())
+    server.stdin.flush()
+    text = ''
+    while True:
+        resp = json.loads(server.stdout.readline())
+        assert resp['id'] == 7
+        if resp.get('type') != 'stream': break
+        assert resp['name'] in ('stdout', 'stderr')
+        text += resp['text']
+    assert resp['status'] == 'ok'
+    text += resp['stdout']
+    assert text.split() == ['0', '1', '2']
@@ -0,0 +1,26 @@
+from mojokernel.spill import page_count, read_page, spill_notice
+
+
+def test_pages_break_after_newlines_and_cover_the_file(tmp_path):
+    p = tmp_path / 'out'
+    text = ''.join(f'line {i}\n' for i in range(100))
+    p.write_text(text)
+    pages = [read_page(p, i, size=64) for i in range(page_count(p, size=64))]
+    assert ''.join(pages) == text
+    assert all(o.endswith('\n') for o in pages)
+    assert read_page(p, -1, size=64) == pages[-1]
+
+
+def test_page_out_of_range(tmp_path):
+    p = tmp_path / 'out'
+    p.write_text('abc')
+    try: read_page(p, 1)
+    except IndexError as e: assert '1-1' in str(e)
+    else: assert False
+
+
+def test_notice_mentions_sizes_path_and_tail():
+    n = spill_notice(dict(path='/tmp/x', bytes=3 << 20, shown=1 << 20, tail='last\n'))
+    assert '1.0 MB of 3.0 MB' in n and '/tmp/x' in n and '%page' in n and n.endswith('last\n')
+    assert '%page' not in spill_notice(dict(path='', bytes=20, shown=10, tail=''))
+    assert 'first 2.0 MB kept' in spill_notice(dict(path='/tmp/x', bytes=3 << 20, shown=1 << 20, written=2 << 20, tail=''))
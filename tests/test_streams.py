@@ -0,0 +1,60 @@
+from mojokernel.streams import StreamBatcher
+
+
+class _Timers:
+    "Fake `call_later` plus clock: `advance(dt)` moves time and fires what has come due."
+    def __init__(self): self.now,self.pending = 0.0,[]
+    def clock(self): return self.now
+    def schedule(self, delay, fn):
+        t = _Timer(self.now + delay, fn)
+        self.pending.append(t)
+        return t
+    def advance(self, dt):
+        self.now += dt
+        for t in sorted(self.pending, key=lambda t: t.when):
+            if t.when <= self.now and not t.cancelled:
+                self.pending.remove(t)
+                t.fn()
+        self.pending = [t for t in self.pending if not t.cancelled]
+
+
+class _Timer:
+    def __init__(self, when, fn): self.when,self.fn,self.cancelled = when,fn,False
+    def cancel(self): self.cancelled = True
+
+
+def _batcher(**kw):
+    timers,sent = _Timers(),[]
+    b = StreamBatcher(lambda name, text: sent.append((name, text)), schedule=timers.schedule, clock=timers.clock, **kw)
+    return b,timers,sent
+
+
+def test_chunks_merge_within_window_keeping_stream_order():
+    b,timers,sent = _batcher()
+    for o in ['a', 'b', 'c']: b.write('stdout', o)
+    b.write('stderr', 'E')
+    b.write('stdout', 'd')
+    assert sent == []
+    timers.advance(0.05)
+    assert sent == [('stdout', 'abc'), ('stderr', 'E'), ('stdout', 'd')]
+
+
+def test_size_threshold_flushes_early():
+    b,timers,sent = _batcher(max_bytes=4)
+    b.write('stdout', 'ab')
+    b.write('stdout', 'cd')
+    assert sent == [('stdout', 'abcd')]
+
+
+def test_rate_limit_holds_then_drops_with_notice():
+    b,timers,sent = _batcher(max_bytes=4, max_rate=2)
+    for o in ['aaaa', 'bbbb', 'cccc', 'dd', 'ee', 'ff']: b.write('stdout', o)
+    assert sent == [('stdout', 'aaaa'), ('stdout', 'bbbb')]
+    timers.advance(0.5)
+    assert len(sent) == 2
+    timers.advance(0.5)
+    assert sent[2] == ('stdout', 'cccc')
+    assert sent[3][0] == 'stderr' and '6 characters dropped' in sent[3][1]
+    b.write('stdout', 'g')
+    b.flush()
+    assert sent[-1] == ('stdout', 'g') and b.messages == 5
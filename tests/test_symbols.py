@@ -0,0 +1,60 @@
+from mojokernel.symbols import SymbolIndex, cell_symbols, declarations
+
+
+def test_declarations():
+    code = '''from math import sqrt, pi as PI
+@always_inline
+fn add[T: AnyType](a: Int, b: Int) -> Int:
+    return a + b
+
+struct Point:
+    var x: Int
+    var y: Int
+    fn __init__(out self, x: Int, y: Int):
+        self.x = x
+        self.y = y
+    fn norm(self) -> Float64:
+        var local = 1
+        return sqrt(Float64(self.x * self.x + self.y * self.y))
+
+var p = Point(1, 2)
+var q: Point = make()
+alias N = 10
+print(p.x)'''
+    ds = {name: (entry, t) for name,entry,t in declarations(code)}
+    assert list(ds) == ['sqrt', 'PI', 'add', 'Point', 'p', 'q', 'N']
+    assert ds['add'][0] == dict(type='function', signature='add(a: Int, b: Int)')
+    members = ds['Point'][0]['members']
+    assert list(members) == ['x', 'y', '__init__', 'norm']
+    assert members['x'] == dict(type='instance', signature='x: Int')
+    assert members['__init__']['signature'] == '__init__(x: Int, y: Int)' and members['norm']['signature'] == 'norm()'
+    assert ds['p'][1] == ds['q'][1] == 'Point' and ds['sqrt'][0]['type'] == 'module'
+
+
+def test_symbol_index_prefix_queries_and_members():
+    ix = SymbolIndex({'print': 'print(value: Any)'})
+    for i in range(500): ix.add(f'fn f{i}(x: Int) -> Int:\n    return x\nvar v{i} = {i}')
+    ix.add('struct Point:\n    var x: Int\n    fn norm(self) -> Float64: return 0\nvar pt = Point(1)')
+    ix.add('fn f1(y: Float64): pass')
+    assert ix.prefixed('f49') == ['f49', 'f490', 'f491', 'f492', 'f493', 'f494', 'f495', 'f496', 'f497', 'f498', 'f499']
+    assert ix.prefixed('pr') == ['print'] and ix.prefixed('zz') == []
+    assert ix.get('f1')['signature'] == 'f1(y: Float64)' and ix.names.count('f1') == 1
+    assert ix.names == sorted(ix.symbols)
+    assert list(ix.members('pt')) == list(ix.members('Point')) == ['x', 'norm']
+    cell = cell_symbols('var other = Point(2)\nfn g():\n    var inner = 3')
+    assert list(ix.members('other', cell)) == ['x', 'norm'] and cell.prefixed('in') == ['inner']
+    ix.clear()
+    assert ix.names == ['print'] and not ix.var_types
+
+
+def test_symbol_index_match_ranks_from_sorted_lists():
+    ix = SymbolIndex(dict(print='print(*values)'))
+    ix.add('fn parse_int(s: String) -> Int: pass\nvar Path = 1\nvar tmp = 2')
+    assert ix.match('p') == ['parse_int', 'print', 'Path'] and ix.match('pi') == ['parse_int', 'print']
+    assert ix.match('pn') == ['parse_int', 'print'] and ix.match('PA') == ['parse_int', 'Path'] and ix.match('') == ix.names
+    ix.add('fn pin(): pass\nfn getPrice(): pass')
+    assert ix._lower == sorted(ix._lower) and ix._initials == sorted(ix._initials)
+    assert ix.match('pi') == ['pin', 'parse_int', 'print'] and ix.match('gp') == ['getPrice']
+    assert ix.match('p', limit=2) == ['parse_int', 'pin'] and ix.match('tp') == ['tmp'] and ix.match('mp') == []
+    ix.clear()
+    assert ix.match('p') == ['print'] and len(ix._lower) == len(ix._initials) == 1
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""Wall clock for running a synthetic many-cell notebook: one kernel execute_request per cell,
+one ServerEngine.execute per cell, and a single ServerEngine.execute_many batch.
+Usage: tools/bench_batch.py [--cells 200] [--no-kernel]
+"""
+import argparse,json,sys,time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from mojokernel.engines.server_engine import ServerEngine
+
+def _cells(n): return [f'var x{i} = {i}\nprint(x{i} * 2)' if i % 2 else f'fn f{i}(a: Int) -> Int:\n    return a + {i}' for i in range(n)]
+
+def _timed(f):
+    t0 = time.perf_counter()
+    f()
+    return round(time.perf_counter() - t0, 3)
+
+def _engine(cells, batch):
+    e = ServerEngine()
+    e.start()
+    try:
+        if batch: return _timed(lambda: e.execute_many(cells))
+        return _timed(lambda: [e.execute(c) for c in cells])
+    finally: e.shutdown()
+
+def _kernel(cells):
+    import jupyter_client
+    km,kc = jupyter_client.manager.start_new_kernel(kernel_name='mojo')
+    try: return _timed(lambda: [kc.execute_interactive(c, timeout=60, output_hook=lambda msg: None) for c in cells])
+    finally:
+        kc.stop_channels()
+        km.shutdown_kernel(now=True)
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--cells', type=int, default=200, help='Number of cells in the synthetic notebook')
+    p.add_argument('--no-kernel', action='store_true', help='Skip the Jupyter kernel round-trip baseline')
+    args = p.parse_args()
+    cells = _cells(args.cells)
+    res = dict(cells=args.cells)
+    if not args.no_kernel: res['kernel_per_cell_s'] = _kernel(cells)
+    res['engine_per_cell_s'] = _engine(cells, batch=False)
+    res['engine_batch_s'] = _engine(cells, batch=True)
+    base = res.get('kernel_per_cell_s', res['engine_per_cell_s'])
+    res['speedup'] = round(base / res['engine_batch_s'], 2)
+    print(json.dumps(res, indent=2))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""Throughput of %push and %pull through the C++ server: an N MiB float64 array pushed into the session,
+then pulled back, against printing it from a Mojo cell. Needs numpy and a built server.
+Usage: tools/bench_buffers.py [--mb 1 100 500] [--print-mb 1]
+"""
+import argparse,json,sys,time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import numpy as np
+from mojokernel.buffers import pull, push
+from mojokernel.engines.server_engine import ServerEngine
+
+def _timed(f):
+    t0 = time.perf_counter()
+    res = f()
+    return round(time.perf_counter() - t0, 3),res
+
+def _run(e, mb, print_mb):
+    a = np.random.rand(mb * 2**20 // 8)
+    res = {}
+    res['push_s'],code = _timed(lambda: push(e, 'xs', a))
+    res['bind_s'],r = _timed(lambda: e.execute(code))
+    if not r.success: raise RuntimeError(r.evalue)
+    res['pull_s'],got = _timed(lambda: pull(e, 'xs'))
+    assert np.array_equal(got.array, a)
+    got.close()
+    if mb <= print_mb: res['print_s'],_ = _timed(lambda: e.execute('for i in range(len(xs)):\n    print(xs[i])'))
+    return res
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--mb', type=int, nargs='+', default=[1, 100, 500], help='Array sizes in MiB')
+    p.add_argument('--print-mb', type=int, default=1, help='Largest size to also print from Mojo')
+    args = p.parse_args()
+    e = ServerEngine()
+    e.output_limit = 0
+    e.start()
+    try: print(json.dumps({f'{mb}MiB': _run(e, mb, args.print_mb) for mb in args.mb}, indent=2))
+    finally: e.shutdown()
+
+if __name__ == '__main__': main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""Per-cell latency of trivial cells on the pexpect engine, with sentinel end-of-output detection
+and with the legacy prompt + 0.3s quiet-period detection.
+Usage: tools/bench_pexpect.py [--cells 20]
+"""
+import argparse,json,sys,time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from mojokernel.bench import percentiles
+from mojokernel.engines.pexpect_engine import PexpectEngine
+
+def _cells(n): return [f'var x{i} = {i}' if i % 2 else f'print({i})' for i in range(n)]
+
+def _run(sentinel, cells):
+    e = PexpectEngine(sentinel=sentinel)
+    e.start()
+    try:
+        e.execute('print(0)')
+        times = []
+        for c in cells:
+            t0 = time.perf_counter()
+            r = e.execute(c)
+            times.append(round(1000 * (time.perf_counter() - t0), 1))
+            if not r.success: raise RuntimeError(f'{c!r} failed: {r.evalue}')
+        return percentiles(times)
+    finally: e.shutdown()
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--cells', type=int, default=20, help='Trivial cells per mode')
+    args = p.parse_args()
+    cells = _cells(args.cells)
+    print(json.dumps(dict(legacy_ms=_run(False, cells), sentinel_ms=_run(True, cells)), indent=2))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Compare JSON-line vs framed server protocol throughput on large cell outputs.
+Default mode measures the Python decode side on synthetic responses (no Mojo needed).
+With --server, runs a printing cell end to end through mojo-repl-server in each mode.
+Usage: tools/bench_protocol.py [--mb 1 16 64] [--server]
+"""
+import argparse,io,json,os,sys,time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from mojokernel.engines.server_engine import ServerEngine, _encode_frame, _read_frame
+
+def _payload(mb):
+    line = 'step 12345: loss=0.123456 acc=0.98765 "quoted" \\ tab\there\r\n'
+    return line * (mb * 2**20 // len(line))
+
+def _codec(mb, reps=3):
+    out = _payload(mb)
+    resp = dict(id=1, status='ok', stdout=out, stderr='', value='')
+    line,frame = (json.dumps(resp) + '\n').encode(),_encode_frame(resp)
+    res = {}
+    for name,data,decode in [('json', line, lambda b: json.loads(io.BytesIO(b).readline())), ('framed', frame, lambda b: _read_frame(io.BytesIO(b)))]:
+        t = min(_timed(lambda: decode(data)) for _ in range(reps))
+        res[name] = dict(bytes=len(data), seconds=round(t, 4), mb_per_s=round(len(out) / 2**20 / t, 1))
+    return res
+
+def _timed(f):
+    t0 = time.perf_counter()
+    f()
+    return time.perf_counter() - t0
+
+def _server(mb):
+    n = mb * 2**20 // 64
+    code = f'for i in range({n}):\n    print("{"x" * 56}", i % 10)'
+    res = {}
+    for proto in ('json', 'framed'):
+        os.environ['MOJO_SERVER_PROTOCOL'] = proto
+        e = ServerEngine()
+        e.start()
+        try:
+            e.execute('print(1)')
+            t = _timed(lambda: e.execute(code))
+            res[proto] = dict(protocol=e.protocol, seconds=round(t, 3), mb_per_s=round(mb / t, 1))
+        finally: e.shutdown()
+    return res
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--mb', type=int, nargs='+', default=[1, 16, 64], help='Output sizes in MiB')
+    p.add_argument('--server', action='store_true', help='Run end to end through mojo-repl-server')
+    args = p.parse_args()
+    fn = _server if args.server else _codec
+    print(json.dumps({f'{mb}MiB': fn(mb) for mb in args.mb}, indent=2))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Cost of scanning large chunked REPL output: the incremental _OutputScanner vs the old
+strip-and-search of the whole buffer after every chunk (quadratic, so only run up to --legacy-mb).
+With --server, prints a large cell end to end through the pexpect engine and the PTY server.
+Usage: tools/bench_scanner.py [--mb 1 10 64] [--chunk 4096] [--legacy-mb 2] [--server]
+"""
+import argparse,json,sys,time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from mojokernel.engines.pexpect_engine import _OutputScanner, _PROMPT_PAT, _strip_ansi
+
+def _raw(mb):
+    line = '\x1b[0mstep 12345: loss=0.123456 acc=0.98765\r\n'
+    return '  1> train()\r\n' + line * (mb * 2**20 // len(line)) + '  2> '
+
+def _timed(f):
+    t0 = time.perf_counter()
+    f()
+    return round(time.perf_counter() - t0, 3)
+
+def _legacy(chunks):
+    buf = ''
+    for c in chunks:
+        buf += c
+        _PROMPT_PAT.search(_strip_ansi(buf))
+
+def _scanner(chunks):
+    sc = _OutputScanner()
+    for c in chunks: sc.feed(c)
+    return sc.result()
+
+def _local(mb, chunk, legacy_mb):
+    raw = _raw(mb)
+    chunks = [raw[i:i+chunk] for i in range(0, len(raw), chunk)]
+    res = dict(chunks=len(chunks), scanner_s=_timed(lambda: _scanner(chunks)))
+    if mb <= legacy_mb: res['legacy_s'] = _timed(lambda: _legacy(chunks))
+    return res
+
+def _server(mb):
+    from mojokernel.engines.pexpect_engine import PexpectEngine
+    from mojokernel.engines.server_engine import ServerEngine, _find_modular_root, _server_env
+    from mojokernel.bench import _find_pty_binary
+    code = f'for i in range({mb * 2**20 // 40}):\n    print("step", i, ": loss=0.123456 acc=0.98765")'
+    res = {}
+    e = PexpectEngine()
+    e.start()
+    try: res['pexpect_s'] = _timed(lambda: e.execute(code, on_output=lambda name, text: None))
+    finally: e.shutdown()
+    if pty := _find_pty_binary():
+        root = _find_modular_root()
+        e = ServerEngine()
+        e._launch([pty, root], _server_env(root))
+        try: res['pty_server_s'] = _timed(lambda: e.execute(code))
+        finally: e.shutdown()
+    return res
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--mb', type=int, nargs='+', default=[1, 10, 64], help='Output sizes in MiB')
+    p.add_argument('--chunk', type=int, default=4096, help='Chunk size in characters (PTY reads are typically 4KiB)')
+    p.add_argument('--legacy-mb', type=int, default=2, help='Largest size to run the quadratic legacy scan on')
+    p.add_argument('--server', action='store_true', help='Run end to end through the pexpect engine and PTY server')
+    args = p.parse_args()
+    fn = _server if args.server else lambda mb: _local(mb, args.chunk, args.legacy_mb)
+    print(json.dumps({f'{mb}MiB': fn(mb) for mb in args.mb}, indent=2))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""iopub cost of a cell that prints N lines: one stream message per chunk vs the kernel's StreamBatcher.
+Chunks arrive from a worker thread through Engine.execute_async, as with a streaming engine, and each
+message is serialized and signed by a jupyter_client Session onto a ZMQ PUB socket (nobody subscribes,
+so this measures the kernel side). With --server, the cell runs on the Mojo server engine instead.
+Usage: tools/bench_streams.py [--lines 1000000] [--chunk-lines 1] [--server]
+"""
+import argparse,asyncio,json,sys,time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import zmq
+from jupyter_client.session import Session
+from mojokernel.engines.base import Engine, ExecutionResult
+from mojokernel.streams import StreamBatcher
+
+class _PrintEngine(Engine):
+    "Streams `lines` lines of output, `chunk_lines` per chunk, like a tight print loop."
+    def __init__(self, lines, chunk_lines): self.lines,self.chunk_lines = lines,chunk_lines
+    def execute(self, code, on_output=None):
+        for i in range(0, self.lines, self.chunk_lines):
+            on_output('stdout', ''.join(f'step {j}: loss=0.123456\n' for j in range(i, min(i + self.chunk_lines, self.lines))))
+        return ExecutionResult()
+
+def _publisher():
+    sock = zmq.Context.instance().socket(zmq.PUB)
+    sock.bind('tcp://127.0.0.1:*')
+    session = Session(key=b'bench')
+    res = dict(messages=0)
+    def send(name, text):
+        session.send(sock, 'stream', dict(name=name, text=text))
+        res['messages'] += 1
+    return send,res
+
+async def _run(engine, code, batched):
+    send,res = _publisher()
+    t0 = time.perf_counter()
+    batcher = StreamBatcher(send) if batched else None
+    await engine.execute_async(code, on_output=batcher.write if batcher else send)
+    if batcher: batcher.flush()
+    res['seconds'] = round(time.perf_counter() - t0, 3)
+    return res
+
+def _engine(args):
+    if not args.server: return _PrintEngine(args.lines, args.chunk_lines),''
+    from mojokernel.engines.server_engine import ServerEngine
+    e = ServerEngine()
+    e.output_limit = 0
+    e.start()
+    return e,f'for i in range({args.lines}):\n    print("step", i, ": loss=0.123456")'
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--lines', type=int, default=1_000_000, help='Lines the cell prints')
+    p.add_argument('--chunk-lines', type=int, default=1, help='Lines per output chunk (simulated engine only)')
+    p.add_argument('--server', action='store_true', help='Print from a real Mojo cell on the server engine')
+    args = p.parse_args()
+    engine,code = _engine(args)
+    try: res = {mode: asyncio.run(_run(engine, code, mode == 'batched')) for mode in ('unbatched', 'batched')}
+    finally: engine.shutdown() if args.server else None
+    print(json.dumps(res, indent=2))
+
+if __name__ == '__main__': main()
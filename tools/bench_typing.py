@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""Measure mojo-lsp-server CPU time while completion requests are sent as fast as a user types.
+Runs the same keystrokes with LSP request debouncing on (the default) and off (MOJO_KERNEL_LSP_DEBOUNCE=0).
+Usage: tools/bench_typing.py [--cps 15] [--rounds 3]
+"""
+import argparse,json,os,subprocess,sys,time
+import jupyter_client
+
+PREAMBLE = 'fn scale(xs: List[Float64], k: Float64) -> List[Float64]:\n    var out = List[Float64]()\n    for x in xs: out.append(x * k)\n    return out^\n'
+TYPED = 'var values = scale([1.0, 2.0, 3.0], 2.0)\nvalues.append(4.0)\nprint(len(values))'
+
+def _cpu_s(pid):
+    "User+system CPU seconds of `pid`."
+    out = subprocess.check_output(['ps', '-o', 'time=', '-p', str(pid)], text=True).strip()
+    days,_,hms = out.rpartition('-')
+    secs = sum(float(v) * 60**i for i,v in enumerate(reversed(hms.split(':'))))
+    return secs + 86400 * int(days or 0)
+
+def _lsp_pid(kernel_pid, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        out = subprocess.run(['pgrep', '-P', str(kernel_pid), '-f', 'mojo-lsp-server'], capture_output=True, text=True).stdout.split()
+        if out: return int(out[0])
+        time.sleep(0.2)
+    raise RuntimeError('mojo-lsp-server did not start')
+
+def _run(cps, debounce):
+    km = jupyter_client.KernelManager(kernel_name='mojo')
+    km.start_kernel(env=dict(os.environ, MOJO_KERNEL_LSP_DEBOUNCE=str(debounce)))
+    kc = km.client()
+    kc.start_channels()
+    try:
+        kc.wait_for_ready(timeout=60)
+        kc.execute_interactive(PREAMBLE, timeout=60)
+        pid = _lsp_pid(km.provisioner.process.pid)
+        kc.complete('sc', 2)
+        kc.get_shell_msg(timeout=30)  # LSP warm
+        cpu0,t0 = _cpu_s(pid),time.perf_counter()
+        ids = []
+        for i in range(1, len(TYPED) + 1):
+            ids.append(kc.complete(TYPED[:i], i))
+            time.sleep(1 / cps)
+        pending = set(ids)
+        while pending: pending.discard(kc.get_shell_msg(timeout=60)['parent_header'].get('msg_id'))
+        time.sleep(0.5)  # let cancelled work wind down before reading CPU
+        return dict(requests=len(ids), wall_s=round(time.perf_counter() - t0, 2), lsp_cpu_s=round(_cpu_s(pid) - cpu0, 2))
+    finally:
+        kc.stop_channels()
+        km.shutdown_kernel(now=True)
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--cps', type=float, default=15, help='Keystrokes per second')
+    p.add_argument('--rounds', type=int, default=3, help='Runs per mode')
+    args = p.parse_args()
+    report = {}
+    for name,debounce in (('debounced', 0.02), ('every_keystroke', 0)):
+        runs = [_run(args.cps, debounce) for _ in range(args.rounds)]
+        report[name] = {k: round(sum(r[k] for r in runs) / len(runs), 2) for k in runs[0]}
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Compare ServerEngine cold start against starting through a zygote.
+Reports startup time (spawn to ready), the server's own startup phases, and per-kernel memory (RSS, plus PSS on Linux,
+which splits shared pages between processes).
+Usage: tools/bench_zygote.py [-n 5] [--kernels 4]
+"""
+import argparse,json,os,statistics,subprocess,sys,tempfile,time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from mojokernel.engines.server_engine import ServerEngine, _find_modular_root, _find_server_binary, _server_env
+
+def _mem_kb(pid):
+    p = Path(f'/proc/{pid}/smaps_rollup')
+    if p.exists():
+        vals = dict(l.split(':', 1) for l in p.read_text().splitlines()[1:] if ':' in l)
+        return dict(rss_kb=int(vals['Rss'].split()[0]), pss_kb=int(vals['Pss'].split()[0]))
+    out = subprocess.check_output(['ps', '-o', 'rss=', '-p', str(pid)], text=True)
+    return dict(rss_kb=int(out.strip()))
+
+def _run(n, kernels):
+    "Start `kernels` engines at once, `n` times; return startup seconds, server startup phases and per-engine memory."
+    times,phases,mems = [],[],[]
+    for _ in range(n):
+        engines = []
+        try:
+            for _ in range(kernels):
+                e = ServerEngine()
+                t0 = time.perf_counter()
+                e.start()
+                times.append(time.perf_counter() - t0)
+                phases.append(e.startup)
+                engines.append(e)
+            assert engines[0].execute('print(1)').success
+            mems += [_mem_kb(e.proc.pid) for e in engines]
+        finally:
+            for e in engines: e.shutdown()
+    return times,phases,mems
+
+def _summary(times, phases, mems):
+    res = dict(startup_s=dict(mean=round(statistics.mean(times), 3), min=round(min(times), 3), max=round(max(times), 3)))
+    res['server_phases_ms'] = {k: round(statistics.mean(o.get(k, 0) for o in phases), 1) for k in phases[0]}
+    for k in mems[0]: res[f'mean_{k}'] = round(statistics.mean(o[k] for o in mems))
+    return res
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('-n', type=int, default=5, help='Rounds per mode')
+    p.add_argument('--kernels', type=int, default=4, help='Concurrent engines per round (memory sharing shows up in PSS)')
+    args = p.parse_args()
+
+    os.environ['MOJO_REPL_ZYGOTE'] = 'off'
+    report = dict(cold=_summary(*_run(args.n, args.kernels)))
+
+    sock = os.path.join(tempfile.mkdtemp(prefix='mojokernel-bench-'), 'zygote.sock')
+    root = _find_modular_root()
+    server_bin = _find_server_binary()
+    zygote = subprocess.Popen([server_bin, '--zygote', sock, root], env=_server_env(root), stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 30
+        while not os.path.exists(sock) and time.time() < deadline: time.sleep(0.05)
+        os.environ['MOJO_REPL_ZYGOTE'] = sock
+        report['zygote'] = _summary(*_run(args.n, args.kernels))
+        report['zygote']['zygote_mem'] = _mem_kb(zygote.pid)
+    finally: zygote.kill()
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__': main()
@@ -32,6 +32,7 @@ else
         exit 1
     fi
     LLDB_LIB=$(basename "${libs[0]}" | sed 's/^lib//;s/\.so$//')
+    SHM_LD="-lrt"  # shm_open, for glibc < 2.34
 fi
 
 echo "MODULAR_ROOT=$MODULAR_ROOT"
@@ -41,7 +42,7 @@ mkdir -p build
 CFLAGS="-std=c++17 -I$LLVM_INCLUDE"
 BASE_LD="-L$MODULAR_ROOT/lib -l$LLDB_LIB"
 
-c++ $CFLAGS server/repl_server.cpp $BASE_LD -L$LLVM_LIB -lLLVMSupport -lLLVMDemangle -o build/mojo-repl-server
+c++ $CFLAGS server/repl_server.cpp $BASE_LD -L$LLVM_LIB -lLLVMSupport -lLLVMDemangle ${SHM_LD:-} -o build/mojo-repl-server
 echo "Built build/mojo-repl-server"
 
 mkdir -p mojokernel/bin